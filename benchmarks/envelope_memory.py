@@ -0,0 +1,65 @@
+# benchmarks/envelope_memory.py
+"""Память на одно сообщение в очереди: telethon Message против MessageEnvelope.
+
+Сообщения собираются теми же TL-объектами, что и в fake_telegram (без сущностей чата и отправителя, которые
+у настоящих сообщений из iter_messages еще и держатся через _client/_chat), поэтому выигрыш здесь занижен.
+
+Запуск из корня репозитория: python -m benchmarks.envelope_memory --count 10000
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from src.fake_telegram import build_message
+from src.message_envelope import MessageEnvelope
+
+CHAT_ID = -1001000000000
+
+SHAPES = {
+    'text': lambda i: {'id': i, 'date': 1700000000 + i, 'len': random.randint(20, 400),
+                       'entities': [('MessageEntityBold', 0, 5), ('MessageEntityTextUrl', 6, 10)]},
+    'photo': lambda i: {'id': i, 'date': 1700000000 + i, 'len': 80, 'kind': 'photo', 'size': 200 * 1024},
+    'video': lambda i: {'id': i, 'date': 1700000000 + i, 'len': 120, 'kind': 'document', 'mime': 'video/mp4',
+                        'size': 50 * 1024 * 1024, 'grouped_id': 1000 + i // 10, 'reply': (i - 1, None, False),
+                        'attrs': {'file_name': f"video_{i}.mp4", 'video': (120, 1280, 720)}},
+    'document': lambda i: {'id': i, 'date': 1700000000 + i, 'len': 0, 'kind': 'document', 'mime': 'application/pdf',
+                           'size': 3 * 1024 * 1024, 'attrs': {'file_name': f"report_{i}.pdf"}},
+}
+
+
+def _traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def measure(kind, count):
+    """(байт на raw Message, байт на envelope, который остается после освобождения Message)."""
+    tracemalloc.start()
+    try:
+        baseline = _traced()
+        raw = [build_message(SHAPES[kind](i), CHAT_ID) for i in range(1, count + 1)]
+        raw_bytes = _traced() - baseline
+
+        envelopes = [MessageEnvelope.from_message(message) for message in raw]
+        del raw
+        envelope_bytes = _traced() - baseline
+        del envelopes
+    finally:
+        tracemalloc.stop()
+    return raw_bytes / count, envelope_bytes / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-queued-message memory of telethon Message vs MessageEnvelope")
+    parser.add_argument("--count", type=int, default=10000, help="Messages per kind")
+    args = parser.parse_args()
+
+    print(f"{'kind':<10} {'Message B':>10} {'envelope B':>11} {'saved':>7}")
+    for kind in SHAPES:
+        raw, envelope = measure(kind, args.count)
+        print(f"{kind:<10} {raw:>10.0f} {envelope:>11.0f} {1 - envelope / raw:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# benchmarks/microbench.py
+"""Микробенчмарки CPU-горячих путей обработки сообщения (без сетевого I/O).
+
+Покрывает _adjust_entities, _process_links, цепочку supports() хендлеров, _get_target_reply_to_msg_id
+(кеш, база, топик, промах) и форматирование даты с логированием. Для каждого бенчмарка считаются ops/sec,
+пик выделенной памяти на операцию и память, оставшаяся после операций (tracemalloc).
+
+Запуск из корня репозитория:
+    python -m benchmarks.microbench run [--only reply] [--save]
+    python -m benchmarks.microbench compare [--threshold 0.15]
+
+--save записывает результаты в benchmarks/baselines.json; compare прогоняет бенчмарки заново и завершается
+с кодом 1, если ops/sec упал или пик памяти вырос больше порога относительно сохраненного baseline.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon.tl.types import MessageEntityBold, MessageEntityItalic, MessageEntityTextUrl, MessageEntityUrl
+
+from src.database import Database
+from src.repository import Repository
+from src.message_processor import MessageProcessor
+from src.message_envelope import MessageEnvelope
+from src.fake_telegram import build_message
+from src.handlers.photo_handler import PhotoHandler
+from src.handlers.video_handler import VideoHandler
+from src.handlers.audio_handler import AudioHandler
+from src.handlers.webpage_handler import WebPageHandler
+from src.handlers.mixed_media_handler import MixedMediaHandler
+from src.handlers.file_handler import FileHandler
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+# Тот же порядок, что в main.py
+HANDLERS = [PhotoHandler, VideoHandler, AudioHandler, MixedMediaHandler, FileHandler, WebPageHandler]
+
+SOURCE_CHAT_ID = -1001000000001
+TARGET_CHAT_ID = -1002000000001
+REPLY_MAP_SIZE = 50000
+TOPICS = 200
+TEXT_LENGTH = 4000
+ENTITIES = 200
+CAPTION_LIMIT = 1024
+ALLOC_OPS = 100
+
+
+class Fixture:
+    """Общие входные данные: процессор на временной базе с большой картой ответов, тексты, сообщения и альбомы."""
+
+    def __init__(self, temp_dir):
+        random.seed(1)
+        db_path = os.path.join(temp_dir, 'microbench.db')
+        Database(db_path)
+        self._fill_db(db_path)
+        repository = Repository(db_path)
+        client = SimpleNamespace(bots=None, accounts=None, bandwidth=None)
+        self.processor = MessageProcessor(client, SOURCE_CHAT_ID, TARGET_CHAT_ID, repository, temp_dir, HANDLERS,
+                                          CAPTION_LIMIT)
+        self.reply_map = {msg_id: msg_id + 10 ** 6 for msg_id in range(1, REPLY_MAP_SIZE + 1)}
+        self.reset_cache()
+
+        self.text = ''.join(random.choice('abcdefghijklmnopqrstuvwxyz     ') for _ in range(TEXT_LENGTH))
+        self.link_text = (f"{self.text[:600]} https://t.me/c/{SOURCE_CHAT_ID}/message{REPLY_MAP_SIZE // 2} "
+                          f"{self.text[600:1200]}")
+        self.plain_text = self.text[:1200]
+        self.entity_specs = [(i * (TEXT_LENGTH // ENTITIES), 12, i % 4) for i in range(ENTITIES)]
+
+        self.singles = [self._envelope(shape, i) for i, shape in enumerate(self._single_shapes(), 1)]
+        self.albums = [[self._envelope(dict(shape, grouped_id=album_id), album_id * 10 + i) for i in range(10)]
+                       for album_id, shape in enumerate(self._album_shapes(), 1)]
+        self.mixed_album = [self._envelope(shape, 900 + i, grouped_id=99)
+                            for i, shape in enumerate((self._album_shapes() * 5)[:10])]
+        self.dates = [datetime.fromtimestamp(1700000000 + i * 37, timezone.utc) for i in range(1000)]
+
+    @staticmethod
+    def _fill_db(db_path):
+        with sqlite3.connect(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT INTO messages (source_msg_id, source_chat_id, target_chat_id, target_msg_id, topic_id, synced) "
+                "VALUES (?, ?, ?, ?, ?, 1)",
+                [(msg_id, SOURCE_CHAT_ID, TARGET_CHAT_ID, msg_id + 10 ** 6, 0) for msg_id in range(1, REPLY_MAP_SIZE + 1)])
+            cursor.executemany(
+                "INSERT INTO topics (source_topic_id, source_chat_id, target_chat_id, target_topic_id, title, synced) "
+                "VALUES (?, ?, ?, ?, ?, 1)",
+                [(10 ** 7 + i, SOURCE_CHAT_ID, TARGET_CHAT_ID, 2 * 10 ** 7 + i, f"Topic {i}") for i in range(TOPICS)])
+            conn.commit()
+
+    @staticmethod
+    def _single_shapes():
+        return [
+            {'kind': 'photo', 'size': 200 * 1024},
+            {'kind': 'document', 'mime': 'video/mp4', 'size': 50 * 1024 * 1024,
+             'attrs': {'file_name': 'clip.mp4', 'video': (120, 1280, 720)}},
+            {'kind': 'document', 'mime': 'audio/ogg', 'size': 300 * 1024, 'attrs': {'audio': 30, 'voice': True}},
+            {'kind': 'document', 'mime': 'application/pdf', 'size': 3 * 1024 * 1024, 'attrs': {'file_name': 'a.pdf'}},
+            {'kind': 'webpage'},
+        ]
+
+    @staticmethod
+    def _album_shapes():
+        return [
+            {'kind': 'photo', 'size': 200 * 1024},
+            {'kind': 'document', 'mime': 'video/mp4', 'size': 20 * 1024 * 1024,
+             'attrs': {'file_name': 'clip.mp4', 'video': (60, 1280, 720)}},
+            {'kind': 'document', 'mime': 'application/pdf', 'size': 1024 * 1024, 'attrs': {'file_name': 'a.pdf'}},
+        ]
+
+    def _envelope(self, shape, msg_id, grouped_id=None):
+        shape = dict(shape, id=msg_id, date=1700000000 + msg_id, len=200)
+        if grouped_id is not None:
+            shape['grouped_id'] = grouped_id
+        return MessageEnvelope.from_message(build_message(shape, SOURCE_CHAT_ID))
+
+    def entities(self):
+        types = [MessageEntityBold, MessageEntityItalic, MessageEntityUrl, MessageEntityTextUrl]
+        result = []
+        for offset, length, kind in self.entity_specs:
+            if types[kind] is MessageEntityTextUrl:
+                result.append(MessageEntityTextUrl(offset=offset, length=length, url='https://example.com'))
+            else:
+                result.append(types[kind](offset=offset, length=length))
+        return result
+
+    def reset_cache(self):
+        self.processor.message_map = {SOURCE_CHAT_ID: {TARGET_CHAT_ID: dict(self.reply_map)}}
+
+
+def _handle_chain(handlers, message_or_group):
+    # Как _handle_media/_process_group_messages: первый хендлер, поддержавший сообщение
+    for handler in handlers:
+        if handler.supports(message_or_group):
+            return handler
+    return None
+
+
+def build_benchmarks(fixture):
+    """name -> callable без аргументов, выполняющий одну операцию."""
+    processor = fixture.processor
+    handlers = processor.handlers
+    logger = logging.getLogger('src.message_processor')
+    base = handlers[0]
+    ids = list(range(1, REPLY_MAP_SIZE + 1))
+    state = {'i': 0}
+
+    def next_id():
+        state['i'] = (state['i'] + 7919) % REPLY_MAP_SIZE
+        return ids[state['i']]
+
+    def adjust_entities():
+        # Новые entities на каждую операцию: _adjust_entities обрезает их на месте
+        entities = fixture.entities()
+        return base._adjust_entities(fixture.text, fixture.text[:CAPTION_LIMIT], entities)
+
+    def reply_repository_hit():
+        msg_id = next_id()
+        processor.message_map[SOURCE_CHAT_ID][TARGET_CHAT_ID].pop(msg_id, None)
+        return processor._get_target_reply_to_msg_id(msg_id, 0)
+
+    def reply_topic():
+        topic_id = 10 ** 7 + state['i'] % TOPICS
+        state['i'] += 1
+        return processor._get_target_reply_to_msg_id(REPLY_MAP_SIZE + 1 + state['i'] % 1000, topic_id)
+
+    def date_logging():
+        message = fixture.singles[state['i'] % len(fixture.singles)]
+        state['i'] += 1
+        message_date = fixture.dates[state['i'] % len(fixture.dates)].strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"Processing message {message.id} from {message_date} with reply_to {0}")
+        logger.info(f"Processed message {message.id} from {message_date} to {message.id + 1} with reply_to {None}")
+
+    return {
+        'adjust_entities': adjust_entities,
+        'process_links.no_links': lambda: processor._process_links(fixture.plain_text),
+        'process_links.reply_map': lambda: processor._process_links(fixture.link_text),
+        'supports.singles': lambda: [_handle_chain(handlers, message) for message in fixture.singles],
+        'supports.albums': lambda: [_handle_chain(handlers, album) for album in fixture.albums],
+        'supports.mixed_album': lambda: _handle_chain(handlers, fixture.mixed_album),
+        'reply.cache_hit': lambda: processor._get_target_reply_to_msg_id(next_id(), 0),
+        'reply.repository_hit': reply_repository_hit,
+        'reply.topic': reply_topic,
+        'reply.miss': lambda: processor._get_target_reply_to_msg_id(REPLY_MAP_SIZE + 10 + state['i'] % 1000, 0),
+        'date_logging': date_logging,
+    }
+
+
+def _time(fn, duration):
+    """Лучший ops/sec из трех серий примерно по duration/3 секунд."""
+    best = 0.0
+    batch = 1
+    for _ in range(3):
+        ops = 0
+        started = time.perf_counter()
+        deadline = started + duration / 3
+        while True:
+            for _ in range(batch):
+                fn()
+            ops += batch
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now - started < 0.01:
+                batch *= 2
+        best = max(best, ops / (now - started))
+    return best
+
+
+def _allocations(fn, ops=ALLOC_OPS):
+    """(пик байт сверх начального уровня за операцию, байт, оставшихся после операции)."""
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for _ in range(ops):
+            fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start, (current - start) / ops
+
+
+def run(only=None, duration=1.0):
+    with tempfile.TemporaryDirectory(prefix='microbench_') as temp_dir:
+        fixture = Fixture(temp_dir)
+        benchmarks = build_benchmarks(fixture)
+        results = {}
+        for name, fn in benchmarks.items():
+            if only and only not in name:
+                continue
+            fn()
+            ops_per_sec = _time(fn, duration)
+            peak, retained = _allocations(fn)
+            results[name] = {'ops_per_sec': ops_per_sec, 'peak_bytes': peak, 'retained_bytes': retained}
+            fixture.reset_cache()
+            print(f"{name:<26} {ops_per_sec:>12,.0f} ops/s {peak / 1024:>9.1f} KB peak {retained:>9.1f} B/op retained")
+        fixture.processor.close()
+    return results
+
+
+def save(results):
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+    baselines.setdefault('benchmarks', {}).update(results)
+    baselines['machine'] = {'python': platform.python_version(), 'platform': platform.platform(),
+                            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+    with open(BASELINES_PATH, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+    print(f"Saved {len(results)} baselines to {BASELINES_PATH}")
+
+
+def compare(results, threshold):
+    if not os.path.exists(BASELINES_PATH):
+        print(f"No baselines at {BASELINES_PATH}, record them with: python -m benchmarks.microbench run --save")
+        return 1
+    with open(BASELINES_PATH) as f:
+        baselines = json.load(f).get('benchmarks', {})
+    regressions = 0
+    print(f"\n{'benchmark':<26} {'ops/s':>12} {'baseline':>12} {'change':>8} {'peak KB':>9} {'baseline':>9}")
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:<26} {result['ops_per_sec']:>12,.0f} {'-':>12} {'new':>8}")
+            continue
+        speed = result['ops_per_sec'] / baseline['ops_per_sec'] - 1
+        memory = (result['peak_bytes'] - baseline['peak_bytes']) / max(baseline['peak_bytes'], 1)
+        flags = []
+        if speed < -threshold:
+            flags.append('SLOWER')
+        if memory > threshold and result['peak_bytes'] - baseline['peak_bytes'] > 1024:
+            flags.append('MORE MEMORY')
+        regressions += bool(flags)
+        print(f"{name:<26} {result['ops_per_sec']:>12,.0f} {baseline['ops_per_sec']:>12,.0f} {speed:>+8.0%} "
+              f"{result['peak_bytes'] / 1024:>9.1f} {baseline['peak_bytes'] / 1024:>9.1f} {' '.join(flags)}")
+    print(f"\n{regressions} regressions beyond {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of per-message CPU hot paths")
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("--only", help="Run only benchmarks whose name contains this string")
+    parser.add_argument("--duration", type=float, default=1.0, help="Seconds of timing per benchmark")
+    parser.add_argument("--save", action="store_true", help="Store results as baselines (run)")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed relative regression (compare)")
+    args = parser.parse_args()
+
+    # Логи процессора идут в обработчик с форматированием, как в рабочем запуске, но без вывода
+    devnull = open(os.devnull, 'w')
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+
+    results = run(args.only, args.duration)
+    if args.command == "run":
+        if args.save:
+            save(results)
+        return 0
+    return compare(results, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
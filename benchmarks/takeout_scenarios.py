@@ -0,0 +1,96 @@
+# benchmarks/takeout_scenarios.py
+"""Сценарии takeout-выгрузки на фейковом клиенте со скриптованными ответами (FakeTelegram.takeout_script).
+
+granted       - takeout выдан: история читается через takeout-клиент, сессия закрывается с success=True.
+init-delay    - TakeoutInitDelayError при открытии: выгрузка идет обычным клиентом.
+invalidated   - TakeoutInvalidError посреди истории: AccountPool продолжает обычным клиентом с последнего id,
+                без пропусков и повторов.
+
+Запуск из корня репозитория: python -m benchmarks.takeout_scenarios [--messages 250]
+Завершается с кодом 1, если какой-то сценарий не сошелся.
+"""
+import argparse
+import asyncio
+import sys
+
+from telethon.errors import TakeoutInitDelayError
+
+from src.fake_telegram import FakeTelegram, FakeClientInterface, TakeoutScript, build_message
+from src.takeout_session import TakeoutSession
+
+CHAT_ID = -1001000000000
+
+
+async def _export(script, count):
+    """Читает всю историю внутри TakeoutSession; возвращает (ids, takeout открыт, читал ли takeout, аккаунт после)."""
+    world = FakeTelegram()
+    world.takeout_script = script
+    world.add_history(CHAT_ID, [build_message({'id': i, 'date': 1700000000 + i, 'len': 10}, CHAT_ID)
+                                for i in range(1, count + 1)])
+    client = FakeClientInterface(world)
+    account = client.accounts.primary
+    ids = []
+    async with TakeoutSession(client.accounts) as session:
+        active = session.active
+        through_takeout = account.reader is not account.client
+        async for message in client.accounts.iter_messages(CHAT_ID, reverse=True):
+            ids.append(message.id)
+    return ids, active, through_takeout, account.reader is account.client
+
+
+async def granted(count):
+    script = TakeoutScript()
+    ids, active, through_takeout, restored = await _export(script, count)
+    return {
+        'all messages in order': ids == list(range(1, count + 1)),
+        'takeout opened': active and through_takeout and script.opened == 1,
+        'read through takeout': script.served == count,
+        'finished with success': script.finished == [True],
+        'reader restored': restored,
+    }
+
+
+async def init_delay(count):
+    script = TakeoutScript(open_error=TakeoutInitDelayError(request=None, capture=3600))
+    ids, active, through_takeout, restored = await _export(script, count)
+    return {
+        'all messages in order': ids == list(range(1, count + 1)),
+        'fell back to regular client': not active and not through_takeout and script.opened == 0,
+        'nothing read through takeout': script.served == 0,
+        'reader restored': restored,
+    }
+
+
+async def invalidated(count):
+    cut = count // 2
+    script = TakeoutScript(invalid_after=cut)
+    ids, active, through_takeout, restored = await _export(script, count)
+    return {
+        'all messages in order': ids == list(range(1, count + 1)),
+        'no duplicates': len(ids) == len(set(ids)),
+        'takeout opened': active and through_takeout,
+        'invalidated mid-stream': script.served == cut,
+        'session still closed': len(script.finished) == 1,
+        'reader restored': restored,
+    }
+
+
+SCENARIOS = {'granted': granted, 'init-delay': init_delay, 'invalidated': invalidated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scripted takeout scenarios on the fake Telegram client")
+    parser.add_argument("--messages", type=int, default=250, help="History size of the source chat")
+    args = parser.parse_args()
+
+    failed = 0
+    for name, scenario in SCENARIOS.items():
+        checks = asyncio.run(scenario(args.messages))
+        for check, ok in checks.items():
+            print(f"{name:<12} {check:<32} {'ok' if ok else 'FAILED'}")
+            failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+
+from telethon import utils
+from telethon.errors import FloodWaitError, TakeoutInvalidError
+from telethon.tl.types import PeerChannel
+
+from .message_envelope import download_location
+
+
+class PooledAccount:
+    def __init__(self, index, client):
+        self.index = index
+        self.client = client
+        # Клиент для чтения истории и скачивания: обычный или takeout-обертка (см. TakeoutSession)
+        self.reader = client
+        self.active = 0
+        self.flood_until = 0
+        self.downloaded_bytes = 0
+        self.known_chats = set()
+
+    def is_available(self, now):
+        return self.flood_until <= now
+
+
+class AccountPool:
+    """Пул пользовательских аккаунтов для чтения истории и скачивания медиа из источников."""
+
+    def __init__(self, clients, max_attempts=5):
+        self.logger = logging.getLogger(__name__)
+        self.accounts = [PooledAccount(i, client) for i, client in enumerate(clients)]
+        self.max_attempts = max_attempts
+
+    @property
+    def primary(self):
+        return self.accounts[0]
+
+    @staticmethod
+    def _ids_are_global(chat_id):
+        # Id сообщений совпадают у всех аккаунтов только в каналах и супергруппах
+        try:
+            return utils.resolve_id(chat_id)[1] is PeerChannel
+        except Exception:
+            return False
+
+    def _pick(self, chat_id):
+        if len(self.accounts) == 1 or not self._ids_are_global(chat_id):
+            return self.primary
+        now = time.time()
+        candidates = [a for a in self.accounts if a.is_available(now)] or self.accounts
+        return min(candidates, key=lambda a: (a.flood_until, a.active, a.downloaded_bytes, a.index))
+
+    async def _wait_flood(self, account):
+        wait = account.flood_until - time.time()
+        if wait > 0:
+            self.logger.warning(f"All accounts are in flood wait, sleeping {wait:.0f}s on account #{account.index}")
+            await asyncio.sleep(wait)
+
+    def _drop_takeout(self, account):
+        # Takeout-сессия истекла или была отменена на сервере: дочитываем обычным клиентом
+        self.logger.warning(f"Takeout session of account #{account.index} is no longer valid, using the regular client")
+        account.reader = account.client
+
+    def _mark_flood(self, account, e, operation):
+        account.flood_until = time.time() + e.seconds
+        self.logger.warning(f"Account #{account.index} got flood wait {e.seconds}s on {operation}")
+
+    async def get_messages(self, chat_id, *args, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            account = self._pick(chat_id)
+            await self._wait_flood(account)
+            account.active += 1
+            try:
+                if account is not self.primary:
+                    await self._ensure_entity(account, chat_id)
+                return await account.reader.get_messages(chat_id, *args, **kwargs)
+            except FloodWaitError as e:
+                self._mark_flood(account, e, f"get_messages from {chat_id}")
+                if attempt == self.max_attempts:
+                    raise
+            except TakeoutInvalidError:
+                if account.reader is account.client:
+                    raise
+                self._drop_takeout(account)
+            finally:
+                account.active -= 1
+
+    async def iter_messages(self, chat_id, **kwargs):
+        """Итерирует историю, при FloodWait продолжает с последнего id на другом аккаунте."""
+        last_id = None
+        attempt = 0
+        while True:
+            account = self._pick(chat_id)
+            await self._wait_flood(account)
+            if last_id is not None:
+                kwargs.pop('offset_date', None)
+                kwargs.pop('min_id', None)
+                kwargs.pop('max_id', None)
+                kwargs['offset_id'] = last_id
+                if kwargs.get('limit') is not None:
+                    kwargs['limit'] -= yielded
+            yielded = 0
+            account.active += 1
+            try:
+                if account is not self.primary:
+                    await self._ensure_entity(account, chat_id)
+                async for message in account.reader.iter_messages(chat_id, **kwargs):
+                    last_id = message.id
+                    yielded += 1
+                    yield message
+                return
+            except FloodWaitError as e:
+                attempt += 1
+                self._mark_flood(account, e, f"iter_messages from {chat_id}")
+                if attempt >= self.max_attempts:
+                    raise
+            except TakeoutInvalidError:
+                if account.reader is account.client:
+                    raise
+                self._drop_takeout(account)
+            finally:
+                account.active -= 1
+
+    async def _ensure_entity(self, account, chat_id):
+        if chat_id in account.known_chats:
+            return
+        try:
+            await account.client.get_input_entity(chat_id)
+        except ValueError:
+            # Сессия дополнительного аккаунта еще не знает access_hash чата
+            self.logger.info(f"Account #{account.index} does not know chat {chat_id}, loading dialogs")
+            await account.client.get_dialogs()
+            await account.client.get_input_entity(chat_id)
+        account.known_chats.add(chat_id)
+
+    async def _resolve_media(self, account, message):
+        """Ссылка на скачивание медиа envelope-сообщения для этого аккаунта."""
+        if account is self.primary:
+            return message.media.location
+        await self._ensure_entity(account, message.chat_id)
+        # access_hash и file_reference принадлежат аккаунту, поэтому перечитываем сообщение этим аккаунтом
+        resolved = await account.reader.get_messages(message.chat_id, ids=message.id)
+        if resolved is None or resolved.media is None:
+            raise ValueError(f"Message {message.id} is not visible for account #{account.index}")
+        return download_location(resolved.media)
+
+    async def iter_download(self, message, offset=0, chunk_size=1024 * 1024):
+        """Скачивает медиа сообщения наименее загруженным аккаунтом, при FloodWait переключается на другой."""
+        attempt = 0
+        while True:
+            account = self._pick(message.chat_id)
+            await self._wait_flood(account)
+            account.active += 1
+            try:
+                input_file = await self._resolve_media(account, message)
+                self.logger.debug(f"Downloading media {message.id} from offset {offset} with account #{account.index}")
+                async for chunk in account.reader.iter_download(input_file, offset=offset, chunk_size=chunk_size):
+                    offset += len(chunk)
+                    account.downloaded_bytes += len(chunk)
+                    yield chunk
+                return
+            except FloodWaitError as e:
+                attempt += 1
+                self._mark_flood(account, e, f"download of media {message.id}")
+                if attempt >= self.max_attempts:
+                    raise
+            except TakeoutInvalidError:
+                if account.reader is account.client:
+                    raise
+                self._drop_takeout(account)
+            finally:
+                account.active -= 1
+
+    def stats(self):
+        now = time.time()
+        return {
+            account.index: {
+                'active': account.active,
+                'downloaded_bytes': account.downloaded_bytes,
+                'flood_wait': max(0, round(account.flood_until - now)),
+                'takeout': account.reader is not account.client,
+            } for account in self.accounts
+        }
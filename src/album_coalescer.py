@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+
+class AlbumCoalescer:
+    """Собирает сообщения альбома (по grouped_id) в течение короткого окна и отдает их одной группой."""
+
+    MAX_ALBUM_SIZE = 10
+
+    def __init__(self, window, on_flush):
+        self.logger = logging.getLogger(__name__)
+        self.window = window
+        self.on_flush = on_flush  # async callable(chat_id, messages)
+        self._pending = {}  # (chat_id, grouped_id) -> [messages]
+        self._timers = {}  # (chat_id, grouped_id) -> TimerHandle
+        self._tasks = set()  # сбросы по таймеру, которые еще идут; держим ссылки, чтобы задачи не собрал GC
+
+    def pending_count(self):
+        return sum(len(messages) for messages in self._pending.values())
+
+    async def add(self, chat_id, message):
+        key = (chat_id, message.grouped_id)
+        messages = self._pending.setdefault(key, [])
+        messages.append(message)
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        if len(messages) >= self.MAX_ALBUM_SIZE:
+            await self._flush(key)
+            return
+        loop = asyncio.get_running_loop()
+        self._timers[key] = loop.call_later(self.window, self._spawn_flush, key)
+
+    def _spawn_flush(self, key):
+        task = asyncio.create_task(self._flush(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            self.logger.error(f"Album flush failed: {task.exception()!r}")
+
+    async def flush_chat(self, chat_id):
+        """Отдает все незавершенные альбомы чата, чтобы следующее сообщение не обогнало их."""
+        for key in sorted((k for k in self._pending if k[0] == chat_id), key=lambda k: self._pending[k][0].id):
+            await self._flush(key)
+
+    async def flush_all(self):
+        for key in list(self._pending):
+            await self._flush(key)
+
+    async def close(self):
+        """Отдает незавершенные альбомы и дожидается сбросов по таймеру, уже забравших свои сообщения."""
+        await self.flush_all()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        messages = self._pending.pop(key, None)
+        if not messages:
+            return
+        messages.sort(key=lambda m: m.id)
+        self.logger.info(f"Coalesced album {key[1]} with {len(messages)} messages from chat {key[0]}")
+        await self.on_flush(key[0], messages)
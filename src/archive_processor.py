@@ -0,0 +1,152 @@
+import logging
+import os
+
+from .archive_store import ArchiveStore
+from .media_manager import MediaManager
+from .message_envelope import MessageEnvelope
+from .bandwidth_governor import current_flow, BACKFILL
+
+# Строки архива в таблице messages хранятся с этим target_chat_id
+ARCHIVE_TARGET_ID = 0
+
+HANDLER_KINDS = {
+    'PhotoHandler': 'photo',
+    'VideoHandler': 'video',
+    'AudioHandler': 'audio',
+    'MixedMediaHandler': 'mixed',
+    'FileHandler': 'file',
+    'WebPageHandler': 'webpage',
+}
+
+
+class ArchiveProcessor:
+    """Пишет сообщения источника в локальный архив вместо (или вместе с) целевого чата."""
+
+    def __init__(self, client, source_chat_id, archive_dir, repository, temp_dir, handlers, caption_limit,
+                 media_manager=None, compress=True, search_index=None, pair_name=None, priority=BACKFILL,
+                 retry_queue=None, attach=True):
+        self.logger = logging.getLogger(__name__)
+        self.logger.info(f"Initializing ArchiveProcessor for source {source_chat_id} to {archive_dir}")
+        self.client = client
+        self.source_chat_id = source_chat_id
+        self.target_chat_id = ARCHIVE_TARGET_ID
+        self.repository = repository
+        self.temp_dir = temp_dir
+        self.caption_limit = caption_limit
+        self.archive_dir = archive_dir
+        self.compress = compress
+        self.archive = None
+        self.media_manager = media_manager or MediaManager(client, temp_dir)
+        self.search_index = search_index
+        self.pair_name = pair_name or f"{source_chat_id}:archive"
+        self.priority = priority
+        self.retry_queue = retry_queue
+        # Хендлеры используются только для классификации медиа (supports), процессор им не нужен
+        self.handlers = [handler() for handler in handlers]
+        if attach:
+            self.attach()
+
+    async def process_message(self, message, priority=None):
+        message = MessageEnvelope.wrap(message)
+        token = current_flow.set((self.pair_name, self.priority if priority is None else priority))
+        try:
+            if self.retry_queue is not None:
+                return await self.retry_queue.guard(self, [message], lambda: self._archive_message(message))
+            return await self._archive_message(message)
+        finally:
+            current_flow.reset(token)
+            self.media_manager.done(self, [message.id])
+
+    async def process_group(self, messages, priority=None):
+        messages = [MessageEnvelope.wrap(msg) for msg in messages]
+        token = current_flow.set((self.pair_name, self.priority if priority is None else priority))
+        try:
+            if self.retry_queue is not None:
+                return await self.retry_queue.guard(self, messages, lambda: self._archive_group(messages))
+            return await self._archive_group(messages)
+        finally:
+            current_flow.reset(token)
+            self.media_manager.done(self, [msg.id for msg in messages])
+
+    async def _archive_group(self, messages):
+        for message in sorted(messages, key=lambda m: m.id):
+            await self._archive_message(message)
+
+    async def join(self):
+        return None
+
+    def attach(self):
+        """Открывает архив и подписывается на MediaManager; при горячей замене пары - после закрытия старого."""
+        self.archive = ArchiveStore(os.path.join(self.archive_dir, str(self.source_chat_id)), compress=self.compress)
+        self.media_manager.subscribe(self)
+
+    def close(self):
+        self.media_manager.unsubscribe(self)
+        if self.archive is not None:
+            self.archive.close()
+
+    def _classify(self, message):
+        if not message.media:
+            return 'text' if message.message else None
+        for handler in self.handlers:
+            if handler.supports(message):
+                return HANDLER_KINDS.get(handler.__class__.__name__, 'file')
+        return 'unknown'
+
+    def _file_path(self, message, kind):
+        # Те же имена, что у хендлеров, чтобы при fan-out скачивание было общим
+        extension = {'photo': '.jpg', 'video': '.mp4', 'audio': '.mp3'}.get(kind)
+        if extension is None:
+            extension = message.file.ext if message.file and message.file.ext else ''
+        return os.path.join(self.temp_dir, f"media_{message.id}_{self.source_chat_id}{extension}")
+
+    async def _archive_message(self, message):
+        msg_record = self.repository.get_message(message.id, self.source_chat_id, ARCHIVE_TARGET_ID)
+        if message.id in self.archive and msg_record and msg_record[3] == 1:
+            self.logger.info(f"Message {message.id} already archived")
+            return None
+
+        kind = self._classify(message)
+        if kind is None:
+            self.logger.warning(f"Skipped message {message.id} - no content")
+            return None
+
+        reply_to = getattr(message, 'reply_to', None)
+        topic_id = 0
+        if reply_to and getattr(reply_to, 'forum_topic', False):
+            topic_id = reply_to.reply_to_top_id or reply_to.reply_to_msg_id
+        record = {
+            'id': message.id,
+            'date': message.date.isoformat(),
+            'grouped_id': message.grouped_id,
+            'reply_to_msg_id': reply_to.reply_to_msg_id if reply_to else None,
+            'topic_id': topic_id,
+            'kind': kind,
+            'text': message.message or '',
+            'entities': [
+                {'type': entity.__class__.__name__, 'offset': entity.offset, 'length': entity.length,
+                 **({'url': entity.url} if getattr(entity, 'url', None) else {})}
+                for entity in (message.entities or [])
+            ],
+        }
+
+        if kind not in ('text', 'webpage', 'unknown'):
+            file_path = self._file_path(message, kind)
+            downloaded_path = await self.media_manager.download_media(message, file_path)
+            digest, size = await self.archive.put_blob(downloaded_path)
+            self.media_manager.release(downloaded_path)
+            record['media'] = {
+                'blob': digest,
+                'size': size,
+                'mime_type': message.file.mime_type if message.file else None,
+                'file_name': message.file.name if message.file else None,
+            }
+
+        if not msg_record:
+            self.repository.add_message(message.id, self.source_chat_id, ARCHIVE_TARGET_ID, topic_id)
+        await self.archive.append(message.id, record)
+        self.repository.update_message(message.id, self.source_chat_id, ARCHIVE_TARGET_ID, message.id)
+        if self.search_index is not None:
+            self.search_index.add(message, self.source_chat_id, ARCHIVE_TARGET_ID, message.id)
+        self.logger.info(f"Archived message {message.id} as {kind}")
+        return record
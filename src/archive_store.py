@@ -0,0 +1,133 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+
+
+class ArchiveStore:
+    """Локальный архив: append-only JSONL сегменты сообщений, компактный индекс смещений и content-addressed блобы.
+
+    Каждая запись сжатого сегмента - отдельный gzip member, поэтому сегмент остается обычным .jsonl.gz,
+    а запись читается по смещению из индекса без распаковки всего сегмента.
+    Запись сегментов с fsync и хеширование блобов идут в отдельном потоке, чтобы не останавливать event loop.
+    """
+
+    INDEX_RECORD = struct.Struct('<qIQI')  # source_msg_id, segment, offset, length
+
+    def __init__(self, root, compress=True, segment_size=64 * 1024 * 1024):
+        self.logger = logging.getLogger(__name__)
+        self.root = root
+        self.compress = compress
+        self.segment_size = segment_size
+        self.messages_dir = os.path.join(root, 'messages')
+        self.blobs_dir = os.path.join(root, 'blobs')
+        self.index_path = os.path.join(root, 'index.bin')
+        os.makedirs(self.messages_dir, exist_ok=True)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.index = {}  # source_msg_id -> (segment, offset, length)
+        self._maps = {}  # segment -> (mmap, size)
+        self._lock = asyncio.Lock()  # записи в сегмент и индекс идут строго по одной
+        self._load_index()
+        self.segment = max((entry[0] for entry in self.index.values()), default=1)
+
+    def _segment_path(self, segment):
+        suffix = '.jsonl.gz' if self.compress else '.jsonl'
+        return os.path.join(self.messages_dir, f"segment-{segment:06d}{suffix}")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        # Хвост от прерванной записи отбрасываем
+        usable = len(data) - len(data) % self.INDEX_RECORD.size
+        for source_msg_id, segment, offset, length in self.INDEX_RECORD.iter_unpack(data[:usable]):
+            self.index[source_msg_id] = (segment, offset, length)
+        self.logger.info(f"Loaded archive index with {len(self.index)} messages from {self.index_path}")
+
+    def __contains__(self, source_msg_id):
+        return source_msg_id in self.index
+
+    async def append(self, source_msg_id, record):
+        async with self._lock:
+            return await asyncio.to_thread(self._append, source_msg_id, record)
+
+    def _append(self, source_msg_id, record):
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        data = gzip.compress(line) if self.compress else line
+        path = self._segment_path(self.segment)
+        if os.path.exists(path) and os.path.getsize(path) + len(data) > self.segment_size:
+            self.segment += 1
+            path = self._segment_path(self.segment)
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, 'ab') as f:
+            f.write(self.INDEX_RECORD.pack(source_msg_id, self.segment, offset, len(data)))
+        self.index[source_msg_id] = (self.segment, offset, len(data))
+        cached = self._maps.pop(self.segment, None)
+        if cached:
+            cached[0].close()
+        return self.segment, offset
+
+    def _map(self, segment):
+        cached = self._maps.get(segment)
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        if cached and cached[1] == size:
+            return cached[0]
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[segment] = (mapped, size)
+        return mapped
+
+    def get(self, source_msg_id):
+        """O(1) поиск записи по id сообщения источника через индекс и mmap сегмента."""
+        entry = self.index.get(source_msg_id)
+        if entry is None:
+            return None
+        segment, offset, length = entry
+        data = self._map(segment)[offset:offset + length]
+        if self.compress:
+            data = gzip.decompress(data)
+        return json.loads(data)
+
+    async def put_blob(self, file_path):
+        """Кладет файл в content-addressed каталог blobs/ab/cd/<sha256>, одинаковые файлы хранятся один раз."""
+        return await asyncio.to_thread(self._put_blob, file_path)
+
+    def _put_blob(self, file_path):
+        sha256 = hashlib.sha256()
+        size = 0
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+                size += len(chunk)
+        digest = sha256.hexdigest()
+        blob_dir = os.path.join(self.blobs_dir, digest[:2], digest[2:4])
+        blob_path = os.path.join(blob_dir, digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(blob_dir, exist_ok=True)
+            tmp_path = f"{blob_path}.tmp"
+            try:
+                os.link(file_path, tmp_path)
+            except OSError:
+                shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, blob_path)
+            self.logger.info(f"Stored blob {digest} ({size} bytes)")
+        return digest, size
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[:2], digest[2:4], digest)
+
+    def close(self):
+        for mapped, _ in self._maps.values():
+            mapped.close()
+        self._maps.clear()
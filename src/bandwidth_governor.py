@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+
+LIVE = 0
+BACKFILL = 1
+PRIORITY_NAMES = {LIVE: 'live', BACKFILL: 'backfill'}
+
+# Поток (имя пары, приоритет), от имени которого идет текущая передача; выставляется процессором
+current_flow = contextvars.ContextVar('bandwidth_flow', default=None)
+
+
+class _Direction:
+    """Token bucket одного направления с взвешенным честным разделением между потоками и строгими классами приоритета."""
+
+    def __init__(self, name, rate, weight_of, burst=1.0, usage_window=5.0):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.rate = rate  # байт/с, 0 - без ограничения
+        self.weight_of = weight_of
+        self.burst = burst
+        self.usage_window = usage_window
+        self.tokens = rate * burst
+        self.updated = time.monotonic()
+        self.waiters = {}  # (priority, flow) -> deque[(nbytes, future)]
+        self.virtual_time = {}  # flow -> виртуальное время WFQ
+        self.system_time = 0.0
+        self.last_seen = {}  # flow -> (priority, monotonic time последнего запроса)
+        self.usage = {}  # flow -> [всего байт, байт в окне, начало окна, последняя скорость]
+        self._scheduler = None
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.rate * self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _account(self, flow, nbytes):
+        now = time.monotonic()
+        usage = self.usage.setdefault(flow, [0, 0, now, 0.0])
+        usage[0] += nbytes
+        usage[1] += nbytes
+        if now - usage[2] >= self.usage_window:
+            usage[3] = usage[1] / (now - usage[2])
+            usage[1] = 0
+            usage[2] = now
+
+    async def acquire(self, flow, priority, nbytes):
+        if not self.rate:
+            self._account(flow, nbytes)
+            return
+        self.last_seen[flow] = (priority, time.monotonic())
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault((priority, flow), deque()).append((nbytes, future))
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = asyncio.ensure_future(self._schedule())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.done():
+                future.cancel()
+            raise
+
+    def _next_waiter(self):
+        # Строгий приоритет: backfill получает полосу, только когда live ничего не ждет
+        keys = [key for key, queue in self.waiters.items() if queue]
+        if not keys:
+            return None
+        top = min(priority for priority, _ in keys)
+        candidates = [key for key in keys if key[0] == top]
+        # WFQ: выбираем поток с наименьшим виртуальным временем завершения следующего куска
+        return min(candidates, key=lambda key: self._start_time(key[1]) + self.waiters[key][0][0] / self.weight_of(key[1]))
+
+    def _start_time(self, flow):
+        # Простаивавший поток не копит кредит: стартует не раньше текущего системного времени
+        return max(self.virtual_time.get(flow, 0.0), self.system_time)
+
+    async def _schedule(self):
+        while True:
+            key = self._next_waiter()
+            if key is None:
+                return
+            queue = self.waiters[key]
+            nbytes, future = queue[0]
+            if future.cancelled():
+                queue.popleft()
+                continue
+            self._refill()
+            # Разрешаем уход в минус: кусок больше burst не блокирует поток навсегда
+            if self.tokens <= 0:
+                await asyncio.sleep(-self.tokens / self.rate + 0.001)
+                continue
+            queue.popleft()
+            if not queue:
+                del self.waiters[key]
+            priority, flow = key
+            self.tokens -= nbytes
+            self.system_time = self._start_time(flow)
+            self.virtual_time[flow] = self.system_time + nbytes / self.weight_of(flow)
+            self._account(flow, nbytes)
+            future.set_result(None)
+
+    def allocations(self, active_window=2.0):
+        """Текущая доля полосы (байт/с) каждого потока, передававшего данные за последние active_window секунд."""
+        if not self.rate:
+            return {}
+        now = time.monotonic()
+        active = {}
+        for flow, (priority, seen) in self.last_seen.items():
+            if now - seen <= active_window:
+                active.setdefault(priority, set()).add(flow)
+        if not active:
+            return {}
+        top = min(active)
+        total_weight = sum(self.weight_of(flow) for flow in active[top])
+        result = {}
+        for priority, flows in active.items():
+            for flow in flows:
+                share = self.rate * self.weight_of(flow) / total_weight if priority == top else 0
+                result[flow] = round(share)
+        return result
+
+    def stats(self):
+        allocations = self.allocations()
+        return {
+            'rate': self.rate,
+            'waiting': sum(len(queue) for queue in self.waiters.values()),
+            'flows': {
+                flow: {
+                    'bytes': usage[0],
+                    'bytes_per_second': round(usage[3]),
+                    'priority': PRIORITY_NAMES[self.last_seen[flow][0]] if flow in self.last_seen else None,
+                    'allocation': allocations.get(flow),
+                } for flow, usage in self.usage.items()
+            },
+        }
+
+
+class BandwidthGovernor:
+    """Общий ограничитель скорости скачивания и заливки для всех пар процесса.
+
+    Пары делят полосу пропорционально весам, live-трафик вытесняет backfill. Бюджет свой у каждого процесса:
+    отдельный запуск sync (например, из cron) и listen друг друга не видят, и лимиты у каждого свои. Чтобы
+    история уступала живым событиям, ее нужно гнать в том же процессе - режим daemon отправляет синхронизации
+    по расписанию через очереди пар как backfill, а живые события идут как live.
+    Передачи учитываются кусками по мере прохождения, поэтому ограничение - средняя скорость, а не жесткий потолок.
+    """
+
+    def __init__(self, upload_rate=0, download_rate=0, weights=None):
+        self.logger = logging.getLogger(__name__)
+        self.weights = weights or {}
+        self.upload = _Direction('upload', upload_rate, self.weight_of)
+        self.download = _Direction('download', download_rate, self.weight_of)
+        self.logger.info(f"Bandwidth governor: upload {upload_rate or 'unlimited'} B/s, "
+                         f"download {download_rate or 'unlimited'} B/s, weights {self.weights}")
+
+    def update(self, upload_rate, download_rate, weights):
+        """Меняет лимиты и веса на лету (hot reload конфигурации)."""
+        self.weights = weights or {}
+        for direction, rate in ((self.upload, upload_rate), (self.download, download_rate)):
+            if direction.rate != rate:
+                direction._refill()
+                direction.rate = rate
+                direction.tokens = min(direction.tokens, rate * direction.burst)
+        self.logger.info(f"Bandwidth governor updated: upload {upload_rate or 'unlimited'} B/s, "
+                         f"download {download_rate or 'unlimited'} B/s, weights {self.weights}")
+
+    def weight_of(self, flow):
+        # Архив пары ('pair:archive') по умолчанию делит вес самой пары
+        return max(self.weights.get(flow, self.weights.get(flow.split(':')[0], 1)), 0.001)
+
+    @staticmethod
+    def _flow():
+        return current_flow.get() or ('default', BACKFILL)
+
+    async def throttle_download(self, nbytes):
+        flow, priority = self._flow()
+        await self.download.acquire(flow, priority, nbytes)
+
+    async def throttle_upload(self, nbytes):
+        flow, priority = self._flow()
+        await self.upload.acquire(flow, priority, nbytes)
+
+    def upload_progress(self, progress_callback=None):
+        """Оборачивает progress_callback заливки Telethon: каждый отправленный кусок списывается из полосы upload."""
+        sent = 0
+
+        async def on_progress(current, total):
+            nonlocal sent
+            delta, sent = current - sent, current
+            if delta > 0:
+                await self.throttle_upload(delta)
+            if progress_callback:
+                progress_callback(current, total)
+
+        return on_progress
+
+    def stats(self):
+        return {'upload': self.upload.stats(), 'download': self.download.stats()}
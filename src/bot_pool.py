@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+
+from telethon.errors import FloodWaitError
+
+
+class PooledBot:
+    def __init__(self, index, client):
+        self.index = index
+        self.client = client
+        self.flood_until = 0
+        self.sends = 0
+        self.targets = set()
+
+    def is_available(self, now):
+        return self.flood_until <= now
+
+
+class BotPool:
+    """Пул авторизованных ботов. Каждый целевой чат закрепляется за одним ботом-админом, чтобы сохранить порядок."""
+
+    def __init__(self, clients, max_attempts=5):
+        self.logger = logging.getLogger(__name__)
+        self.bots = [PooledBot(i, client) for i, client in enumerate(clients)]
+        self.max_attempts = max_attempts
+        self.assignments = {}  # target_chat_id -> PooledBot
+        self.eligible = {}  # target_chat_id -> [PooledBot]
+        self._lock = asyncio.Lock()
+
+    async def _eligible_bots(self, target_chat_id):
+        if target_chat_id in self.eligible:
+            return self.eligible[target_chat_id]
+        eligible = []
+        if len(self.bots) == 1:
+            eligible = list(self.bots)
+        else:
+            for bot in self.bots:
+                try:
+                    permissions = await bot.client.get_permissions(target_chat_id, 'me')
+                    if permissions.is_admin:
+                        eligible.append(bot)
+                except Exception as e:
+                    self.logger.info(f"Bot #{bot.index} can not be used for target {target_chat_id}: {str(e)}")
+        if not eligible:
+            self.logger.warning(f"No admin bots found in target {target_chat_id}, falling back to primary bot")
+            eligible = [self.bots[0]]
+        self.logger.info(f"Target {target_chat_id} can be served by bots {[bot.index for bot in eligible]}")
+        self.eligible[target_chat_id] = eligible
+        return eligible
+
+    async def acquire(self, target_chat_id):
+        async with self._lock:
+            now = time.time()
+            bot = self.assignments.get(target_chat_id)
+            if bot and bot.is_available(now):
+                return bot
+            eligible = await self._eligible_bots(target_chat_id)
+            candidates = [b for b in eligible if b.is_available(now)] or eligible
+            new_bot = min(candidates, key=lambda b: (b.flood_until, len(b.targets), b.index))
+            if bot is not new_bot:
+                if bot:
+                    bot.targets.discard(target_chat_id)
+                    self.logger.info(f"Reassigning target {target_chat_id} from bot #{bot.index} to bot #{new_bot.index}")
+                new_bot.targets.add(target_chat_id)
+                self.assignments[target_chat_id] = new_bot
+            return new_bot
+
+    async def client_for(self, target_chat_id):
+        return (await self.acquire(target_chat_id)).client
+
+    async def call(self, target_chat_id, method, *args, **kwargs):
+        """Вызывает метод бота (send_file, send_message, ...) для target_chat_id с учетом FloodWait каждого бота."""
+        return await self.run(target_chat_id, lambda bot: getattr(bot, method)(target_chat_id, *args, **kwargs), method)
+
+    async def run(self, target_chat_id, operation, name='operation'):
+        """Выполняет operation(bot_client) на закрепленном за целью боте, при FloodWait переключается на другой."""
+        attempt = 0
+        while True:
+            bot = await self.acquire(target_chat_id)
+            wait = bot.flood_until - time.time()
+            if wait > 0:
+                self.logger.warning(f"All bots for target {target_chat_id} are in flood wait, sleeping {wait:.0f}s")
+                await asyncio.sleep(wait)
+            try:
+                result = await operation(bot.client)
+                bot.sends += 1
+                return result
+            except FloodWaitError as e:
+                attempt += 1
+                bot.flood_until = time.time() + e.seconds
+                self.logger.warning(f"Bot #{bot.index} got flood wait {e.seconds}s on {name} to {target_chat_id}, attempt {attempt}")
+                if attempt >= self.max_attempts:
+                    raise
+
+    def stats(self):
+        now = time.time()
+        return {
+            bot.index: {
+                'sends': bot.sends,
+                'targets': sorted(bot.targets),
+                'flood_wait': max(0, round(bot.flood_until - now)),
+            } for bot in self.bots
+        }
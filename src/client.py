@@ -2,29 +2,61 @@ from telethon import TelegramClient
 from telethon.sync import TelegramClient as SyncTelegramClient
 import logging
 
+from .bot_pool import BotPool
+from .account_pool import AccountPool
+from .bandwidth_governor import BandwidthGovernor
+
 class TelegramClientInterface:
-    def __init__(self, config):
+    def __init__(self, config, session_suffix=''):
         self.logger = logging.getLogger(__name__)
-        self.logger.info("Initializing TelegramClientInterface")
-        self.client = SyncTelegramClient(
-            'session',
-            config.api_id,
-            config.api_hash
-        )
-        self.bot = TelegramClient(
-            'bot_session',
-            config.api_id,
-            config.api_hash
-        )
+        self.logger.info(f"Initializing TelegramClientInterface{f' with session suffix {session_suffix}' if session_suffix else ''}")
+        self.session_suffix = session_suffix
+        # Первый аккаунт основной (цели, топики, события), дополнительные делят чтение и скачивание из источников
+        self.user_clients = [
+            SyncTelegramClient(
+                self._session_name(session),
+                config.api_id,
+                config.api_hash
+            ) for session in ['session'] + [account.session for account in config.accounts]
+        ]
+        self.client = self.user_clients[0]
+        self.accounts = AccountPool(self.user_clients)
+        self.bot_tokens = config.bot_tokens or [config.bot_token]
+        # Первый бот остается основным (топики, проверка прав), остальные используются для отправки
+        self.bot_clients = [
+            TelegramClient(
+                self._session_name('bot_session' if i == 0 else f"bot_session_{i}"),
+                config.api_id,
+                config.api_hash
+            ) for i in range(len(self.bot_tokens))
+        ]
+        self.bot = self.bot_clients[0]
+        self.bots = BotPool(self.bot_clients)
+        # Общая полоса для всех скачиваний и заливок процесса
+        self.bandwidth = BandwidthGovernor(config.upload_rate, config.download_rate,
+                                           {pair.name: pair.weight for pair in config.pairs})
         self.config = config
         self._bot_started = False
 
+    def _session_name(self, base_name):
+        """С суффиксом у процесса свой файл сессии и своя авторизация.
+
+        Файл основной сессии не копируется: один auth key в нескольких одновременно подключенных процессах
+        Telegram отзывает (AUTH_KEY_DUPLICATED), поэтому каждый воркер при первом запуске входит отдельно.
+        """
+        if not self.session_suffix:
+            return base_name
+        return f"{base_name}_{self.session_suffix}"
+
     async def start(self):
-        self.logger.info("Starting client authentication")
-        await self.client.start(phone=self.config.phone)
-        self.logger.info("Client authenticated successfully")
+        phones = [self.config.phone] + [account.phone for account in self.config.accounts]
+        for i, (user_client, phone) in enumerate(zip(self.user_clients, phones)):
+            self.logger.info(f"Starting client #{i} authentication")
+            await user_client.start(phone=phone)
+            self.logger.info(f"Client #{i} authenticated successfully")
         if not self._bot_started:
-            self.logger.info("Starting bot authentication")
-            await self.bot.start(bot_token=self.config.bot_token)
-            self._bot_started = True
-            self.logger.info("Bot authenticated successfully")
\ No newline at end of file
+            for i, (bot, token) in enumerate(zip(self.bot_clients, self.bot_tokens)):
+                self.logger.info(f"Starting bot #{i} authentication")
+                await bot.start(bot_token=token)
+                self.logger.info(f"Bot #{i} authenticated successfully")
+            self._bot_started = True
\ No newline at end of file
@@ -2,14 +2,26 @@
 import yaml
 import logging
 import colorlog
-from typing import List
-from dataclasses import dataclass
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+from .sync_scheduler import Schedule, SCHEDULE_MODES
 
 @dataclass
 class Pair:
     name: str
     source_chat_id: int
-    target_chat_id: int
+    target_chat_id: Optional[int] = None
+    archive_dir: Optional[str] = None  # Локальный архив вместо или вместе с target_chat_id
+    archive_compress: bool = True
+    weight: float = 1.0  # Доля пары в общей полосе BandwidthGovernor
+    schedule: Optional[str] = None  # Расписание синхронизации в режиме daemon: '15m' или cron '*/15 * * * *'
+    schedule_mode: str = 'sync'
+
+@dataclass
+class Account:
+    phone: str
+    session: str
 
 @dataclass
 class Config:
@@ -22,6 +34,21 @@ class Config:
     log_file: str
     temp_dir: str
     caption_limit: int  # Новый параметр
+    bot_tokens: List[str] = field(default_factory=list)
+    accounts: List[Account] = field(default_factory=list)
+    album_concurrency: int = 4
+    listen_queue_size: int = 100
+    listen_album_window: float = 1.0
+    lease_store: str = 'leases.db'
+    lease_ttl: int = 30
+    heartbeat_interval: int = 10
+    upload_rate: int = 0  # байт/с на весь процесс, 0 - без ограничения
+    download_rate: int = 0
+    retry_max_attempts: int = 5  # после стольких неудач сообщение уходит в dead_letters
+    retry_base_delay: int = 60  # секунд до первого повтора, дальше удваивается
+    retry_max_delay: int = 3600
+    daemon_jitter: int = 60  # случайная задержка запуска по расписанию, секунд
+    daemon_overlap: int = 300  # насколько раньше прошлого успешного запуска начинать следующую синхронизацию
 
     @classmethod
     def load(cls, path: str) -> 'Config':
@@ -30,18 +57,53 @@ class Config:
         try:
             with open(path, 'r') as f:
                 data = yaml.safe_load(f)
-                pairs = [Pair(name=p['name'], source_chat_id=p['source_chat_id'], target_chat_id=p['target_chat_id'])
+                bot_tokens = list(data['bot'].get('tokens') or [])
+                if data['bot'].get('token') and data['bot']['token'] not in bot_tokens:
+                    bot_tokens.insert(0, data['bot']['token'])
+                if not bot_tokens:
+                    raise ValueError("At least one bot token must be configured in 'bot.token' or 'bot.tokens'")
+                accounts = [Account(phone=a['phone'], session=a.get('session', f"session_{i}"))
+                            for i, a in enumerate(data['client'].get('accounts') or [], 1)]
+                pairs = [Pair(name=p['name'], source_chat_id=p['source_chat_id'], target_chat_id=p.get('target_chat_id'),
+                              archive_dir=p.get('archive_dir'), archive_compress=p.get('archive_compress', True),
+                              weight=p.get('weight', 1.0), schedule=p.get('schedule'),
+                              schedule_mode=p.get('schedule_mode', 'sync'))
                          for p in data['pairs']]
+                names = [pair.name for pair in pairs]
+                if len(names) != len(set(names)):
+                    raise ValueError(f"Pair names must be unique, got {names}")
+                for pair in pairs:
+                    if pair.target_chat_id is None and not pair.archive_dir:
+                        raise ValueError(f"Pair '{pair.name}' needs 'target_chat_id', 'archive_dir' or both")
+                    if pair.schedule:
+                        Schedule(pair.schedule)
+                        if pair.schedule_mode not in SCHEDULE_MODES:
+                            raise ValueError(f"Pair '{pair.name}' has schedule_mode '{pair.schedule_mode}', expected one of {SCHEDULE_MODES}")
                 return cls(
                     api_id=data['client']['api_id'],
                     api_hash=data['client']['api_hash'],
                     phone=data['client']['phone'],
-                    bot_token=data['bot']['token'],
+                    bot_token=bot_tokens[0],
                     pairs=pairs,
                     log_level=data['logging']['level'],
                     log_file=data['logging']['file'],
                     temp_dir=data['temp_dir'],
-                    caption_limit=data.get('caption_limit', 1000)  # Значение по умолчанию 1000
+                    caption_limit=data.get('caption_limit', 1000),  # Значение по умолчанию 1000
+                    bot_tokens=bot_tokens,
+                    accounts=accounts,
+                    album_concurrency=data.get('album_concurrency', 4),
+                    listen_queue_size=data.get('listen', {}).get('queue_size', 100),
+                    listen_album_window=data.get('listen', {}).get('album_window', 1.0),
+                    lease_store=data.get('workers', {}).get('lease_store', 'leases.db'),
+                    lease_ttl=data.get('workers', {}).get('lease_ttl', 30),
+                    heartbeat_interval=data.get('workers', {}).get('heartbeat_interval', 10),
+                    upload_rate=data.get('bandwidth', {}).get('upload_rate', 0),
+                    download_rate=data.get('bandwidth', {}).get('download_rate', 0),
+                    retry_max_attempts=data.get('retry', {}).get('max_attempts', 5),
+                    retry_base_delay=data.get('retry', {}).get('base_delay', 60),
+                    retry_max_delay=data.get('retry', {}).get('max_delay', 3600),
+                    daemon_jitter=data.get('daemon', {}).get('jitter', 60),
+                    daemon_overlap=data.get('daemon', {}).get('overlap', 300)
                 )
         except Exception as e:
             logger.error(f"Failed to load configuration: {str(e)}")
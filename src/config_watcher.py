@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+from .config import Config
+
+# Поля, которые нельзя применить без переподключения сессий; при их изменении нужен перезапуск
+RESTART_FIELDS = ['api_id', 'api_hash', 'phone', 'bot_tokens', 'accounts', 'temp_dir', 'lease_store', 'log_level', 'log_file']
+
+
+# Поля пары, изменение которых требует пересобрать ее конвейер; weight и schedule применяются на месте
+PIPELINE_FIELDS = ['source_chat_id', 'target_chat_id', 'archive_dir', 'archive_compress']
+
+
+def diff_pairs(old_pairs, new_pairs):
+    """Возвращает (добавленные, удаленные, измененные) пары, сравнивая по имени.
+
+    Измененными считаются только пары с другими PIPELINE_FIELDS.
+    """
+    old = {pair.name: pair for pair in old_pairs}
+    new = {pair.name: pair for pair in new_pairs}
+    added = [new[name] for name in new if name not in old]
+    removed = [old[name] for name in old if name not in new]
+    changed = [new[name] for name in new if name in old and
+               any(getattr(new[name], field) != getattr(old[name], field) for field in PIPELINE_FIELDS)]
+    return added, removed, changed
+
+
+class ConfigWatcher:
+    """Следит за config.yaml и передает новую конфигурацию в on_change без перезапуска процесса.
+
+    Файл опрашивается по mtime и хешу содержимого. Невалидная конфигурация или ошибка в on_change
+    отклоняют изменение целиком: процесс продолжает работать со старой конфигурацией.
+    """
+
+    def __init__(self, path, config, on_change, interval=5):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.config = config
+        self.on_change = on_change  # async callable(old_config, new_config)
+        self.interval = interval
+        self._mtime, self._digest = self._fingerprint()
+
+    def _fingerprint(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'rb') as f:
+                return mtime, hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None, None
+
+    async def run(self):
+        self.logger.info(f"Watching {self.path} for changes every {self.interval}s")
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def check(self):
+        mtime, digest = self._fingerprint()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        if digest == self._digest:
+            return False
+        try:
+            new_config = Config.load(self.path)
+        except Exception as e:
+            self.logger.error(f"Rejected {self.path}: {str(e)}; keeping the running configuration")
+            return False
+        # Файл прочитан, повторно его не разбираем, даже если применение отклонено
+        self._digest = digest
+
+        for name in RESTART_FIELDS:
+            if getattr(new_config, name) != getattr(self.config, name):
+                self.logger.warning(f"Config field '{name}' changed, it will take effect only after a restart")
+
+        try:
+            await self.on_change(self.config, new_config)
+        except Exception as e:
+            self.logger.error(f"Failed to apply {self.path}: {str(e)}; keeping the running configuration", exc_info=True)
+            return False
+        self.logger.info(f"Applied configuration from {self.path}")
+        return True
@@ -33,4 +33,115 @@ class Database:
                     PRIMARY KEY (source_msg_id, source_chat_id, target_chat_id)
                 )
             """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source_chat_id INTEGER,
+                    target_chat_id INTEGER,
+                    mode TEXT,
+                    started_at REAL,
+                    finished_at REAL,
+                    messages INTEGER,
+                    bytes INTEGER
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS audit_cursors (
+                    source_chat_id INTEGER,
+                    target_chat_id INTEGER,
+                    last_id INTEGER DEFAULT 0,
+                    max_id INTEGER DEFAULT 0,
+                    completed INTEGER DEFAULT 0,
+                    started_at REAL,
+                    updated_at REAL,
+                    first_id INTEGER DEFAULT 1,
+                    PRIMARY KEY (source_chat_id, target_chat_id)
+                )
+            """)
+            # Курсоры аудита из баз, созданных до появления first_id
+            if 'first_id' not in [row[1] for row in cursor.execute("PRAGMA table_info(audit_cursors)")]:
+                cursor.execute("ALTER TABLE audit_cursors ADD COLUMN first_id INTEGER DEFAULT 1")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS audit_findings (
+                    source_chat_id INTEGER,
+                    target_chat_id INTEGER,
+                    source_msg_id INTEGER,
+                    kind TEXT,
+                    target_msg_id INTEGER,
+                    repaired INTEGER DEFAULT 0,
+                    PRIMARY KEY (source_chat_id, target_chat_id, source_msg_id)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS retry_queue (
+                    source_chat_id INTEGER,
+                    target_chat_id INTEGER,
+                    source_msg_id INTEGER,
+                    error_class TEXT,
+                    error TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt REAL,
+                    created_at REAL,
+                    PRIMARY KEY (source_chat_id, target_chat_id, source_msg_id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_retry_queue_due ON retry_queue (source_chat_id, target_chat_id, next_attempt)")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    source_chat_id INTEGER,
+                    target_chat_id INTEGER,
+                    source_msg_id INTEGER,
+                    error_class TEXT,
+                    error TEXT,
+                    attempts INTEGER,
+                    created_at REAL,
+                    failed_at REAL,
+                    PRIMARY KEY (source_chat_id, target_chat_id, source_msg_id)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS send_journal (
+                    random_id INTEGER PRIMARY KEY,
+                    source_chat_id INTEGER,
+                    target_chat_id INTEGER,
+                    lead_msg_id INTEGER,
+                    source_msg_ids TEXT,
+                    text_prefix TEXT,
+                    has_media INTEGER,
+                    media_size INTEGER,
+                    started_at REAL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS upload_sessions (
+                    file_path TEXT,
+                    bot_index INTEGER,
+                    file_id INTEGER,
+                    size INTEGER,
+                    part_size INTEGER,
+                    created_at REAL,
+                    PRIMARY KEY (file_path, bot_index)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_schedules (
+                    pair_name TEXT PRIMARY KEY,
+                    schedule TEXT,
+                    next_run REAL,
+                    last_started REAL,
+                    last_finished REAL,
+                    last_success REAL,
+                    last_status TEXT,
+                    runs INTEGER DEFAULT 0,
+                    skipped INTEGER DEFAULT 0
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS upload_parts (
+                    file_path TEXT,
+                    bot_index INTEGER,
+                    part INTEGER,
+                    PRIMARY KEY (file_path, bot_index, part)
+                )
+            """)
             conn.commit()
\ No newline at end of file
@@ -0,0 +1,388 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+
+from telethon import events
+
+from .album_coalescer import AlbumCoalescer
+from .bandwidth_governor import LIVE, BACKFILL
+from .message_envelope import MessageEnvelope
+
+
+# Сколько id переполнения перечитывать из источника одним запросом
+REFILL_BATCH = 100
+# Пауза перед повтором, если перечитать переполнение не удалось
+REFILL_RETRY_DELAY = 5
+
+
+class PairLane:
+    """Очередь и воркер одной пары: сообщения пары обрабатываются строго по порядку.
+
+    Живые события кладутся без ожидания (offer). Когда очередь полна, сообщение запоминается в переполнении
+    только по id, а следующие события идут туда же за ним; воркер, разобрав очередь, перечитывает переполнение
+    из источника порциями в том же порядке. Так полная очередь одной пары не задерживает остальные пары
+    и не держит в памяти сами сообщения.
+
+    История (put с backfill=True) занимает отдельные queue_size мест и обрабатывается, только когда живых
+    событий в очереди нет, от имени потока BACKFILL: день истории не задерживает live-репликацию пары.
+    """
+
+    def __init__(self, name, source_chat_id, processor, queue_size):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.source_chat_id = source_chat_id
+        self.processor = processor
+        self.queue_size = queue_size
+        # (класс, номер, item): живые события раньше истории, внутри класса - по порядку постановки
+        self.queue = asyncio.PriorityQueue()
+        self.depth = {LIVE: 0, BACKFILL: 0}
+        self._seq = itertools.count()
+        self.overflow = deque()  # (ids, альбом ли) сообщений, не поместившихся в очередь, по порядку
+        self.room = asyncio.Event()  # воркер взял сообщение из очереди
+        self.task = None
+        self.processed = 0
+        self.failed = 0
+        self.delayed = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run(), name=f"lane-{self.name}")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def drain(self, timeout=None):
+        # Переполнение перечитывается до task_done последнего сообщения очереди, поэтому join учитывает и его
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Timed out draining queue for pair '{self.name}', {self.queue.qsize()} messages "
+                                f"and {len(self.overflow)} overflowed left")
+            return False
+
+    def _full(self, klass):
+        return bool(self.queue_size) and self.depth[klass] >= self.queue_size
+
+    def _enqueue(self, klass, item):
+        self.depth[klass] += 1
+        self.queue.put_nowait((klass, next(self._seq), item))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def accepting(self):
+        """Положит ли offer сообщение прямо в очередь, а не в переполнение."""
+        return not self.overflow and not self._full(LIVE)
+
+    def offer(self, item):
+        """Кладет item без ожидания; при полной очереди запоминает его в переполнении. False - не в очереди."""
+        if self.accepting():
+            self._enqueue(LIVE, item)
+            return True
+        self._spill(item)
+        return False
+
+    def _spill(self, item):
+        """Откладывает item в переполнение по id; без клиента для перечитывания сообщение теряется и считается."""
+        messages = item if isinstance(item, list) else [item]
+        if getattr(self.processor, 'client', None) is None:
+            self.dropped += 1
+            self.logger.error(f"Queue for pair '{self.name}' is full, dropping message {self._item_id(item)}")
+            return
+        if not self.overflow:
+            self.logger.warning(f"Queue for pair '{self.name}' is full ({self.queue_size}), "
+                                f"spilling from message {self._item_id(item)} until it catches up")
+        self.overflow.append(([msg.id for msg in messages], isinstance(item, list)))
+        self.spilled += 1
+
+    async def put(self, item, backfill=False):
+        """item: одиночное сообщение или список сообщений альбома; backfill ждет место в очереди без предупреждений."""
+        klass = BACKFILL if backfill else LIVE
+        if not backfill and not self.accepting():
+            # Backpressure: ждем место в очереди, событие считается задержанным
+            self.delayed += 1
+            self.logger.warning(f"Queue for pair '{self.name}' is full ({self.queue_size}), delaying message {self._item_id(item)}")
+        # Живое сообщение ждет и переполнение, которое старше него
+        while self._full(klass) or (klass == LIVE and self.overflow):
+            self.room.clear()
+            await self.room.wait()
+        self._enqueue(klass, item)
+
+    async def _run(self):
+        while True:
+            klass, _, item = await self.queue.get()
+            self.depth[klass] -= 1
+            self.room.set()
+            try:
+                await self._process(item, klass)
+                # Дочитываем переполнение до task_done: drain не завершится, пока в нем что-то есть
+                if self.overflow and not self.depth[LIVE]:
+                    await self._refill()
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, item, klass=LIVE):
+        # История идет от имени потока BACKFILL: в BandwidthGovernor ее вытесняют живые события.
+        # Живые сообщения - от потока процессора; обертки процессоров (LoadTest) priority не принимают
+        kwargs = {'priority': BACKFILL} if klass == BACKFILL else {}
+        try:
+            if isinstance(item, list):
+                await self.processor.process_group(item, **kwargs)
+            else:
+                await self.processor.process_message(item, **kwargs)
+            self.processed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            self.logger.error(f"Pair '{self.name}' failed to process message {self._item_id(item)}: {str(e)}", exc_info=True)
+
+    async def _refill(self):
+        """Перечитывает из источника начало переполнения и ставит его в очередь в исходном порядке."""
+        while self.overflow and not self.depth[LIVE]:
+            batch = []
+            count = 0
+            for ids, grouped in self.overflow:
+                if batch and (count + len(ids) > REFILL_BATCH or len(batch) >= (self.queue_size or REFILL_BATCH)):
+                    break
+                batch.append((ids, grouped))
+                count += len(ids)
+            try:
+                messages = await self.processor.client.accounts.get_messages(
+                    self.source_chat_id, ids=[msg_id for ids, _ in batch for msg_id in ids])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Failed to read back {count} overflowed messages of pair '{self.name}': {str(e)}, "
+                                  f"retrying in {REFILL_RETRY_DELAY}s")
+                await asyncio.sleep(REFILL_RETRY_DELAY)
+                continue
+            found = {message.id: message for message in messages if message is not None}
+            for ids, grouped in batch:
+                # Пока шел запрос, в конец переполнения могли добавиться новые события; начало то же
+                self.overflow.popleft()
+                envelopes = [MessageEnvelope.from_message(found[msg_id]) for msg_id in ids if msg_id in found]
+                if not envelopes:
+                    self.logger.warning(f"Overflowed messages {ids} of pair '{self.name}' were deleted from source")
+                    continue
+                self._enqueue(LIVE, envelopes if grouped else envelopes[0])
+            self.logger.info(f"Read back {count} overflowed messages of pair '{self.name}', "
+                             f"{len(self.overflow)} left in overflow")
+
+    @staticmethod
+    def _item_id(item):
+        return item[0].id if isinstance(item, list) else item.id
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'backfill': self.depth[BACKFILL],
+            'max_depth': self.max_depth,
+            'capacity': self.queue_size,
+            'overflow': len(self.overflow),
+            'processed': self.processed,
+            'failed': self.failed,
+            'delayed': self.delayed,
+            'spilled': self.spilled,
+            'dropped': self.dropped,
+        }
+
+
+class LaneFeed:
+    """Процессор для Synchronizer, который отдает историю в очереди пар listen-режима.
+
+    Сообщения истории обрабатываются тем же процессором, что и живые события, поэтому синхронизация
+    по расписанию не гонится с listen за одни и те же сообщения. В очереди история идет классом backfill:
+    живые события пары обрабатываются раньше нее, а ее передачи уступают им полосу.
+    """
+
+    def __init__(self, lanes):
+        self.lanes = lanes
+
+    async def _put(self, item):
+        for lane in self.lanes:
+            if lane.task is None:
+                raise RuntimeError(f"Queue of pair '{lane.name}' is stopped")
+            await lane.put(item, backfill=True)
+
+    async def process_message(self, message):
+        await self._put(MessageEnvelope.wrap(message))
+
+    async def process_group(self, messages):
+        await self._put([MessageEnvelope.wrap(msg) for msg in messages])
+
+    async def join(self):
+        for lane in self.lanes:
+            await lane.drain()
+
+
+class EventDispatcher:
+    """Единый обработчик NewMessage для режима listen, раскладывающий события по очередям пар.
+
+    Telethon запускает обработчик каждого события отдельной задачей, поэтому обработчик не ждет очереди:
+    события кладутся в очереди пар через offer, полная очередь уходит в свое переполнение, не задерживая
+    остальные пары источника. Обработчиков, одновременно держащих событие, не больше max_in_flight;
+    сверх этого событие минует окно склейки альбомов и сразу раскладывается по очередям.
+    """
+
+    def __init__(self, client, queue_size=100, album_window=1.0, report_interval=60, max_in_flight=1000):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.coalescer = AlbumCoalescer(album_window, self._route) if album_window else None
+        self.report_interval = report_interval
+        self.routes = {}  # source_chat_id -> [PairLane]
+        self.lanes = {}  # name -> PairLane
+        self._event_filter = None
+        self._report_task = None
+
+    def add_pair(self, name, source_chat_id, processor):
+        if name in self.lanes:
+            raise ValueError(f"Pair '{name}' is already registered in dispatcher")
+        lane = PairLane(name, source_chat_id, processor, self.queue_size)
+        self.lanes[name] = lane
+        self.routes.setdefault(source_chat_id, []).append(lane)
+        if self._event_filter is not None:
+            lane.start()
+        self.logger.info(f"Registered pair '{name}' for source {source_chat_id}")
+        return lane
+
+    async def remove_pair(self, name, drain=True, timeout=300):
+        lane = self.lanes.pop(name, None)
+        if lane is None:
+            return
+        self._unroute(lane)
+        if drain and lane.task is not None:
+            await lane.drain(timeout)
+        await lane.stop()
+        lane.processor.close()
+        self.logger.info(f"Unregistered pair '{name}' for source {lane.source_chat_id}")
+
+    async def replace_pair(self, name, source_chat_id, processor, timeout=300):
+        """Подменяет конвейер пары без окна, в котором ее события некуда положить.
+
+        Новая очередь получает маршрут сразу и копит события, а ее воркер стартует только после того, как старая
+        очередь дослала свои сообщения и ее процессор закрыт; процессор собран с attach=False и подключается
+        здесь же. Порядок сообщений пары сохраняется.
+        """
+        old = self.lanes.get(name)
+        lane = PairLane(name, source_chat_id, processor, self.queue_size)
+        self.lanes[name] = lane
+        if old is not None:
+            self._unroute(old)
+        self.routes.setdefault(source_chat_id, []).append(lane)
+        if old is not None:
+            if old.task is not None:
+                await old.drain(timeout)
+            await old.stop()
+            old.processor.close()
+        processor.attach()
+        if self._event_filter is not None:
+            lane.start()
+        self.logger.info(f"Replaced pipeline of pair '{name}' for source {source_chat_id}")
+        return lane
+
+    def _unroute(self, lane):
+        lanes = self.routes.get(lane.source_chat_id, [])
+        if lane in lanes:
+            lanes.remove(lane)
+        if not lanes:
+            self.routes.pop(lane.source_chat_id, None)
+
+    def set_caption_limit(self, caption_limit):
+        """Новый лимит подписи для работающих процессоров и их хендлеров."""
+        for lane in self.lanes.values():
+            lane.processor.caption_limit = caption_limit
+            for handler in getattr(lane.processor, 'handlers', []):
+                handler.caption_limit = caption_limit
+
+    async def set_album_window(self, window):
+        """Меняет окно склейки альбомов на лету; 0 отключает склейку."""
+        if not window:
+            if self.coalescer:
+                await self.coalescer.close()
+            self.coalescer = None
+        elif self.coalescer:
+            self.coalescer.window = window
+        else:
+            self.coalescer = AlbumCoalescer(window, self._route)
+
+    def start(self):
+        if self._event_filter is not None:
+            return
+        # Регистрируем обработчик один раз без фильтра по чатам, маршрутизация идет через self.routes
+        self._event_filter = events.NewMessage()
+        self.client.client.add_event_handler(self._on_new_message, self._event_filter)
+        for lane in self.lanes.values():
+            lane.start()
+        if self.report_interval:
+            self._report_task = asyncio.create_task(self._report_loop())
+        self.logger.info(f"Event dispatcher started for {len(self.lanes)} pairs")
+
+    async def stop(self):
+        if self._event_filter is not None:
+            self.client.client.remove_event_handler(self._on_new_message, self._event_filter)
+            self._event_filter = None
+        if self._report_task is not None:
+            self._report_task.cancel()
+            self._report_task = None
+        if self.coalescer:
+            await self.coalescer.close()
+        for lane in self.lanes.values():
+            await lane.stop()
+        self.logger.info("Event dispatcher stopped")
+
+    async def _on_new_message(self, event):
+        chat_id = event.chat_id
+        if chat_id not in self.routes:
+            return
+        # В очереди и окно склейки попадает только envelope, событие с raw Message дальше не живет
+        message = MessageEnvelope.from_message(event.message)
+        if self.in_flight >= self.max_in_flight:
+            # Сверх лимита событие не ждет окна склейки: сразу в очереди пар (или их переполнение)
+            self.logger.warning(f"{self.in_flight} events in flight, routing message {message.id} from {chat_id} "
+                                f"without album coalescing")
+            await self._route(chat_id, message)
+            return
+        self.in_flight += 1
+        try:
+            if self.coalescer:
+                if message.grouped_id:
+                    await self.coalescer.add(chat_id, message)
+                    return
+                await self.coalescer.flush_chat(chat_id)
+            await self._route(chat_id, message)
+        finally:
+            self.in_flight -= 1
+
+    async def _route(self, chat_id, item):
+        # Каждая пара получает событие без ожидания остальных: полная очередь копит только свое переполнение
+        for lane in self.routes.get(chat_id, []):
+            lane.offer(item)
+
+    def queue_depths(self):
+        return {name: lane.queue.qsize() for name, lane in self.lanes.items()}
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            for name, stats in self.stats().items():
+                if stats['depth'] or stats['overflow'] or stats['delayed'] or stats['spilled'] or stats['failed']:
+                    self.logger.info(f"Pair '{name}' queue: {stats}")
+            bandwidth = getattr(self.client, 'bandwidth', None)
+            if bandwidth is not None:
+                self.logger.info(f"Bandwidth: {bandwidth.stats()}")
@@ -0,0 +1,398 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon import events, utils
+from telethon.errors import RPCError, TakeoutInvalidError
+from telethon.tl.patched import Message
+from telethon.tl.functions.channels import GetForumTopicsRequest
+from telethon.tl.functions.messages import UploadMediaRequest
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import (
+    PeerChannel, MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage, Photo, PhotoSize, Document,
+    DocumentAttributeVideo, DocumentAttributeAudio, DocumentAttributeFilename, MessageReplyHeader, WebPageEmpty,
+    MessageEntityBold, MessageEntityItalic, MessageEntityTextUrl, MessageEntityUrl, InputFile, InputFileBig,
+    InputMediaUploadedPhoto
+)
+
+from .account_pool import AccountPool
+from .bot_pool import BotPool
+from .bandwidth_governor import BandwidthGovernor
+
+ENTITY_TYPES = {
+    'MessageEntityBold': MessageEntityBold,
+    'MessageEntityItalic': MessageEntityItalic,
+    'MessageEntityTextUrl': MessageEntityTextUrl,
+    'MessageEntityUrl': MessageEntityUrl,
+}
+
+UPLOAD_PART_SIZE = 512 * 1024
+
+
+class Latency:
+    """Модель задержек фейкового Telegram: фиксированная задержка RPC плюс время передачи по полосе, с джиттером."""
+
+    def __init__(self, rpc=0.05, upload_bps=2 * 1024 * 1024, download_bps=8 * 1024 * 1024, jitter=0.2, speed=1.0):
+        self.rpc = rpc
+        self.upload_bps = upload_bps
+        self.download_bps = download_bps
+        self.jitter = jitter
+        self.speed = speed
+
+    def delay(self, op, size=0):
+        seconds = self.rpc
+        if op in ('upload_file.part', 'upload') and self.upload_bps:
+            seconds += size / self.upload_bps
+        elif op in ('iter_download.chunk', 'download') and self.download_bps:
+            seconds += size / self.download_bps
+        if self.jitter:
+            seconds *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.0, seconds) / self.speed
+
+
+def build_media(shape, max_media_size=None):
+    """Собирает настоящие TL-объекты медиа по обезличенной форме сообщения (см. tracing.message_shape)."""
+    kind = shape.get('kind')
+    size = shape.get('size') or 0
+    if max_media_size:
+        size = min(size, max_media_size)
+    media_id = shape.get('media_id') or random.getrandbits(62)
+    now = datetime.now(timezone.utc)
+    if kind == 'photo':
+        photo = Photo(id=media_id, access_hash=0, file_reference=b'', date=now,
+                      sizes=[PhotoSize(type='y', w=1280, h=1280, size=size)], dc_id=2)
+        return MessageMediaPhoto(photo=photo)
+    if kind == 'webpage':
+        return MessageMediaWebPage(webpage=WebPageEmpty(id=media_id))
+    if kind != 'document':
+        return None
+    attributes = []
+    attrs = shape.get('attrs') or {}
+    if 'file_name' in attrs:
+        attributes.append(DocumentAttributeFilename(file_name=attrs['file_name']))
+    if 'video' in attrs:
+        duration, w, h = attrs['video']
+        attributes.append(DocumentAttributeVideo(duration=duration, w=w, h=h, round_message=attrs.get('round', False),
+                                                 supports_streaming=True))
+    if 'audio' in attrs:
+        attributes.append(DocumentAttributeAudio(duration=int(attrs['audio']), voice=attrs.get('voice', False)))
+    document = Document(id=media_id, access_hash=0, file_reference=b'', date=now,
+                        mime_type=shape.get('mime') or 'application/octet-stream', size=size, dc_id=2,
+                        attributes=attributes)
+    return MessageMediaDocument(document=document, video='video' in attrs and not attrs.get('round', False),
+                                round=attrs.get('round', False), voice=attrs.get('voice', False))
+
+
+# Message._finish_init читает у клиента id своего пользователя и кеш сущностей; у фейков их нет
+DETACHED_CLIENT = SimpleNamespace(_self_id=None, _mb_entity_cache={}, _entity_cache={})
+
+
+def build_message(shape, chat_id, client=None, max_media_size=None):
+    """Собирает telethon Message по форме: текст заменен на 'x' той же длины, медиа - настоящие TL-объекты."""
+    reply_to = None
+    if shape.get('reply'):
+        reply_to_msg_id, reply_to_top_id, forum_topic = shape['reply']
+        reply_to = MessageReplyHeader(reply_to_msg_id=reply_to_msg_id, reply_to_top_id=reply_to_top_id,
+                                      forum_topic=forum_topic)
+    entities = []
+    for name, offset, length in shape.get('entities') or []:
+        if name == 'MessageEntityTextUrl':
+            entities.append(MessageEntityTextUrl(offset=offset, length=length, url='https://example.com'))
+        else:
+            entities.append(ENTITY_TYPES.get(name, MessageEntityBold)(offset=offset, length=length))
+    message = Message(
+        id=shape['id'],
+        peer_id=PeerChannel(utils.resolve_id(chat_id)[0]),
+        date=datetime.fromtimestamp(shape.get('date') or 0, timezone.utc),
+        message='x' * shape.get('len', 0),
+        media=build_media(shape, max_media_size),
+        reply_to=reply_to,
+        grouped_id=shape.get('grouped_id'),
+        entities=entities or None,
+    )
+    message._finish_init(client or DETACHED_CLIENT, {}, None)
+    return message
+
+
+class FakeTelegram:
+    """Общий "сервер" для фейковых клиентов: история чатов, отправленные ботами сообщения и размеры файлов."""
+
+    def __init__(self, latency=None):
+        self.logger = logging.getLogger(__name__)
+        self.latency = latency or Latency()
+        self.history = {}  # chat_id -> [Message] по возрастанию id
+        self.sent = {}  # chat_id -> {msg_id: отправленное сообщение}
+        self.file_sizes = {}  # media id -> реальный размер (для времени передачи при урезанном файле)
+        self.forums = {}  # chat_id -> [(topic_id, title)]
+        self.takeout_script = None  # None - takeout выдается, исключение - выбрасывается при открытии, или TakeoutScript
+        self.on_sent = None  # callable(chat_id, sent_message, reply_to)
+        self._ids = itertools.count(1)
+        self.disconnected = asyncio.Event()
+
+    def add_history(self, chat_id, messages):
+        self.history.setdefault(chat_id, []).extend(messages)
+        self.history[chat_id].sort(key=lambda m: m.id)
+
+    def next_id(self):
+        return next(self._ids)
+
+    async def sleep(self, op, size=0):
+        delay = self.latency.delay(op, size)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class TakeoutScript:
+    """Сценарий takeout-сессий: ошибка при открытии и/или TakeoutInvalidError посреди выгрузки.
+
+    invalid_after - сколько сообщений takeout-клиенты отдают до инвалидации; после нее любой вызов через
+    takeout падает с TakeoutInvalidError, как у сессии, отмененной на сервере. В opened и finished
+    (success каждой закрытой сессии) копится то, что произошло.
+    """
+
+    def __init__(self, open_error=None, invalid_after=None):
+        self.open_error = open_error
+        self.invalid_after = invalid_after
+        self.served = 0
+        self.opened = 0
+        self.finished = []
+
+    def check(self):
+        if self.invalid_after is not None and self.served >= self.invalid_after:
+            raise TakeoutInvalidError(request=None)
+
+
+class _FakeTakeout:
+    def __init__(self, client, script):
+        self.client = client
+        self.script = script if isinstance(script, TakeoutScript) else TakeoutScript(open_error=script)
+
+    async def __aenter__(self):
+        if self.script.open_error is not None:
+            raise self.script.open_error
+        self.script.opened += 1
+        return _FakeTakeoutClient(self.client, self.script)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.script.finished.append(exc_type is None)
+        return False
+
+
+class _FakeTakeoutClient:
+    """Takeout-обертка пользовательского клиента: отдельный объект, как у Telethon, с инвалидацией по сценарию."""
+
+    def __init__(self, client, script):
+        self.client = client
+        self.script = script
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def iter_messages(self, chat_id, **kwargs):
+        self.script.check()
+        async for message in self.client.iter_messages(chat_id, **kwargs):
+            self.script.check()
+            self.script.served += 1
+            yield message
+
+    async def get_messages(self, chat_id, *args, **kwargs):
+        self.script.check()
+        return await self.client.get_messages(chat_id, *args, **kwargs)
+
+    async def iter_download(self, file, **kwargs):
+        self.script.check()
+        async for chunk in self.client.iter_download(file, **kwargs):
+            yield chunk
+
+
+class FakeUserClient:
+    """Пользовательский клиент: читает историю, скачивает медиа и отдает события из FakeTelegram."""
+
+    def __init__(self, world, page_size=100):
+        self.world = world
+        self.page_size = page_size
+        self.handlers = []
+        # Для Message._finish_init у сообщений, собранных с этим клиентом (см. DETACHED_CLIENT)
+        self._self_id = None
+        self._mb_entity_cache = {}
+        self._entity_cache = {}
+
+    async def get_input_entity(self, chat_id):
+        return PeerChannel(utils.resolve_id(chat_id)[0])
+
+    async def get_dialogs(self):
+        return []
+
+    async def iter_messages(self, chat_id, offset_date=None, reverse=False, min_id=0, max_id=0, offset_id=0,
+                            limit=None, reply_to=None, **kwargs):
+        messages = list(self.world.history.get(chat_id, []))
+        if offset_date is not None:
+            if offset_date.tzinfo is None:
+                offset_date = offset_date.astimezone(timezone.utc)
+            messages = [m for m in messages if (m.date >= offset_date if reverse else m.date < offset_date)]
+        if min_id:
+            messages = [m for m in messages if m.id > min_id]
+        if max_id:
+            messages = [m for m in messages if m.id < max_id]
+        if offset_id:
+            messages = [m for m in messages if (m.id > offset_id if reverse else m.id < offset_id)]
+        if reply_to is not None:
+            messages = [m for m in messages if m.reply_to and (m.reply_to.reply_to_top_id or m.reply_to.reply_to_msg_id) == reply_to]
+        if not reverse:
+            messages.reverse()
+        if limit is not None:
+            messages = messages[:limit]
+        for start in range(0, len(messages), self.page_size):
+            await self.world.sleep('iter_messages.page')
+            for message in messages[start:start + self.page_size]:
+                yield message
+
+    async def get_messages(self, chat_id, ids=None, **kwargs):
+        await self.world.sleep('get_messages')
+        if ids is None:
+            return [m async for m in self.iter_messages(chat_id, **kwargs)]
+        known = {m.id: m for m in self.world.history.get(chat_id, [])}
+        known.update(self.world.sent.get(chat_id, {}))
+        if isinstance(ids, list):
+            return [known.get(i) for i in ids]
+        return known.get(ids)
+
+    async def iter_download(self, file, offset=0, chunk_size=1024 * 1024, **kwargs):
+        size = getattr(file, 'size', None)
+        if size is None and getattr(file, 'sizes', None):
+            size = max(getattr(s, 'size', 0) for s in file.sizes)
+        size = size or 0
+        real_size = self.world.file_sizes.get(getattr(file, 'id', None), size)
+        # Время передачи считается по реальному размеру, даже если файл урезан для экономии диска
+        scale = real_size / size if size else 1
+        while offset < size:
+            n = min(chunk_size, size - offset)
+            await self.world.sleep('iter_download.chunk', n * scale)
+            offset += n
+            yield bytes(n)
+
+    async def __call__(self, request):
+        await self.world.sleep('rpc')
+        if isinstance(request, GetForumTopicsRequest):
+            if request.channel not in self.world.forums:
+                raise RPCError(request, 'CHANNEL_FORUM_MISSING', 400)
+            topics = [SimpleNamespace(id=topic_id, title=title, top_message=topic_id)
+                      for topic_id, title in self.world.forums[request.channel]]
+            return SimpleNamespace(topics=topics, messages=[])
+        return None
+
+    def takeout(self, **kwargs):
+        return _FakeTakeout(self, self.world.takeout_script)
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((callback, event))
+
+    def remove_event_handler(self, callback, event=None):
+        self.handlers = [(cb, ev) for cb, ev in self.handlers if cb is not callback]
+
+    async def emit(self, message):
+        """Доставляет NewMessage всем зарегистрированным обработчикам, как это делает Telethon."""
+        event = events.NewMessage.Event(message)
+        for callback, _ in list(self.handlers):
+            await callback(event)
+
+    async def run_until_disconnected(self):
+        await self.world.disconnected.wait()
+
+
+class FakeBotClient:
+    """Бот: заливает файлы частями с задержками модели и "отправляет" сообщения в FakeTelegram."""
+
+    def __init__(self, world, index=0):
+        self.world = world
+        self.index = index
+
+    async def get_me(self):
+        return SimpleNamespace(id=1000 + self.index, bot=True)
+
+    async def get_permissions(self, chat_id, user):
+        return SimpleNamespace(is_admin=True)
+
+    async def get_input_entity(self, chat_id):
+        return PeerChannel(utils.resolve_id(chat_id)[0])
+
+    async def upload_file(self, file, progress_callback=None, **kwargs):
+        size = os.path.getsize(file)
+        uploaded = 0
+        while True:
+            n = min(UPLOAD_PART_SIZE, size - uploaded)
+            await self.world.sleep('upload_file.part', n)
+            uploaded += n
+            if progress_callback:
+                result = progress_callback(uploaded, size)
+                if inspect.isawaitable(result):
+                    await result
+            if uploaded >= size:
+                break
+        parts = max(1, -(-size // UPLOAD_PART_SIZE))
+        file_id = random.getrandbits(62)
+        name = os.path.basename(file)
+        if size > 10 * 1024 * 1024:
+            return InputFileBig(id=file_id, parts=parts, name=name)
+        return InputFile(id=file_id, parts=parts, name=name, md5_checksum='')
+
+    async def __call__(self, request):
+        if isinstance(request, SaveBigFilePartRequest):
+            await self.world.sleep('upload_file.part', len(request.bytes))
+            return True
+        await self.world.sleep('rpc')
+        if isinstance(request, UploadMediaRequest):
+            if isinstance(request.media, InputMediaUploadedPhoto):
+                return build_media({'kind': 'photo', 'size': 0})
+            return build_media({'kind': 'document', 'mime': getattr(request.media, 'mime_type', None), 'size': 0})
+        return None
+
+    def _store(self, chat_id, media=None, reply_to=None):
+        message = SimpleNamespace(id=self.world.next_id(), media=media, date=datetime.now(timezone.utc))
+        self.world.sent.setdefault(chat_id, {})[message.id] = message
+        if self.world.on_sent:
+            self.world.on_sent(chat_id, message, reply_to)
+        return message
+
+    async def _upload_item(self, item, progress_callback=None):
+        if isinstance(item, str):
+            await self.upload_file(item, progress_callback=progress_callback)
+            return build_media({'kind': 'photo' if utils.is_image(item) else 'document', 'size': 0})
+        return item
+
+    async def send_file(self, entity, file, caption=None, reply_to=None, progress_callback=None, **kwargs):
+        if isinstance(file, list):
+            media = [await self._upload_item(item, progress_callback) for item in file]
+            await self.world.sleep('send_file')
+            return [self._store(entity, m, reply_to) for m in media]
+        media = await self._upload_item(file, progress_callback)
+        await self.world.sleep('send_file')
+        return self._store(entity, media, reply_to)
+
+    async def send_message(self, entity, message='', file=None, reply_to=None, **kwargs):
+        if file is not None:
+            return await self.send_file(entity, file, caption=message, reply_to=reply_to, **kwargs)
+        await self.world.sleep('send_message')
+        return self._store(entity, None, reply_to)
+
+
+class FakeClientInterface:
+    """Замена TelegramClientInterface поверх FakeTelegram: те же атрибуты и пулы, без сети."""
+
+    def __init__(self, world, accounts=1, bots=1, upload_rate=0, download_rate=0, weights=None):
+        self.world = world
+        self.user_clients = [FakeUserClient(world) for _ in range(accounts)]
+        self.client = self.user_clients[0]
+        self.accounts = AccountPool(self.user_clients)
+        self.bot_clients = [FakeBotClient(world, i) for i in range(bots)]
+        self.bot = self.bot_clients[0]
+        self.bots = BotPool(self.bot_clients)
+        self.bandwidth = BandwidthGovernor(upload_rate, download_rate, weights)
+
+    async def start(self):
+        return None
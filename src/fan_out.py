@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+from .event_dispatcher import PairLane
+from .message_envelope import MessageEnvelope
+
+
+class FanOutProcessor:
+    """Раздает один поток сообщений источника нескольким целям; у каждой цели своя очередь и порядок.
+
+    Сообщение кладется в очереди целей без ожидания (PairLane.offer): отставшая цель копит только свое
+    переполнение по id и дочитывает его из источника сама. Чтение истории ждет, только когда очереди всех
+    целей полны, то есть идет в темпе самой быстрой цели, и она получает историю без повторного чтения.
+    """
+
+    def __init__(self, processors, queue_size=100):
+        self.logger = logging.getLogger(__name__)
+        self.processors = processors
+        self.lanes = [
+            PairLane(f"{processor.source_chat_id}->{processor.target_chat_id}", processor.source_chat_id, processor, queue_size)
+            for processor in processors
+        ]
+        self.logger.info(f"Fan-out of source {processors[0].source_chat_id} to targets {[p.target_chat_id for p in processors]}")
+
+    def _start(self):
+        for lane in self.lanes:
+            lane.start()
+
+    async def process_message(self, message):
+        self._start()
+        # Очереди целей держат один envelope на всех, а не страницу истории с raw Message
+        await self._offer(MessageEnvelope.wrap(message))
+
+    async def process_group(self, messages):
+        self._start()
+        await self._offer([MessageEnvelope.wrap(msg) for msg in messages])
+
+    async def _offer(self, item):
+        while not any(lane.accepting() for lane in self.lanes):
+            for lane in self.lanes:
+                lane.room.clear()
+            waiters = [asyncio.create_task(lane.room.wait()) for lane in self.lanes]
+            try:
+                await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+        for lane in self.lanes:
+            lane.offer(item)
+
+    async def join(self):
+        for lane in self.lanes:
+            if lane.task is not None:
+                await lane.drain()
+            await lane.stop()
+            self.logger.info(f"Fan-out lane '{lane.name}' finished: {lane.stats()}")
+
+    def close(self):
+        for processor in self.processors:
+            processor.close()
@@ -11,12 +11,7 @@ class AudioHandler(BaseMediaHandler):
         else:
             messages = [message_or_group]
 
-        return all(
-            (hasattr(msg.media, 'voice') and msg.media.voice == True) or
-            (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-             msg.media.document.mime_type.startswith('audio'))
-            for msg in messages
-        )
+        return all(msg.media.voice or msg.media.is_mime('audio') for msg in messages)
 
     async def handle(self, message_or_group, target_reply_to_msg_id):
         # Пока AudioHandler не поддерживает группы, только одиночные сообщения
@@ -30,7 +25,7 @@ class AudioHandler(BaseMediaHandler):
                 voice=True,
                 title=None,
                 performer=None
-            ) for attr in message.media.document.attributes if isinstance(attr, DocumentAttributeAudio)
+            ) for attr in message.media.attributes if isinstance(attr, DocumentAttributeAudio)
         ] or [DocumentAttributeAudio(duration=0, voice=True)]
 
         original_text = message.message or ''
@@ -46,8 +41,8 @@ class AudioHandler(BaseMediaHandler):
                 pbar.update(current - pbar.n)
 
             self.logger.info(f"Sending voice note for message {message.id} from {message_date} from {downloaded_path} with attributes: {attributes}")
-            sent_message = await self.client.bot.send_file(
-                self.target_chat_id,
+            sent_message = await self._send_media(
+                'send_file',
                 file=downloaded_path,
                 caption=part_text,
                 voice_note=True,
@@ -56,6 +51,5 @@ class AudioHandler(BaseMediaHandler):
                 formatting_entities=adjusted_entities,
                 progress_callback=progress_callback
             )
-        os.remove(downloaded_path)
-        self.logger.info(f"Removed temporary file {downloaded_path} for message {message.id} from {message_date}")
+        self.media_manager.release(downloaded_path)
         return sent_message
\ No newline at end of file
@@ -3,9 +3,12 @@ import logging
 import asyncio
 
 class BaseMediaHandler:
-    def __init__(self, processor):
+    def __init__(self, processor=None):
         self.processor = processor
         self.logger = logging.getLogger(__name__)
+        # Без процессора хендлер годится только для классификации (supports): SyncPlanner, ArchiveProcessor
+        if processor is None:
+            return
         self.client = processor.client
         self.target_chat_id = processor.target_chat_id
         self.media_manager = processor.media_manager
@@ -17,6 +20,14 @@ class BaseMediaHandler:
     async def handle(self, message, target_topic_id):
         raise NotImplementedError("Handler must implement handle method")
 
+    async def _send_media(self, method, file, **kwargs):
+        """Отправляет медиа через закрепленного за целью бота, переиспользуя уже залитые им файлы."""
+        return await self.client.bots.run(
+            self.target_chat_id,
+            lambda bot: self.media_manager.send_media(bot, self.target_chat_id, method, file, **kwargs),
+            method
+        )
+
     def _adjust_entities(self, original_text, truncated_text, entities):
         """Корректирует entities, чтобы они соответствовали обрезанному тексту."""
         if not entities or len(original_text) <= len(truncated_text):
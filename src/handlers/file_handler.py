@@ -11,13 +11,9 @@ class FileHandler(BaseMediaHandler):
         else:
             messages = [message_or_group]
         return all(
-            (((hasattr(msg.media, 'voice') and msg.media.voice == False) or (not hasattr(msg.media, 'voice'))) and
-             ((hasattr(msg.media, 'round') and msg.media.round == False) or (not hasattr(msg.media, 'round'))) and
-             ((hasattr(msg.media, 'video') and msg.media.video == False) or (not hasattr(msg.media, 'video'))) and
-             (not hasattr(msg.media, 'photo')) and
-             (not hasattr(msg.media, 'webpage'))) or
-            (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-             msg.media.document.mime_type.startswith('application/'))
+            (not msg.media.voice and not msg.media.round and not msg.media.video and
+             not msg.media.photo and msg.media.kind != 'webpage') or
+            msg.media.is_mime('application/')
             for msg in messages
         )
 
@@ -31,14 +27,18 @@ class FileHandler(BaseMediaHandler):
         if message.entities:
             entities = self._adjust_entities(original_text, text_part, message.entities)
 
-        document_extension = message.file.ext
+        document_extension = message.media.ext
         file_path = os.path.join(self.processor.temp_dir,
                                  f"media_{message.id}_{self.processor.source_chat_id}{document_extension}")
-        real_file_name = message.document.attributes[0].file_name
+        real_file_name = message.media.name
         downloaded_path = await self.media_manager.download_media(message, file_path)
         self.logger.info(f"Downloaded file {message.id} from {message_date} to {downloaded_path}")
 
         total_size = os.path.getsize(downloaded_path)
+        if total_size > self.processor.MAX_FILE_SIZE:
+            return await self._send_split_file(message, downloaded_path, real_file_name, text_part, entities,
+                                               target_reply_to_msg_id)
+
         self.logger.info(
             f"Sending file for message {message.id} from {message_date} with message: '{text_part}'")
         with tqdm(total=total_size, unit='B', unit_scale=True,
@@ -47,8 +47,8 @@ class FileHandler(BaseMediaHandler):
                 pbar.update(current - pbar.n)
 
             attributes = [DocumentAttributeFilename(file_name=real_file_name)]
-            sent_message = await self.client.bot.send_file(
-                self.target_chat_id,
+            sent_message = await self._send_media(
+                'send_file',
                 attributes=attributes,
                 message=text_part,
                 file=downloaded_path,
@@ -58,11 +58,33 @@ class FileHandler(BaseMediaHandler):
                 progress_callback=progress_callback
             )
 
-        os.remove(file_path)
-        self.logger.info(f"Removed temporary file {file_path} for group message {message.id}")
+        self.media_manager.release(file_path)
 
         return sent_message if sent_message else None
 
+    async def _send_split_file(self, message, downloaded_path, real_file_name, text_part, entities, target_reply_to_msg_id):
+        """Документ больше MAX_FILE_SIZE отправляется томами .001, .002, ... с манифестом для сборки."""
+        total_size = os.path.getsize(downloaded_path)
+        self.logger.info(f"File size {total_size} bytes of message {message.id} exceeds limit, sending as volume parts")
+        with tqdm(total=total_size, unit='B', unit_scale=True,
+                  desc=f"Uploading volume parts for message {message.id}") as pbar:
+            def progress_callback(current, total):
+                pbar.update(current - pbar.n)
+
+            # Без bots.run: его повтор после FloodWait резал и заливал бы все тома заново. send_split_file сам
+            # повторяет отдельные заливки на этом же боте, чьи уже залитые части остаются годными для альбома
+            bot = await self.client.bots.client_for(self.target_chat_id)
+            sent_message = await self.media_manager.send_split_file(
+                bot, self.target_chat_id, downloaded_path, message.id, real_file_name,
+                caption=text_part,
+                formatting_entities=entities,
+                reply_to=target_reply_to_msg_id if target_reply_to_msg_id != 0 else None,
+                progress_callback=progress_callback,
+                caption_limit=self.caption_limit
+            )
+        self.media_manager.release(downloaded_path)
+        return sent_message
+
     async def handle(self, message_or_group, target_reply_to_msg_id):
         if isinstance(message_or_group, list):
             lead_message = message_or_group[0]
@@ -76,14 +98,11 @@ class FileHandler(BaseMediaHandler):
             if entities:
                 entities = self._adjust_entities(original_text, part_text, entities)
 
-            file_paths = []
-            for msg in message_or_group:
-                document_extension = msg.file.ext
-                file_path = os.path.join(self.processor.temp_dir,
-                                         f"media_{msg.id}_{self.processor.source_chat_id}{document_extension}")
-                downloaded_path = await self.media_manager.download_media(msg, file_path)
-                file_paths.append(downloaded_path)
-                self.logger.info(f"Downloaded file {msg.id} from {message_date} to {downloaded_path}")
+            file_paths = await self.media_manager.download_many([
+                (msg, os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}{msg.media.ext}"))
+                for msg in message_or_group
+            ])
+            self.logger.info(f"Downloaded {len(file_paths)} files for group message {lead_message.id} from {message_date}")
 
             sent_messages = []
             total_size = sum(os.path.getsize(f) for f in file_paths)
@@ -94,8 +113,8 @@ class FileHandler(BaseMediaHandler):
                 def progress_callback(current, total):
                     pbar.update(current - pbar.n)
 
-                sent_message = await self.client.bot.send_file(
-                    self.target_chat_id,
+                sent_message = await self._send_media(
+                    'send_file',
                     message=part_text,
                     file=file_paths,
                     force_document=True,
@@ -106,8 +125,7 @@ class FileHandler(BaseMediaHandler):
                 sent_messages.append(sent_message)
 
             for file_path in file_paths:
-                os.remove(file_path)
-                self.logger.info(f"Removed temporary file {file_path} for group message {lead_message.id}")
+                self.media_manager.release(file_path)
 
             return sent_messages[0] if sent_messages else None
         else:
@@ -8,24 +8,10 @@ class MixedMediaHandler(BaseMediaHandler):
         if not isinstance(message_or_group, list):
             return False
 
-        has_photo = any(
-            hasattr(msg.media, 'photo') or
-            (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-             msg.media.document.mime_type.startswith('image'))
-            for msg in message_or_group
-        )
-        has_video = any(
-            hasattr(msg.media, 'video') or
-            (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-             msg.media.document.mime_type.startswith('video'))
-            for msg in message_or_group
-        )
-        has_audio = any(
-            hasattr(msg.media, 'voice') or
-            (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-             msg.media.document.mime_type.startswith('audio'))
-            for msg in message_or_group
-        )
+        # video/voice не None у любого документа, как и hasattr у MessageMediaDocument
+        has_photo = any(msg.media.photo or msg.media.is_mime('image') for msg in message_or_group)
+        has_video = any(msg.media.video is not None or msg.media.is_mime('video') for msg in message_or_group)
+        has_audio = any(msg.media.voice is not None or msg.media.is_mime('audio') for msg in message_or_group)
 
         supports_mixed = sum([has_photo, has_video, has_audio]) >= 2
         self.logger.info(f"MixedMediaHandler supports check: has_photo={has_photo}, has_video={has_video}, has_audio={has_audio}, result={supports_mixed}")
@@ -43,23 +29,20 @@ class MixedMediaHandler(BaseMediaHandler):
         if entities:
             entities = self._adjust_entities(original_text, part_text, entities)
 
-        file_paths = []
+        downloads = []
         for msg in messages:
-            if hasattr(msg.media, 'photo') or (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-                                              msg.media.document.mime_type.startswith('image')):
+            if msg.media.photo or msg.media.is_mime('image'):
                 file_path = os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}.jpg")
-            elif hasattr(msg.media, 'video') or (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-                                                msg.media.document.mime_type.startswith('video')):
+            elif msg.media.video is not None or msg.media.is_mime('video'):
                 file_path = os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}.mp4")
-            elif hasattr(msg.media, 'voice') or (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-                                                msg.media.document.mime_type.startswith('audio')):
+            elif msg.media.voice is not None or msg.media.is_mime('audio'):
                 file_path = os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}.mp3")
             else:
                 continue
+            downloads.append((msg, file_path))
 
-            downloaded_path = await self.media_manager.download_media(msg, file_path)
-            file_paths.append(downloaded_path)
-            self.logger.info(f"Downloaded mixed media {msg.id} from {message_date} to {downloaded_path}")
+        file_paths = await self.media_manager.download_many(downloads)
+        self.logger.info(f"Downloaded {len(file_paths)} mixed media for group message {lead_message.id} from {message_date}")
 
         sent_messages = []
         total_size = sum(os.path.getsize(f) for f in file_paths)
@@ -68,8 +51,8 @@ class MixedMediaHandler(BaseMediaHandler):
             def progress_callback(current, total):
                 pbar.update(current - pbar.n)
 
-            sent_message = await self.client.bot.send_message(
-                self.target_chat_id,
+            sent_message = await self._send_media(
+                'send_message',
                 message=part_text,
                 file=file_paths,
                 force_document=False,
@@ -81,7 +64,6 @@ class MixedMediaHandler(BaseMediaHandler):
             sent_messages.append(sent_message)
 
         for file_path in file_paths:
-            os.remove(file_path)
-            self.logger.info(f"Removed temporary file {file_path} for group message {lead_message.id}")
+            self.media_manager.release(file_path)
 
         return sent_messages[0] if sent_messages else None
\ No newline at end of file
@@ -9,26 +9,21 @@ class PhotoHandler(BaseMediaHandler):
         else:
             messages = [message_or_group]
 
-        return all(
-            hasattr(msg.media, 'photo') or
-            (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-             msg.media.document.mime_type.startswith('image'))
-            for msg in messages
-        )
+        return all(msg.media.photo or msg.media.is_mime('image') for msg in messages)
 
     async def handle(self, message_or_group, target_reply_to_msg_id):
         if isinstance(message_or_group, list):
             messages = message_or_group
             lead_message = messages[0]
             message_date = lead_message.date.strftime('%Y-%m-%d %H:%M:%S')
-            file_paths = []
             text_parts = []
 
+            file_paths = await self.media_manager.download_many([
+                (msg, os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}.jpg"))
+                for msg in messages
+            ])
+            self.logger.info(f"Downloaded {len(file_paths)} photos for group message {lead_message.id} from {message_date}")
             for msg in messages:
-                file_path = os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}.jpg")
-                downloaded_path = await self.media_manager.download_media(msg, file_path)
-                file_paths.append(downloaded_path)
-                self.logger.info(f"Downloaded photo {msg.id} from {message_date} to {downloaded_path}")
                 if msg.message and msg.message.strip():
                     text_parts.append(msg.message.strip())
                     self.logger.info(f"Found text in message {msg.id}: '{msg.message.strip()}'")
@@ -42,8 +37,8 @@ class PhotoHandler(BaseMediaHandler):
                 entities = self._adjust_entities(original_text, part_text, entities)
 
             self.logger.info(f"Sending group of {len(file_paths)} photos for message {lead_message.id} from {message_date} with message: '{part_text}'")
-            sent_message = await self.client.bot.send_message(
-                self.target_chat_id,
+            sent_message = await self._send_media(
+                'send_message',
                 message=part_text,
                 file=file_paths,
                 force_document=False,
@@ -52,8 +47,7 @@ class PhotoHandler(BaseMediaHandler):
             )
 
             for file_path in file_paths:
-                os.remove(file_path)
-                self.logger.info(f"Removed temporary file {file_path} for group message {lead_message.id} from {message_date}")
+                self.media_manager.release(file_path)
             return sent_message
 
         message = message_or_group
@@ -70,14 +64,13 @@ class PhotoHandler(BaseMediaHandler):
 
         message_date = message.date.strftime('%Y-%m-%d %H:%M:%S')
         self.logger.info(f"Sending photo for message {message.id} from {message_date} from {downloaded_path} with message: '{part_text}'")
-        sent_message = await self.client.bot.send_message(
-            self.target_chat_id,
+        sent_message = await self._send_media(
+            'send_message',
             message=part_text,
             file=downloaded_path,
             force_document=False,
             reply_to=target_reply_to_msg_id if target_reply_to_msg_id != 0 else None,
             formatting_entities=entities
         )
-        os.remove(downloaded_path)
-        self.logger.info(f"Removed temporary file {downloaded_path} for message {message.id} from {message_date}")
+        self.media_manager.release(downloaded_path)
         return sent_message
\ No newline at end of file
@@ -11,15 +11,10 @@ class VideoHandler(BaseMediaHandler):
         else:
             messages = [message_or_group]
 
-        return all(
-            (hasattr(msg.media, 'video') and msg.media.video) or
-            (hasattr(msg.media, 'document') and hasattr(msg.media.document, 'mime_type') and
-             msg.media.document.mime_type.startswith('video'))
-            for msg in messages
-        )
+        return all(msg.media.video or msg.media.is_mime('video') for msg in messages)
 
     def _is_round_video(self, message):
-        return hasattr(message.media, 'round') and message.media.round
+        return bool(message.media.round)
 
     async def _handle_single_video(self, message, target_reply_to_msg_id):
         """Обрабатывает одиночное видео, большие разрезанные видео заливает как альбом."""
@@ -31,11 +26,9 @@ class VideoHandler(BaseMediaHandler):
             w=attr.w,
             h=attr.h,
             supports_streaming=True
-        ) for attr in (
-            message.media.document.attributes if hasattr(message.media, 'document') else [message.media.video])
-            if isinstance(attr, DocumentAttributeVideo)][0:1]
+        ) for attr in message.media.attributes if isinstance(attr, DocumentAttributeVideo)][0:1]
 
-        self.logger.info("Video media: {}".format(message.media.__dict__))
+        self.logger.info("Video media: {}".format(message.media))
         is_round = self._is_round_video(message)
         self.logger.info("Round flag: {}".format(is_round))
         file_size = os.path.getsize(downloaded_path)
@@ -67,8 +60,8 @@ class VideoHandler(BaseMediaHandler):
                 def progress_callback(current, total):
                     pbar.update(current - pbar.n)
 
-                sent_message_group = await self.client.bot.send_file(
-                    self.target_chat_id,
+                sent_message_group = await self._send_media(
+                    'send_file',
                     file=file_paths,
                     caption=captions,
                     supports_streaming=True,
@@ -79,8 +72,7 @@ class VideoHandler(BaseMediaHandler):
                 )
             sent_messages.extend(sent_message_group if isinstance(sent_message_group, list) else [sent_message_group])
             for part_path in file_paths:
-                os.remove(part_path)
-                self.logger.info(f"Removed temporary file {part_path} for message {message.id} from {message_date}")
+                self.media_manager.release(part_path)
         else:
             # Если видео не разрезанное, отправляем как одиночное сообщение
             part_path = file_paths[0]
@@ -102,15 +94,15 @@ class VideoHandler(BaseMediaHandler):
                     pbar.update(current - pbar.n)
 
                 if is_round:
-                    sent_message = await self.client.bot.send_file(
-                        self.target_chat_id,
+                    sent_message = await self._send_media(
+                        'send_file',
                         file=part_path,
                         video_note=True,
                         progress_callback=progress_callback
                     )
                 else:
-                    sent_message = await self.client.bot.send_file(
-                        self.target_chat_id,
+                    sent_message = await self._send_media(
+                        'send_file',
                         file=part_path,
                         caption=part_text,
                         supports_streaming=True,
@@ -120,8 +112,7 @@ class VideoHandler(BaseMediaHandler):
                         progress_callback=progress_callback
                     )
             sent_messages.append(sent_message)
-            os.remove(part_path)
-            self.logger.info(f"Removed temporary file {part_path} for message {message.id} from {message_date}")
+            self.media_manager.release(part_path)
 
         return sent_messages[0] if sent_messages else None
 
@@ -134,9 +125,11 @@ class VideoHandler(BaseMediaHandler):
 
             # Собираем информацию о видео
             video_info = []
-            for msg in messages:
-                file_path = os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}.mp4")
-                downloaded_path = await self.media_manager.download_media(msg, file_path)
+            downloaded_paths = await self.media_manager.download_many([
+                (msg, os.path.join(self.processor.temp_dir, f"media_{msg.id}_{self.processor.source_chat_id}.mp4"))
+                for msg in messages
+            ])
+            for msg, downloaded_path in zip(messages, downloaded_paths):
                 file_size = os.path.getsize(downloaded_path)
                 is_round = self._is_round_video(msg)
                 video_info.append({
@@ -171,8 +164,8 @@ class VideoHandler(BaseMediaHandler):
                     def progress_callback(current, total):
                         pbar.update(current - pbar.n)
 
-                    sent_message_group = await self.client.bot.send_file(
-                        self.target_chat_id,
+                    sent_message_group = await self._send_media(
+                        'send_file',
                         file=file_paths,
                         caption=captions,
                         supports_streaming=True,
@@ -182,8 +175,7 @@ class VideoHandler(BaseMediaHandler):
                     )
                 sent_messages.extend(sent_message_group if isinstance(sent_message_group, list) else [sent_message_group])
                 for info in small_videos:
-                    os.remove(info['path'])
-                    self.logger.info(f"Removed temporary file {info['path']} for message {info['message'].id} from {message_date}")
+                    self.media_manager.release(info['path'])
 
             # Обрабатываем видео > 2 ГБ отдельно
             for info in large_videos:
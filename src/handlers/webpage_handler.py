@@ -1,6 +1,5 @@
 import os
 from .base_handler import BaseMediaHandler
-from telethon.tl.types import MessageMediaWebPage
 
 
 class WebPageHandler(BaseMediaHandler):
@@ -10,8 +9,7 @@ class WebPageHandler(BaseMediaHandler):
             return False
 
         message = message_or_group
-        supports_webpage = isinstance(message.media, MessageMediaWebPage) and hasattr(message.media,
-                                                                                      'webpage') and message.media.webpage
+        supports_webpage = message.media is not None and message.media.webpage
         self.logger.info(f"WebPageHandler supports check for message {message.id}: result={supports_webpage}")
         return supports_webpage
 
@@ -27,8 +25,9 @@ class WebPageHandler(BaseMediaHandler):
             return None
 
         self.logger.info(f"Sending webpage message {message.id} from {message_date} with text: '{part_text}'")
-        sent_message = await self.client.bot.send_message(
+        sent_message = await self.client.bots.call(
             self.target_chat_id,
+            'send_message',
             message=part_text,
             reply_to=target_reply_to_msg_id if target_reply_to_msg_id != 0 else None,
             link_preview=True,  # Включаем превью ссылки
@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import logging
+import math
+import sqlite3
+import time
+
+
+class LeaseStore:
+    """Общее хранилище аренды пар воркерами. Для одного хоста достаточно локального SQLite файла."""
+
+    def __init__(self, path="leases.db"):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self._init_db()
+
+    def _connect(self):
+        # isolation_level=None: транзакции открываем явно через BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _init_db(self):
+        self.logger.info(f"Initializing lease store at {self.path}")
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    heartbeat_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    pair_name TEXT PRIMARY KEY,
+                    worker_id TEXT,
+                    expires_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+        finally:
+            conn.close()
+
+    def heartbeat(self, worker_id, now):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?) "
+                         "ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                         (worker_id, now))
+        finally:
+            conn.close()
+
+    def live_workers(self, now, ttl):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT worker_id FROM workers WHERE heartbeat_at >= ? ORDER BY worker_id",
+                                (now - ttl,)).fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
+
+    def acquire(self, pair_name, worker_id, now, ttl):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO leases (pair_name, worker_id, expires_at) VALUES (?, NULL, 0)",
+                         (pair_name,))
+            cursor = conn.execute("UPDATE leases SET worker_id = ?, expires_at = ? WHERE pair_name = ? AND "
+                                  "(worker_id IS NULL OR worker_id = ? OR expires_at < ?)",
+                                  (worker_id, now + ttl, pair_name, worker_id, now))
+            conn.execute("COMMIT")
+            return cursor.rowcount == 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew(self, worker_id, pair_names, now, ttl):
+        """Продлевает аренду и возвращает пары, которые все еще принадлежат воркеру."""
+        if not pair_names:
+            return set()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            placeholders = ','.join('?' * len(pair_names))
+            conn.execute(f"UPDATE leases SET expires_at = ? WHERE worker_id = ? AND expires_at >= ? "
+                         f"AND pair_name IN ({placeholders})",
+                         (now + ttl, worker_id, now, *pair_names))
+            rows = conn.execute(f"SELECT pair_name FROM leases WHERE worker_id = ? AND expires_at >= ? "
+                                f"AND pair_name IN ({placeholders})",
+                                (worker_id, now + ttl, *pair_names)).fetchall()
+            conn.execute("COMMIT")
+            return {row[0] for row in rows}
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release(self, pair_name, worker_id):
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE leases SET worker_id = NULL, expires_at = 0 WHERE pair_name = ? AND worker_id = ?",
+                         (pair_name, worker_id))
+        finally:
+            conn.close()
+
+    def remove_worker(self, worker_id):
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE leases SET worker_id = NULL, expires_at = 0 WHERE worker_id = ?", (worker_id,))
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+        finally:
+            conn.close()
+
+    def get_leases(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT pair_name, worker_id, expires_at FROM leases ORDER BY pair_name").fetchall()
+            return {row[0]: (row[1], row[2]) for row in rows}
+        finally:
+            conn.close()
+
+
+class LeaseManager:
+    """Захватывает пары через аренду с heartbeat, отдает лишние пары при появлении новых воркеров.
+
+    Отдаваемая пара досылает свою очередь в отдельной задаче, а tick продолжает продлевать и ее аренду,
+    и аренду остальных пар; в хранилище пара освобождается только после остановки ее конвейера.
+    """
+
+    def __init__(self, store, worker_id, pair_names, on_acquire, on_release, ttl=30, heartbeat_interval=10):
+        self.logger = logging.getLogger(__name__)
+        self.store = store
+        self.worker_id = worker_id
+        self.pair_names = list(pair_names)
+        self.on_acquire = on_acquire  # async callable(pair_name)
+        self.on_release = on_release  # async callable(pair_name, graceful)
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.owned = set()
+        self.draining = {}  # pair_name -> Task остановки конвейера отданной пары
+
+    def _preference(self, pair_name):
+        # Rendezvous hashing: каждый воркер предпочитает свой набор пар, что уменьшает перетасовку
+        return hashlib.md5(f"{self.worker_id}:{pair_name}".encode()).hexdigest()
+
+    async def run(self):
+        self.logger.info(f"Worker {self.worker_id} started lease loop for {len(self.pair_names)} pairs")
+        try:
+            while True:
+                try:
+                    await self.tick()
+                except sqlite3.Error as e:
+                    self.logger.error(f"Lease store error for worker {self.worker_id}: {str(e)}")
+                await asyncio.sleep(self.heartbeat_interval)
+        finally:
+            await self.release_all()
+
+    async def tick(self):
+        now = time.time()
+        self.store.heartbeat(self.worker_id, now)
+
+        renewed = self.store.renew(self.worker_id, sorted(self.owned | set(self.draining)), now, self.ttl)
+        for pair_name in sorted(self.owned - renewed):
+            self.logger.warning(f"Worker {self.worker_id} lost lease for pair '{pair_name}'")
+            self.owned.discard(pair_name)
+            await self.on_release(pair_name, False)
+        for pair_name in sorted(set(self.draining) - renewed):
+            self.logger.warning(f"Worker {self.worker_id} lost lease for pair '{pair_name}' while draining it")
+
+        workers = self.store.live_workers(now, self.ttl)
+        share = math.ceil(len(self.pair_names) / max(1, len(workers)))
+
+        if len(self.owned) > share:
+            extras = sorted(self.owned, key=self._preference, reverse=True)[:len(self.owned) - share]
+            for pair_name in extras:
+                self.logger.info(f"Worker {self.worker_id} releasing pair '{pair_name}' for rebalance ({len(workers)} workers)")
+                self.owned.discard(pair_name)
+                self.draining[pair_name] = asyncio.create_task(self._release(pair_name),
+                                                               name=f"release-{pair_name}")
+
+        for pair_name in sorted(self.pair_names, key=self._preference):
+            if len(self.owned) >= share:
+                break
+            if pair_name in self.owned or pair_name in self.draining:
+                continue
+            if self.store.acquire(pair_name, self.worker_id, time.time(), self.ttl):
+                self.logger.info(f"Worker {self.worker_id} acquired pair '{pair_name}'")
+                self.owned.add(pair_name)
+                await self.on_acquire(pair_name)
+
+    async def _release(self, pair_name):
+        try:
+            await self.on_release(pair_name, True)
+        except Exception as e:
+            self.logger.error(f"Worker {self.worker_id} failed to stop pair '{pair_name}': {str(e)}", exc_info=True)
+        finally:
+            self.draining.pop(pair_name, None)
+            self.store.release(pair_name, self.worker_id)
+            self.logger.info(f"Worker {self.worker_id} released pair '{pair_name}'")
+
+    def set_pairs(self, pair_names):
+        """Меняет набор пар на лету; аренды удаленных пар освобождаются, их конвейеры останавливает вызывающий."""
+        self.pair_names = list(pair_names)
+        for pair_name in sorted(self.owned - set(self.pair_names)):
+            self.owned.discard(pair_name)
+            self.store.release(pair_name, self.worker_id)
+            self.logger.info(f"Worker {self.worker_id} dropped lease for removed pair '{pair_name}'")
+
+    async def release_all(self):
+        if self.draining:
+            await asyncio.gather(*self.draining.values(), return_exceptions=True)
+        for pair_name in sorted(self.owned):
+            await self.on_release(pair_name, True)
+        self.owned.clear()
+        self.store.remove_worker(self.worker_id)
+        self.logger.info(f"Worker {self.worker_id} released all leases")
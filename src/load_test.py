@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from .database import Database
+from .repository import Repository
+from .event_dispatcher import EventDispatcher
+from .message_processor import MessageProcessor
+from .bandwidth_governor import LIVE
+from .fake_telegram import FakeTelegram, FakeClientInterface, Latency, build_message
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class _TimedProcessor:
+    """Обертка над процессором пары, фиксирующая момент, когда сообщение дошло до цели."""
+
+    def __init__(self, processor, on_done):
+        self.processor = processor
+        self.on_done = on_done
+
+    async def process_message(self, message):
+        result = await self.processor.process_message(message)
+        self.on_done(message.id)
+        return result
+
+    async def process_group(self, messages):
+        result = await self.processor.process_group(messages)
+        for message in messages:
+            self.on_done(message.id)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.processor, name)
+
+
+class PairProbe:
+    """Замеры одной симулированной пары: время инжекции и доставки каждого сообщения, глубина очереди."""
+
+    def __init__(self, name, source_chat_id, target_chat_id):
+        self.name = name
+        self.source_chat_id = source_chat_id
+        self.target_chat_id = target_chat_id
+        self.injected = {}  # msg_id -> monotonic время события
+        self.latencies = []
+        self.depths = []  # [(секунда теста, глубина очереди)]
+        self._next_id = 1
+
+    def next_id(self):
+        msg_id = self._next_id
+        self._next_id += 1
+        return msg_id
+
+    def done(self, msg_id):
+        injected = self.injected.get(msg_id)
+        if injected is not None:
+            self.latencies.append(time.monotonic() - injected)
+
+
+class ListenLoadTest:
+    """Нагрузочный тест режима listen: события NewMessage с заданной частотой и всплесками для M пар.
+
+    События идут через настоящие EventDispatcher, MessageProcessor и хендлеры поверх фейкового клиента
+    (fake_telegram) с моделируемой задержкой RPC и скоростью заливки. Задержка меряется от инжекции
+    события до возврата процессора, т.е. до отправки в целевой чат и записи в базу.
+    """
+
+    def __init__(self, handlers, pairs=4, rate=1.0, duration=60, burst=0, burst_interval=10, media_ratio=0.3,
+                 media_size=512 * 1024, upload_rate=2 * 1024 * 1024, rpc_latency=0.05, bots=1, queue_size=100,
+                 album_window=1.0, caption_limit=1024, drain_timeout=120):
+        self.logger = logging.getLogger(__name__)
+        self.handlers = handlers
+        self.pairs = pairs
+        self.rate = rate  # событий в секунду на пару
+        self.duration = duration
+        self.burst = burst  # дополнительных событий на пару за один всплеск
+        self.burst_interval = burst_interval
+        self.media_ratio = media_ratio
+        self.media_size = media_size
+        self.caption_limit = caption_limit
+        self.queue_size = queue_size
+        self.album_window = album_window
+        self.drain_timeout = drain_timeout
+        self.world = FakeTelegram(Latency(rpc=rpc_latency, upload_bps=upload_rate))
+        self.client = FakeClientInterface(self.world, bots=bots)
+        self.probes = []
+
+    def _message(self, probe):
+        msg_id = probe.next_id()
+        shape = {'id': msg_id, 'date': int(datetime.now(timezone.utc).timestamp()), 'len': random.randint(20, 400)}
+        if random.random() < self.media_ratio:
+            shape.update({'kind': 'photo', 'size': self.media_size})
+        return build_message(shape, probe.source_chat_id, self.client.client)
+
+    async def _inject(self, probe, count):
+        for _ in range(count):
+            message = self._message(probe)
+            self.world.add_history(probe.source_chat_id, [message])
+            probe.injected[message.id] = time.monotonic()
+            await self.client.client.emit(message)
+
+    async def _generate(self, probe):
+        # Пуассоновский поток с периодическими всплесками; emit ждет обработчик события, как и Telethon
+        started = time.monotonic()
+        next_burst = started + self.burst_interval
+        while time.monotonic() - started < self.duration:
+            await asyncio.sleep(random.expovariate(self.rate) if self.rate else self.duration)
+            now = time.monotonic()
+            if self.burst and now >= next_burst:
+                next_burst += self.burst_interval
+                await self._inject(probe, self.burst)
+            if now - started < self.duration:
+                await self._inject(probe, 1)
+
+    async def _sample_depths(self, dispatcher, started):
+        while True:
+            await asyncio.sleep(0.5)
+            depths = dispatcher.queue_depths()
+            for probe in self.probes:
+                probe.depths.append((time.monotonic() - started, depths.get(probe.name, 0)))
+
+    async def run(self):
+        with tempfile.TemporaryDirectory(prefix='loadtest_') as temp_dir:
+            db_path = os.path.join(temp_dir, 'loadtest.db')
+            Database(db_path)
+            repository = Repository(db_path)
+            dispatcher = EventDispatcher(self.client, self.queue_size, self.album_window, report_interval=0)
+            for i in range(self.pairs):
+                probe = PairProbe(f"load-{i + 1}", -1001000000000 - i, -1002000000000 - i)
+                processor = MessageProcessor(self.client, probe.source_chat_id, probe.target_chat_id, repository, temp_dir,
+                                             self.handlers, self.caption_limit, pair_name=probe.name, priority=LIVE)
+                dispatcher.add_pair(probe.name, probe.source_chat_id, _TimedProcessor(processor, probe.done))
+                self.probes.append(probe)
+
+            self.logger.info(f"Load test: {self.pairs} pairs, {self.rate} events/s per pair, bursts of {self.burst} "
+                             f"every {self.burst_interval}s, for {self.duration}s")
+            dispatcher.start()
+            started = time.monotonic()
+            sampler = asyncio.create_task(self._sample_depths(dispatcher, started))
+            try:
+                await asyncio.gather(*(self._generate(probe) for probe in self.probes))
+                injected_for = time.monotonic() - started
+                for lane in dispatcher.lanes.values():
+                    await lane.drain(self.drain_timeout)
+            finally:
+                sampler.cancel()
+                stats = dispatcher.stats()
+                await dispatcher.stop()
+                for lane in dispatcher.lanes.values():
+                    lane.processor.close()
+        return self._summary(stats, injected_for)
+
+    def _summary(self, stats, injected_for):
+        summary = {}
+        for probe in self.probes:
+            lane = stats[probe.name]
+            depths = [depth for _, depth in probe.depths]
+            # Рост очереди: глубина в конце инжекции против начала, в сообщениях за секунду
+            during = [depth for second, depth in probe.depths if second <= injected_for]
+            growth = (during[-1] - during[0]) / injected_for if len(during) > 1 and injected_for else 0.0
+            summary[probe.name] = {
+                'injected': len(probe.injected),
+                'delivered': len(probe.latencies),
+                'p50': _percentile(probe.latencies, 0.5),
+                'p95': _percentile(probe.latencies, 0.95),
+                'p99': _percentile(probe.latencies, 0.99),
+                'max_depth': max(depths + [lane['max_depth']]),
+                'growth': growth,
+                'spilled': lane['spilled'],
+                'dropped': len(probe.injected) - len(probe.latencies),
+                'failed': lane['failed'],
+            }
+        return summary
+
+    @staticmethod
+    def report(summary):
+        lines = [f"{'pair':<10} {'events':>7} {'done':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max q':>6} "
+                 f"{'q/s':>6} {'spilled':>8} {'dropped':>8} {'failed':>7}"]
+        for name, s in summary.items():
+            lines.append(f"{name:<10} {s['injected']:>7} {s['delivered']:>6} {s['p50'] * 1000:>8.0f} {s['p95'] * 1000:>8.0f} "
+                         f"{s['p99'] * 1000:>8.0f} {s['max_depth']:>6} {s['growth']:>6.2f} {s['spilled']:>8} "
+                         f"{s['dropped']:>8} {s['failed']:>7}")
+        total = {key: sum(s[key] for s in summary.values()) for key in ['injected', 'delivered', 'spilled', 'dropped', 'failed']}
+        lines.append(f"total: {total['injected']} events, {total['delivered']} delivered, {total['spilled']} spilled to "
+                     f"overflow, {total['dropped']} not delivered ({total['failed']} failed)")
+        return '\n'.join(lines)
@@ -6,9 +6,25 @@ from src.handlers.file_handler import FileHandler
 from .config import Config
 from .client import TelegramClientInterface
 from .synchronizer import Synchronizer
+from .event_dispatcher import EventDispatcher, LaneFeed
+from .lease_manager import LeaseStore, LeaseManager
 from .database import Database
 from .repository import Repository
 from .message_processor import MessageProcessor
+from .media_manager import MediaManager
+from .fan_out import FanOutProcessor
+from .archive_processor import ArchiveProcessor
+from .search_index import SearchIndex
+from .sync_planner import SyncPlanner
+from .archive_processor import ARCHIVE_TARGET_ID
+from .bandwidth_governor import LIVE, BACKFILL
+from .config_watcher import ConfigWatcher, diff_pairs
+from .tracing import TraceWriter, wrap_clients
+from .trace_replay import TraceReplayer
+from .load_test import ListenLoadTest
+from .sync_auditor import SyncAuditor
+from .retry_queue import RetryQueue
+from .sync_scheduler import SyncScheduler
 from .handlers.photo_handler import PhotoHandler
 from .handlers.video_handler import VideoHandler
 from .handlers.audio_handler import AudioHandler
@@ -16,13 +32,15 @@ from .handlers.webpage_handler import WebPageHandler
 from .handlers.mixed_media_handler import MixedMediaHandler
 import logging
 import argparse
+import atexit
 import os
+import socket
 
 async def select_pair(config):
     logger = logging.getLogger(__name__)
     print("Available pairs:")
     for i, pair in enumerate(config.pairs, 1):
-        print(f"{i}. {pair.name} (Source: {pair.source_chat_id}, Target: {pair.target_chat_id})")
+        print(f"{i}. {pair.name} (Source: {pair.source_chat_id}, Target: {pair.target_chat_id}{f', Archive: {pair.archive_dir}' if pair.archive_dir else ''})")
 
     while True:
         choice = input("Enter the number of the pair to work with: ")
@@ -41,89 +59,470 @@ async def main(args):
     logger = logging.getLogger(__name__)
     logger.info("Starting Telegram Cloner")
 
-    config = Config.load('./config.yaml')
+    config_path = './config.yaml'
+    config = Config.load(config_path)
     config.setup_logging()
 
     os.makedirs(config.temp_dir, exist_ok=True)
 
     db = Database("telegram_cloner.db")
     repo = Repository("telegram_cloner.db")
-    client = TelegramClientInterface(config)
-    await client.start()
+    search_index = SearchIndex("telegram_search.db")
+    retry_queue = RetryQueue(repo, config.retry_max_attempts, config.retry_base_delay, config.retry_max_delay)
 
     # Регистрация хендлеров
     handlers = [PhotoHandler, VideoHandler, AudioHandler, MixedMediaHandler, FileHandler, WebPageHandler]
 
+    if args.mode == "replay":
+        # Воспроизведение записанной трассы на фейковом клиенте, без подключения к Telegram
+        trace_path = args.trace or input("Enter trace file path: ")
+        replayer = TraceReplayer(trace_path, handlers, args.speed, caption_limit=config.caption_limit)
+        recorded, replayed = await replayer.run()
+        print(TraceReplayer.report(recorded, replayed))
+        return
+    if args.mode == "load-test":
+        # Нагрузочный тест listen-режима на фейковом клиенте с настройками очередей из config.yaml
+        load_test = ListenLoadTest(handlers, pairs=args.pairs, rate=args.rate, duration=args.duration, burst=args.burst,
+                                   burst_interval=args.burst_interval, upload_rate=args.upload_rate * 1024 * 1024,
+                                   bots=len(config.bot_tokens or [config.bot_token]), queue_size=config.listen_queue_size,
+                                   album_window=config.listen_album_window, caption_limit=config.caption_limit)
+        print(ListenLoadTest.report(await load_test.run()))
+        return
+    if args.mode == "search":
+        # Поиск работает только по локальному индексу, без подключения к Telegram
+        query = args.query or input("Enter search query: ")
+        try:
+            rows, elapsed_ms = search_index.search(query, args.limit)
+        except ValueError as e:
+            print(str(e))
+            return
+        for source_chat_id, source_msg_id, target_chat_id, target_msg_id, date, file_name, snippet in rows:
+            location = f"target {target_chat_id}/{target_msg_id}" if target_chat_id else "archive"
+            print(f"{date} source {source_chat_id}/{source_msg_id} -> {location}"
+                  f"{f' [{file_name}]' if file_name else ''}: {snippet}")
+        print(f"{len(rows)} results in {elapsed_ms:.1f} ms")
+        return
+    if args.mode == "stats":
+        # Статистика и пропуски считаются только по локальной базе, без подключения к Telegram
+        # numpy нужен только этому режиму, остальные режимы работают без него
+        from .sync_stats import SyncStats
+        pair_name, source_chat_id, target_chat_id = await select_pair(config)
+        pair = next(pair for pair in config.pairs if pair.name == pair_name)
+        targets = [target_chat_id] if target_chat_id is not None else []
+        if pair.archive_dir:
+            targets.append(ARCHIVE_TARGET_ID)
+        for target in targets:
+            print(SyncStats(repo, source_chat_id, target, top=args.limit).collect().report())
+        return
+
+    if args.mode == "worker":
+        # worker_id - и идентичность аренды, и суффикс своей сессии Telegram, поэтому задается явно и уникален
+        if not args.worker_id:
+            raise ValueError("Worker mode requires --worker-id, unique per worker process "
+                             f"(e.g. {socket.gethostname()}-1)")
+        worker_id = args.worker_id
+        client = TelegramClientInterface(config, session_suffix=worker_id)
+    else:
+        client = TelegramClientInterface(config)
+    await client.start()
+    if args.record_trace:
+        trace_writer = TraceWriter(args.record_trace)
+        wrap_clients(client, trace_writer)
+        # Закрываем gzip при любом завершении процесса, иначе трасса окажется обрезанной
+        atexit.register(trace_writer.close)
+
+    # Один MediaManager на источник: медиа скачивается один раз для всех целей этого источника
+    media_managers = {}
+
+    def create_processors(pair, priority=BACKFILL, attach=True, settings=None):
+        """Процессоры пары: целевой чат и/или локальный архив, с общим MediaManager источника.
+
+        attach=False собирает процессоры без подписки на MediaManager и без открытия архива (см. reload_pairs).
+        settings - конфигурация, из которой берутся лимиты (по умолчанию текущая).
+        """
+        settings = settings or config
+        if pair.source_chat_id not in media_managers:
+            media_managers[pair.source_chat_id] = MediaManager(client, config.temp_dir, settings.album_concurrency, repo)
+        media_manager = media_managers[pair.source_chat_id]
+        processors = {}
+        if pair.target_chat_id is not None:
+            processors[pair.name] = MessageProcessor(client, pair.source_chat_id, pair.target_chat_id, repo, config.temp_dir,
+                                                     handlers, settings.caption_limit, media_manager,
+                                                     settings.album_concurrency, search_index, pair.name, priority,
+                                                     retry_queue, attach)
+        if pair.archive_dir:
+            processors[f"{pair.name}:archive"] = ArchiveProcessor(client, pair.source_chat_id, pair.archive_dir, repo,
+                                                                  config.temp_dir, handlers, settings.caption_limit,
+                                                                  media_manager, pair.archive_compress, search_index,
+                                                                  f"{pair.name}:archive", priority, retry_queue, attach)
+        return processors
+
+    def register_pair(dispatcher, pair):
+        # Live-пары вытесняют backfill в общей полосе
+        for name, processor in create_processors(pair, LIVE).items():
+            dispatcher.add_pair(name, pair.source_chat_id, processor)
+
+    async def unregister_pair(dispatcher, pair, drain=True):
+        for name in [pair.name, f"{pair.name}:archive"]:
+            await dispatcher.remove_pair(name, drain=drain)
+
+    async def reload_pairs(dispatcher, new_config, active):
+        """Применяет новую конфигурацию к работающему процессу; active(pair_name) - обслуживает ли процесс пару."""
+        added, removed, changed = diff_pairs(config.pairs, new_config.pairs)
+        # Сначала собираем конвейеры новых и измененных пар с новыми лимитами: ошибка здесь отклоняет
+        # конфигурацию без изменений. Новые процессоры еще не подписаны на MediaManager и не открыли архив:
+        # пока старая очередь пары досылает свои сообщения, временные файлы ждут только ее, а в архив пишет
+        # один ArchiveStore
+        staged = []
+        try:
+            for pair in added + changed:
+                if active(pair.name):
+                    staged.append((pair, create_processors(pair, LIVE, attach=False, settings=new_config)))
+        except Exception:
+            for _, processors in staged:
+                for processor in processors.values():
+                    processor.close()
+            raise
+
+        # Лимиты применяем до подключения новых очередей, чтобы они создавались уже с ними
+        for name in ['pairs', 'caption_limit', 'album_concurrency', 'listen_queue_size', 'listen_album_window',
+                     'lease_ttl', 'heartbeat_interval', 'upload_rate', 'download_rate', 'retry_max_attempts',
+                     'retry_base_delay', 'retry_max_delay', 'daemon_jitter', 'daemon_overlap']:
+            setattr(config, name, getattr(new_config, name))
+        retry_queue.max_attempts = config.retry_max_attempts
+        retry_queue.base_delay = config.retry_base_delay
+        retry_queue.max_delay = config.retry_max_delay
+        dispatcher.queue_size = config.listen_queue_size
+        dispatcher.set_caption_limit(config.caption_limit)
+        await dispatcher.set_album_window(config.listen_album_window)
+        client.bandwidth.update(config.upload_rate, config.download_rate, {pair.name: pair.weight for pair in config.pairs})
+        for media_manager in media_managers.values():
+            media_manager.album_concurrency = config.album_concurrency
+        # weight уже применен через bandwidth.update, schedule применяет scheduler.set_pairs; конвейер не трогаем
+
+        for pair in removed:
+            if active(pair.name):
+                await unregister_pair(dispatcher, pair)
+        # Измененная пара не теряет маршрут: события копятся в новой очереди, пока старая досылает свои
+        for pair, processors in staged:
+            for name, processor in processors.items():
+                if name in dispatcher.lanes:
+                    await dispatcher.replace_pair(name, pair.source_chat_id, processor)
+                else:
+                    processor.attach()
+                    dispatcher.add_pair(name, pair.source_chat_id, processor)
+            # Цель или архив, убранные из пары
+            for name in [pair.name, f"{pair.name}:archive"]:
+                if name not in processors:
+                    await dispatcher.remove_pair(name)
+        logger.info(f"Reloaded pairs: added {[p.name for p in added]}, removed {[p.name for p in removed]}, "
+                    f"changed {[p.name for p in changed]}")
+
     mode = args.mode
     if mode in ["sync", "sync-threads", "sync-topics", "sync-thread"]:
         pair_name, source_chat_id, target_chat_id = await select_pair(config)
-        processor = MessageProcessor(client, source_chat_id, target_chat_id, repo, config.temp_dir, handlers, config.caption_limit)
-        synchronizer = Synchronizer(client, source_chat_id, target_chat_id, repo, config.temp_dir, processor)
-
-        if mode == "sync":
-            start_date = args.date if args.date else datetime.now() - timedelta(days=1)
-            logger.info(f"Selected sync mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id}) with start date: {start_date}")
-            await synchronizer.sync_history(start_date)
-        elif mode == "sync-threads":
-            start_date = args.date if args.date else datetime.now() - timedelta(days=1)
-            logger.info(f"Selected sync-threads mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id}) with start date: {start_date}")
-            await synchronizer.sync_threads(start_date)
-        elif mode == "sync-topics":
-            logger.info(f"Selected sync-topics mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id})")
-            await synchronizer.sync_topics()
-        elif mode == "sync-thread":
-            default_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-            date_input = input(f"Enter start date (YYYY-MM-DD, default {default_date}): ") or default_date
-            try:
-                start_date = datetime.strptime(date_input, "%Y-%m-%d")
-            except ValueError:
-                logger.error(f"Invalid date format: {date_input}")
-                raise ValueError("Date must be in YYYY-MM-DD format")
+        selected_pairs = [pair for pair in config.pairs if pair.name == pair_name]
+        if args.fan_out:
+            selected_pairs += [pair for pair in config.pairs if pair.source_chat_id == source_chat_id and pair.name != pair_name]
+        processors = [processor for pair in selected_pairs for processor in create_processors(pair).values()]
+        if len(processors) > 1:
+            logger.info(f"Fan-out enabled: source {source_chat_id} feeds {[p.target_chat_id or 'archive' for p in processors]}")
+            processor = FanOutProcessor(processors, config.listen_queue_size)
+        else:
+            processor = processors[0]
+        synchronizer = Synchronizer(client, source_chat_id, target_chat_id, repo, config.temp_dir, processor, args.takeout)
+        # Индекс поиска пишется буфером: сбрасываем его и при ошибке синхронизации
+        try:
+            if mode == "sync":
+                start_date = args.date if args.date else datetime.now() - timedelta(days=1)
+                logger.info(f"Selected sync mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id}) with start date: {start_date}")
+                await synchronizer.sync_history(start_date)
+            elif mode == "sync-threads":
+                start_date = args.date if args.date else datetime.now() - timedelta(days=1)
+                logger.info(f"Selected sync-threads mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id}) with start date: {start_date}")
+                await synchronizer.sync_threads(start_date)
+            elif mode == "sync-topics":
+                if target_chat_id is None:
+                    logger.info(f"Pair '{pair_name}' has no target chat, nothing to sync for topics")
+                    return
+                logger.info(f"Selected sync-topics mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id})")
+                await synchronizer.sync_topics()
+            elif mode == "sync-thread":
+                default_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+                date_input = input(f"Enter start date (YYYY-MM-DD, default {default_date}): ") or default_date
+                try:
+                    start_date = datetime.strptime(date_input, "%Y-%m-%d")
+                except ValueError:
+                    logger.error(f"Invalid date format: {date_input}")
+                    raise ValueError("Date must be in YYYY-MM-DD format")
 
-            source_topics = await synchronizer._get_source_topics()
-            if not source_topics:
-                logger.error(f"No topics found in source chat for pair '{pair_name}' (Source: {source_chat_id})")
-                return
+                source_topics = await synchronizer._get_source_topics()
+                if not source_topics:
+                    logger.error(f"No topics found in source chat for pair '{pair_name}' (Source: {source_chat_id})")
+                    return
 
-            print("Available topics in source chat:")
-            for topic_id, title in source_topics.items():
-                print(f"ID: {topic_id} - {title}")
+                print("Available topics in source chat:")
+                for topic_id, title in source_topics.items():
+                    print(f"ID: {topic_id} - {title}")
 
-            topic_id_input = input("Enter the topic ID to sync: ")
-            try:
-                topic_id = int(topic_id_input)
-                if topic_id not in source_topics:
-                    raise ValueError(f"Topic ID {topic_id} not found in source chat")
-            except ValueError as e:
-                logger.error(f"Invalid topic ID: {e}")
-                raise ValueError("Topic ID must be a valid integer from the list")
-
-            logger.info(f"Selected sync-thread mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id}), topic {topic_id} with start date: {start_date}")
-            await synchronizer.sync_thread(topic_id, start_date)
-    elif mode == "listen":
-        logger.info("Selected listen mode - monitoring all pairs")
-        tasks = []
+                topic_id_input = input("Enter the topic ID to sync: ")
+                try:
+                    topic_id = int(topic_id_input)
+                    if topic_id not in source_topics:
+                        raise ValueError(f"Topic ID {topic_id} not found in source chat")
+                except ValueError as e:
+                    logger.error(f"Invalid topic ID: {e}")
+                    raise ValueError("Topic ID must be a valid integer from the list")
+
+                logger.info(f"Selected sync-thread mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id}), topic {topic_id} with start date: {start_date}")
+                await synchronizer.sync_thread(topic_id, start_date)
+            # Сообщения, упавшие в этом или прошлых запусках и уже созревшие для повтора
+            for pair_processor in processors:
+                while await retry_queue.retry_due(client, pair_processor):
+                    pass
+                await pair_processor.join()
+                logger.info(f"Retry queue for target {pair_processor.target_chat_id}: "
+                            f"{retry_queue.stats(source_chat_id, pair_processor.target_chat_id)}")
+        finally:
+            await search_index.close()
+        logger.info(f"Bandwidth usage: {client.bandwidth.stats()}")
+    elif mode == "plan":
+        pair_name, source_chat_id, target_chat_id = await select_pair(config)
+        selected_pairs = [pair for pair in config.pairs if pair.name == pair_name]
+        if args.fan_out:
+            selected_pairs += [pair for pair in config.pairs if pair.source_chat_id == source_chat_id and pair.name != pair_name]
+        destinations = []
+        for pair in selected_pairs:
+            if pair.target_chat_id is not None:
+                destinations.append((pair.name, pair.target_chat_id))
+            if pair.archive_dir:
+                destinations.append((f"{pair.name}:archive", ARCHIVE_TARGET_ID))
+        start_date = args.date if args.date else datetime.now() - timedelta(days=1)
+        topic_id = None
+        if args.strategy == "sync-thread":
+            topic_id = args.topic if args.topic is not None else int(input("Enter the topic ID to plan: "))
+        logger.info(f"Selected plan mode for '{args.strategy}' of pair '{pair_name}' (Source: {source_chat_id}) with start date: {start_date}")
+        planner = SyncPlanner(client, source_chat_id, destinations, repo, handlers)
+        scanned, plans = await planner.plan(start_date, topic_id=topic_id, threads_only=args.strategy == "sync-threads")
+        print(SyncPlanner.report(scanned, plans))
+    elif mode == "audit":
+        pair_name, source_chat_id, target_chat_id = await select_pair(config)
+        if target_chat_id is None:
+            logger.info(f"Pair '{pair_name}' has no target chat, nothing to audit")
+            return
+        pair = next(pair for pair in config.pairs if pair.name == pair_name)
+        processor = create_processors(pair)[pair.name] if args.repair else None
+        logger.info(f"Selected audit mode for pair '{pair_name}' (Source: {source_chat_id}, Target: {target_chat_id})"
+                    f"{' with repairs' if args.repair else ''}")
+        auditor = SyncAuditor(client, source_chat_id, target_chat_id, repo, processor)
+        try:
+            counts = await auditor.audit(restart=args.restart, start_date=args.date)
+        finally:
+            await search_index.close()
+        print(auditor.report(counts))
+    elif mode in ["listen", "daemon"]:
+        logger.info(f"Selected {mode} mode - monitoring all pairs{' and running scheduled syncs' if mode == 'daemon' else ''}")
+        dispatcher = EventDispatcher(client, config.listen_queue_size, config.listen_album_window)
         for pair in config.pairs:
-            processor = MessageProcessor(client, pair.source_chat_id, pair.target_chat_id, repo, config.temp_dir, handlers, config.caption_limit)
-            synchronizer = Synchronizer(client, pair.source_chat_id, pair.target_chat_id, repo, config.temp_dir, processor)
-            tasks.append(synchronizer.listen_new_messages())
-        await asyncio.gather(*tasks)
+            register_pair(dispatcher, pair)
+
+        async def run_scheduled_sync(pair, start_date):
+            # История идет через очереди пары как backfill: те же процессоры и кеши, что у live-событий, без гонки
+            # с ними, но после них и с уступкой им полосы
+            lanes = [dispatcher.lanes[name] for name in [pair.name, f"{pair.name}:archive"] if name in dispatcher.lanes]
+            synchronizer = Synchronizer(client, pair.source_chat_id, pair.target_chat_id, repo, config.temp_dir,
+                                        LaneFeed(lanes))
+            if pair.schedule_mode == "sync-topics":
+                if pair.target_chat_id is not None:
+                    await synchronizer.sync_topics()
+            elif pair.schedule_mode == "sync-threads":
+                await synchronizer.sync_threads(start_date)
+            else:
+                await synchronizer.sync_history(start_date)
+
+        scheduler = None
+        if mode == "daemon":
+            scheduler = SyncScheduler(repo, config.pairs, run_scheduled_sync, config.daemon_jitter, config.daemon_overlap)
+
+        async def on_config_change(old_config, new_config):
+            if scheduler is not None:
+                # Запуски пар, чьи очереди будут пересозданы, прерываем заранее; они повторятся по расписанию
+                added, removed, changed = diff_pairs(config.pairs, new_config.pairs)
+                await scheduler.cancel([pair.name for pair in removed + changed])
+            await reload_pairs(dispatcher, new_config, lambda name: True)
+            if scheduler is not None:
+                scheduler.jitter = config.daemon_jitter
+                scheduler.overlap = config.daemon_overlap
+                scheduler.set_pairs(config.pairs)
+
+        watcher_task = asyncio.create_task(ConfigWatcher(config_path, config, on_config_change).run())
+        dispatcher.start()
+        retry_task = asyncio.create_task(retry_queue.run(client, lambda: dispatcher.lanes.values()))
+        scheduler_task = asyncio.create_task(scheduler.run()) if scheduler is not None else None
+        try:
+            await client.client.run_until_disconnected()
+        finally:
+            watcher_task.cancel()
+            retry_task.cancel()
+            if scheduler is not None:
+                scheduler_task.cancel()
+                await scheduler.stop()
+            await dispatcher.stop()
+            await search_index.close()
+    elif mode == "worker":
+        logger.info(f"Selected worker mode - worker '{worker_id}' claims pairs through leases in {config.lease_store}")
+        dispatcher = EventDispatcher(client, config.listen_queue_size, config.listen_album_window)
+        pairs_by_name = {pair.name: pair for pair in config.pairs}
+
+        async def on_acquire(pair_name):
+            register_pair(dispatcher, pairs_by_name[pair_name])
+
+        async def on_release(pair_name, graceful):
+            await unregister_pair(dispatcher, pairs_by_name[pair_name], drain=graceful)
+
+        lease_manager = LeaseManager(LeaseStore(config.lease_store), worker_id, pairs_by_name.keys(),
+                                     on_acquire, on_release, config.lease_ttl, config.heartbeat_interval)
+
+        async def on_config_change(old_config, new_config):
+            await reload_pairs(dispatcher, new_config, lambda name: name in lease_manager.owned)
+            pairs_by_name.clear()
+            pairs_by_name.update({pair.name: pair for pair in config.pairs})
+            lease_manager.set_pairs(pairs_by_name.keys())
+            lease_manager.ttl = config.lease_ttl
+            lease_manager.heartbeat_interval = config.heartbeat_interval
+
+        watcher_task = asyncio.create_task(ConfigWatcher(config_path, config, on_config_change).run())
+        dispatcher.start()
+        lease_task = asyncio.create_task(lease_manager.run())
+        retry_task = asyncio.create_task(retry_queue.run(client, lambda: dispatcher.lanes.values()))
+        try:
+            await client.client.run_until_disconnected()
+        finally:
+            watcher_task.cancel()
+            retry_task.cancel()
+            lease_task.cancel()
+            try:
+                await lease_task
+            except asyncio.CancelledError:
+                pass
+            await dispatcher.stop()
+            await search_index.close()
     else:
         logger.error(f"Invalid mode: {mode}")
-        raise ValueError(f"Mode must be 'sync', 'sync-threads', 'sync-topics', 'sync-thread', or 'listen', got '{mode}'")
+        raise ValueError(f"Mode must be 'sync', 'sync-threads', 'sync-topics', 'sync-thread', 'listen', 'daemon', 'worker', 'search', 'plan', 'replay', 'load-test', 'audit' or 'stats', got '{mode}'")
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Telegram Group/Channel Cloner")
     parser.add_argument(
         "mode",
-        choices=["sync", "sync-threads", "sync-topics", "sync-thread", "listen"],
-        help="Operation mode: 'sync' for full history, 'sync-threads' for threads only, 'sync-topics' for topic names only, 'sync-thread' for specific thread, 'listen' for real-time listening"
+        choices=["sync", "sync-threads", "sync-topics", "sync-thread", "listen", "daemon", "worker", "search", "plan", "replay", "load-test", "audit", "stats"],
+        help="Operation mode: 'sync' for full history, 'sync-threads' for threads only, 'sync-topics' for topic names only, 'sync-thread' for specific thread, 'listen' for real-time listening, 'daemon' for real-time listening plus per-pair scheduled incremental syncs, 'worker' for real-time listening on pairs claimed through leases, 'search' for querying the local full-text index, 'plan' for a dry-run estimate of a sync strategy, 'replay' for replaying a recorded client trace offline, 'load-test' for measuring listen-mode latency under simulated load, 'audit' for reconciling source, database and target, 'stats' for sync coverage, gaps, albums and topics from the local database (requires numpy)"
     )
     parser.add_argument(
         "--date",
         type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
         default=None,
-        help="Start date for sync/sync-threads mode (YYYY-MM-DD), defaults to yesterday if not specified"
+        help="Start date for sync/sync-threads/plan mode (YYYY-MM-DD), defaults to yesterday if not specified. In audit mode starts a new audit from the first source message of that date instead of the first message recorded for the pair"
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=["sync", "sync-threads", "sync-thread"],
+        default="sync",
+        help="Sync strategy to estimate in plan mode"
+    )
+    parser.add_argument(
+        "--topic",
+        type=int,
+        default=None,
+        help="Source topic ID for plan mode with the sync-thread strategy, prompted if not specified"
+    )
+    parser.add_argument(
+        "--fan-out",
+        action="store_true",
+        help="In sync and plan modes, feed every pair sharing the selected pair's source chat from one history pass"
+    )
+    parser.add_argument(
+        "--takeout",
+        action="store_true",
+        help="In sync, sync-threads and sync-thread modes, read history and download media through a takeout session with relaxed flood limits, falling back to the regular client if takeout is not granted"
+    )
+    parser.add_argument(
+        "--worker-id",
+        default=None,
+        help="Worker identifier for worker mode, required and unique per process. Each worker uses its own session files (session_<worker-id>) and logs in separately on first start, since sharing one auth key between connected processes gets it revoked"
+    )
+    parser.add_argument(
+        "--query",
+        default=None,
+        help="FTS5 query for search mode (words, \"phrases\", prefix*, AND/OR/NOT), prompted if not specified"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=20,
+        help="Maximum number of results in search mode and of gaps and topics listed in stats mode"
+    )
+    parser.add_argument(
+        "--record-trace",
+        default=None,
+        help="Record every client RPC, history page, download and upload with timings and redacted payload shapes to this gzip trace file"
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="Trace file recorded with --record-trace to replay in replay mode, prompted if not specified"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed factor in replay mode: 1 replays recorded latencies, 10 replays them ten times faster"
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="In audit mode, resend missing, lost and unsynced messages as they are found"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="In audit mode, start over instead of resuming an interrupted audit"
+    )
+    parser.add_argument(
+        "--pairs",
+        type=int,
+        default=4,
+        help="Number of simulated pairs in load-test mode"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="Average NewMessage events per second per pair in load-test mode"
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=0,
+        help="Extra events injected at once per pair every --burst-interval seconds in load-test mode"
+    )
+    parser.add_argument(
+        "--burst-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between bursts in load-test mode"
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=60.0,
+        help="Seconds of event injection in load-test mode"
+    )
+    parser.add_argument(
+        "--upload-rate",
+        type=float,
+        default=2.0,
+        help="Simulated upload speed of the fake bot in MB/s in load-test mode"
     )
     return parser.parse_args()
 
@@ -1,24 +1,269 @@
 import os
 import logging
 import asyncio
+import inspect
+import random
+import time
 import ffmpeg
 import math
 from tqdm import tqdm
 from telethon import utils
+from telethon.errors import FilePartMissingError, FloodWaitError
+from telethon.tl.functions.messages import UploadMediaRequest
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import InputMediaUploadedPhoto, InputMediaUploadedDocument, DocumentAttributeFilename, InputFileBig
+
+# Сколько Telegram гарантированно хранит залитые части; более старую сессию начинаем заново
+UPLOAD_SESSION_TTL = 12 * 3600
+# Лимиты заливки Telegram: файл больше MAX_FILE_SIZE режется на части по TARGET_PART_SIZE
+PART_SIZE = 512 * 1024
+MAX_PARTS = 4000
+MAX_FILE_SIZE = PART_SIZE * MAX_PARTS
+TARGET_PART_SIZE = 1.9 * 1024 * 1024 * 1024
 
 class MediaManager:
-    def __init__(self, client, temp_dir):
+    def __init__(self, client, temp_dir, album_concurrency=4, repository=None):
         self.logger = logging.getLogger(__name__)
         self.client = client
         self.temp_dir = temp_dir
-        self.PART_SIZE = 512 * 1024
-        self.MAX_PARTS = 4000
-        self.MAX_FILE_SIZE = self.PART_SIZE * self.MAX_PARTS
-        self.TARGET_PART_SIZE = 1.9 * 1024 * 1024 * 1024
+        self.PART_SIZE = PART_SIZE
+        self.MAX_PARTS = MAX_PARTS
+        self.MAX_FILE_SIZE = MAX_FILE_SIZE
+        self.TARGET_PART_SIZE = TARGET_PART_SIZE
+        # Файлы больше этого размера (большие файлы Telegram) заливаются частями с сохранением сессии в базе
+        self.RESUMABLE_MIN_SIZE = 10 * 1024 * 1024
+        self.album_concurrency = album_concurrency
+        self.repository = repository
+        # Fan-out: один MediaManager на источник, общий для всех процессоров его целей
+        self.subscribers = set()
+        self._downloads = {}  # file_path -> Task
+        self._message_paths = {}  # message_id -> set(file_path)
+        self._path_messages = {}  # file_path -> message_id
+        self._done = {}  # message_id -> set(subscriber)
+        self._uploaded_media = {}  # (id(bot), file_path) -> медиа, уже залитое этим ботом
+        self._split_parts = {}  # message_id -> [part paths]
+        # Сессии заливки переживают ошибки отправки и удаление временного файла (файл скачается по тому же пути),
+        # удаляются после успешной отправки (_with_upload) или когда Telegram уже не хранит их части
+        if repository is not None:
+            repository.delete_expired_upload_sessions(time.time() - UPLOAD_SESSION_TTL)
+
+    def subscribe(self, subscriber):
+        self.subscribers.add(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        for message_id in list(self._done):
+            self._check_done(message_id)
+
+    @property
+    def is_shared(self):
+        return len(self.subscribers) > 1
+
+    def _track(self, message_id, file_path):
+        self._message_paths.setdefault(message_id, set()).add(file_path)
+        self._path_messages[file_path] = message_id
+
+    def release(self, file_path):
+        """Удаляет временный файл, если он не нужен другим целям того же источника."""
+        message_id = self._path_messages.get(file_path)
+        if self.is_shared and message_id is not None:
+            return
+        self._remove(file_path)
+
+    def done(self, subscriber, message_ids):
+        """Подписчик закончил обработку сообщений; файлы удаляются, когда закончили все подписчики."""
+        for message_id in message_ids:
+            self._done.setdefault(message_id, set()).add(subscriber)
+            self._check_done(message_id)
+
+    def _check_done(self, message_id):
+        if not self._done.get(message_id, set()) >= self.subscribers:
+            return
+        self._done.pop(message_id, None)
+        self._split_parts.pop(message_id, None)
+        for file_path in self._message_paths.pop(message_id, set()):
+            self._remove(file_path)
+
+    def _remove(self, file_path):
+        self._path_messages.pop(file_path, None)
+        for key in [key for key in self._uploaded_media if key[1] == file_path]:
+            del self._uploaded_media[key]
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            self.logger.info(f"Removed temporary file {file_path}")
+
+    async def send_media(self, bot, target_chat_id, method, file, **kwargs):
+        """Отправляет файл(ы); альбомы предварительно заливаются параллельно и отправляются одним запросом."""
+        paths = file if isinstance(file, list) else [file]
+        if isinstance(file, list) and len(file) > 1:
+            file = await self._upload_album(
+                bot, target_chat_id, file,
+                force_document=kwargs.get('force_document', False),
+                supports_streaming=kwargs.get('supports_streaming', False),
+                attributes=kwargs.get('attributes'),
+                progress_callback=kwargs.pop('progress_callback', None)
+            )
+        elif self.is_shared and (id(bot), paths[0]) in self._uploaded_media:
+            # Fan-out: этот бот уже заливал файл для другой цели
+            self.logger.info(f"Reusing uploaded media {paths[0]} for target {target_chat_id}")
+            file = self._uploaded_media[(id(bot), paths[0])]
+            kwargs.pop('progress_callback', None)
+        elif isinstance(file, str) and self._is_resumable(file):
+            progress_callback = self.client.bandwidth.upload_progress(kwargs.pop('progress_callback', None))
+            result = await self._with_upload(bot, file, progress_callback,
+                                             lambda handle: getattr(bot, method)(target_chat_id, file=handle, **kwargs))
+            if self.is_shared and result and not isinstance(result, list) and getattr(result, 'media', None) is not None:
+                self._uploaded_media[(id(bot), paths[0])] = result.media
+            return result
+        elif isinstance(file, str):
+            kwargs['progress_callback'] = self.client.bandwidth.upload_progress(kwargs.get('progress_callback'))
+        result = await getattr(bot, method)(target_chat_id, file=file, **kwargs)
+        if self.is_shared and result and not isinstance(result, list) and getattr(result, 'media', None) is not None:
+            self._uploaded_media[(id(bot), paths[0])] = result.media
+        return result
+
+    async def _upload_album(self, bot, target_chat_id, paths, force_document=False, supports_streaming=False,
+                            attributes=None, progress_callback=None):
+        """Параллельно заливает файлы альбома и превращает их в InputMedia, чтобы отправить альбом одним SendMultiMedia."""
+        peer = await bot.get_input_entity(target_chat_id)
+        semaphore = asyncio.Semaphore(self.album_concurrency)
+        sizes = {path: os.path.getsize(path) for path in paths}
+        total = sum(sizes.values())
+        progress = dict.fromkeys(paths, 0)
+
+        async def upload(path):
+            key = (id(bot), path)
+            if key in self._uploaded_media:
+                progress[path] = sizes[path]
+                return self._uploaded_media[key]
+            async with semaphore:
+                def on_progress(current, _total):
+                    progress[path] = current
+                    if progress_callback:
+                        progress_callback(sum(progress.values()), total)
+
+                input_media = await self._upload_input_media(bot, peer, path, force_document, supports_streaming,
+                                                             attributes, on_progress)
+            if self.is_shared:
+                self._uploaded_media[key] = input_media
+            return input_media
+
+        self.logger.info(f"Pre-uploading album of {len(paths)} files ({total} bytes) for target {target_chat_id}")
+        return list(await asyncio.gather(*(upload(path) for path in paths)))
+
+    async def _upload_input_media(self, bot, peer, path, force_document=False, supports_streaming=False,
+                                  attributes=None, progress_callback=None):
+        async def upload_media(handle):
+            if utils.is_image(path) and not force_document:
+                uploaded = InputMediaUploadedPhoto(file=handle)
+            else:
+                attrs, mime_type = utils.get_attributes(path, attributes=attributes, force_document=force_document,
+                                                        supports_streaming=supports_streaming)
+                uploaded = InputMediaUploadedDocument(file=handle, mime_type=mime_type, attributes=attrs,
+                                                      force_file=force_document)
+            return await bot(UploadMediaRequest(peer=peer, media=uploaded))
+
+        media = await self._with_upload(bot, path, self.client.bandwidth.upload_progress(progress_callback), upload_media)
+        return utils.get_input_media(media, supports_streaming=supports_streaming)
+
+    def _is_resumable(self, path):
+        return self.repository is not None and os.path.getsize(path) > self.RESUMABLE_MIN_SIZE
+
+    def _bot_index(self, bot):
+        for pooled in self.client.bots.bots:
+            if pooled.client is bot:
+                return pooled.index
+        return 0
+
+    async def _with_upload(self, bot, path, progress_callback, use):
+        """Заливает path и передает handle в use; если сервер уже удалил части сессии, заливает файл заново."""
+        for attempt in range(2):
+            handle = await self.upload_file(bot, path, progress_callback)
+            try:
+                result = await use(handle)
+            except FilePartMissingError as e:
+                if attempt or not self._is_resumable(path):
+                    raise
+                self.logger.warning(f"Telegram no longer has part {e.which} of upload session for {path}, uploading again")
+                self.repository.delete_upload_sessions(path)
+                continue
+            if self._is_resumable(path):
+                # Части использованы отправкой, сессия больше не нужна
+                self.repository.delete_upload_sessions(path)
+            return result
+
+    async def upload_file(self, bot, path, progress_callback=None):
+        """Заливает файл; большие файлы идут частями через сессию в базе и после перезапуска докачиваются.
+
+        В базе хранятся file_id сессии и подтвержденные части, поэтому повторная заливка в пределах
+        UPLOAD_SESSION_TTL отправляет только недостающие части.
+        """
+        if not self._is_resumable(path):
+            return await bot.upload_file(path, progress_callback=progress_callback)
+        size = os.path.getsize(path)
+        bot_index = self._bot_index(bot)
+        total_parts = math.ceil(size / self.PART_SIZE)
+        session = self.repository.get_upload_session(path, bot_index)
+        now = time.time()
+        if session and session[1] == size and session[2] == self.PART_SIZE and now - session[3] < UPLOAD_SESSION_TTL:
+            file_id = session[0]
+            confirmed = self.repository.get_upload_parts(path, bot_index)
+            self.logger.info(f"Resuming upload of {path} on bot #{bot_index}: {len(confirmed)} of {total_parts} parts already uploaded")
+        else:
+            file_id = random.getrandbits(63)
+            confirmed = set()
+            self.repository.create_upload_session(path, bot_index, file_id, size, self.PART_SIZE, now)
+
+        uploaded = sum(min(self.PART_SIZE, size - part * self.PART_SIZE) for part in confirmed)
+        unsaved = []
+        try:
+            with open(path, 'rb') as f:
+                for part in range(total_parts):
+                    if part in confirmed:
+                        continue
+                    f.seek(part * self.PART_SIZE)
+                    data = f.read(self.PART_SIZE)
+                    if not await bot(SaveBigFilePartRequest(file_id, part, total_parts, data)):
+                        raise ValueError(f"Telegram did not accept part {part} of {path}")
+                    unsaved.append(part)
+                    uploaded += len(data)
+                    # Подтвержденные части пишем пачками: после падения перезальется не больше пачки
+                    if len(unsaved) >= 16:
+                        self.repository.add_upload_parts(path, bot_index, unsaved)
+                        unsaved = []
+                    if progress_callback:
+                        result = progress_callback(uploaded, size)
+                        if inspect.isawaitable(result):
+                            await result
+        finally:
+            if unsaved:
+                self.repository.add_upload_parts(path, bot_index, unsaved)
+        return InputFileBig(id=file_id, parts=total_parts, name=os.path.basename(path))
+
+    async def download_many(self, items):
+        """Скачивает файлы альбома параллельно (не больше album_concurrency одновременно). items: [(message, file_path)]."""
+        semaphore = asyncio.Semaphore(self.album_concurrency)
+
+        async def download(message, file_path):
+            async with semaphore:
+                return await self.download_media(message, file_path)
+
+        return list(await asyncio.gather(*(download(message, file_path) for message, file_path in items)))
 
     async def download_media(self, message, file_path):
+        """Скачивает медиа один раз для всех целей источника, параллельные запросы того же файла ждут общую загрузку."""
+        self._track(message.id, file_path)
+        task = self._downloads.get(file_path)
+        if task is None:
+            task = asyncio.ensure_future(self._download_media(message, file_path))
+            self._downloads[file_path] = task
+            task.add_done_callback(lambda _: self._downloads.pop(file_path, None))
+        return await asyncio.shield(task)
+
+    async def _download_media(self, message, file_path):
         """Скачивает медиа с поддержкой докачки и прогресс-бара в указанный путь."""
-        file_size = message.media.document.size if hasattr(message.media, 'document') else getattr(message.media, 'size', None)
+        # Размер фото заранее не сверяем: скачивается последний размер из sizes, как и раньше
+        file_size = message.media.size if message.media.kind == 'document' else None
         self.logger.info(f"Starting download of media {message.id} to {file_path}, size: {file_size or 'unknown'} bytes")
 
         current_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
@@ -26,14 +271,13 @@ class MediaManager:
             self.logger.info(f"Media {message.id} already fully downloaded at {file_path}")
             return file_path
 
-        input_file = message.media.document if hasattr(message.media, 'document') else message.media
         with tqdm(total=file_size, unit='B', unit_scale=True, desc=f"Downloading media {message.id}", initial=current_size) as pbar:
             with open(file_path, 'ab' if current_size > 0 else 'wb') as fd:
                 if current_size > 0:
                     fd.seek(current_size)
                     self.logger.info(f"Resuming download from offset {current_size}")
-                async for chunk in self.client.client.iter_download(
-                        input_file,
+                async for chunk in self.client.accounts.iter_download(
+                        message,
                         offset=current_size,
                         chunk_size=1024 * 1024
                 ):
@@ -43,6 +287,7 @@ class MediaManager:
                     except Exception as e:
                         self.logger.error(f"Download interrupted for {message.id} at offset {current_size + pbar.n}: {str(e)}")
                         raise
+                    await self.client.bandwidth.throttle_download(len(chunk))
 
         downloaded_size = os.path.getsize(file_path)
         if file_size and downloaded_size != file_size:
@@ -57,6 +302,10 @@ class MediaManager:
         file_size = os.path.getsize(input_path)
         if file_size <= self.MAX_FILE_SIZE:
             return [input_path]
+        parts = self._split_parts.get(message_id)
+        if parts and all(os.path.exists(part) for part in parts):
+            self.logger.info(f"Reusing {len(parts)} already split parts for message {message_id}")
+            return list(parts)
 
         probe = ffmpeg.probe(input_path)
         duration = float(probe['format']['duration'])
@@ -72,10 +321,144 @@ class MediaManager:
                 stream = ffmpeg.input(input_path, ss=i * part_duration, t=part_duration)
                 stream = ffmpeg.output(stream, output_file, c='copy', f='mp4', map_metadata='-1', reset_timestamps=1,
                                        loglevel='quiet')
-                ffmpeg.run(stream)
+                ffmpeg.run(stream, overwrite_output=True)
                 output_files.append(output_file)
+                self._track(message_id, output_file)
             except ffmpeg.Error as e:
                 self.logger.error(f"Failed to cut part {i + 1} for message {message_id}: {str(e)}")
                 raise
 
-        return output_files
\ No newline at end of file
+        self._split_parts[message_id] = list(output_files)
+        return output_files
+
+    @staticmethod
+    def _copy_range(input_path, output_path, offset, length):
+        """Копирует диапазон файла средствами ядра (copy_file_range/sendfile), не читая данные в Python."""
+        with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+            copied = 0
+            while copied < length:
+                count = min(length - copied, 64 * 1024 * 1024)
+                if hasattr(os, 'copy_file_range'):
+                    try:
+                        n = os.copy_file_range(src.fileno(), dst.fileno(), count, offset + copied)
+                    except OSError:
+                        n = os.sendfile(dst.fileno(), src.fileno(), offset + copied, count)
+                else:
+                    n = os.sendfile(dst.fileno(), src.fileno(), offset + copied, count)
+                if n == 0:
+                    break
+                copied += n
+        return copied
+
+    async def split_file(self, input_path, message_id, part_size=None):
+        """Режет файл на тома .001, .002, ... и отдает пути частей по мере готовности."""
+        part_size = int(part_size or self.TARGET_PART_SIZE)
+        file_size = os.path.getsize(input_path)
+        num_parts = math.ceil(file_size / part_size)
+        for i in range(num_parts):
+            offset = i * part_size
+            length = min(part_size, file_size - offset)
+            part_path = f"{input_path}.{i + 1:03d}"
+            self._track(message_id, part_path)
+            if os.path.exists(part_path) and os.path.getsize(part_path) == length:
+                self.logger.info(f"Reusing volume part {i + 1} of {num_parts} for message {message_id}")
+            else:
+                self.logger.info(f"Writing volume part {i + 1} of {num_parts} for message {message_id} ({length} bytes)")
+                copied = await asyncio.to_thread(self._copy_range, input_path, part_path, offset, length)
+                if copied != length:
+                    raise ValueError(f"Volume part {part_path} is incomplete: {copied}/{length} bytes")
+            yield part_path, i + 1, num_parts
+
+    async def _retry_flood(self, operation, name, max_attempts=5):
+        """Повторяет одну операцию на том же боте после FloodWait (залитые им части годятся только для него)."""
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return await operation()
+            except FloodWaitError as e:
+                if attempt == max_attempts:
+                    raise
+                self.logger.warning(f"Flood wait {e.seconds}s on {name}, attempt {attempt}")
+                await asyncio.sleep(e.seconds)
+
+    async def send_split_file(self, bot, target_chat_id, input_path, message_id, file_name, caption='',
+                              formatting_entities=None, reply_to=None, progress_callback=None, caption_limit=None):
+        """Отправляет большой документ томами: каждая часть заливается сразу после нарезки, затем альбомы с манифестом.
+
+        Файл режется один раз; при FloodWait повторяется только упавшая заливка или отправка на том же боте,
+        а не вся операция. Части и манифест удаляются и при ошибке.
+        """
+        peer = await bot.get_input_entity(target_chat_id)
+        file_size = os.path.getsize(input_path)
+        semaphore = asyncio.Semaphore(self.album_concurrency)
+        progress = {}
+        uploads = []
+        parts = []
+        part_paths = []
+        manifest_path = f"{input_path}.manifest.txt"
+
+        async def upload(part_path, part_name):
+            async with semaphore:
+                def on_progress(current, _total):
+                    progress[part_path] = current
+                    if progress_callback:
+                        progress_callback(sum(progress.values()), file_size)
+
+                input_media = await self._retry_flood(
+                    lambda: self._upload_input_media(
+                        bot, peer, part_path, force_document=True,
+                        attributes=[DocumentAttributeFilename(file_name=part_name)], progress_callback=on_progress),
+                    f"upload of {part_name}")
+            self.release(part_path)
+            return input_media
+
+        try:
+            async for part_path, index, num_parts in self.split_file(input_path, message_id):
+                part_name = f"{file_name}.{index:03d}"
+                part_paths.append(part_path)
+                parts.append((part_name, os.path.getsize(part_path)))
+                uploads.append(asyncio.ensure_future(upload(part_path, part_name)))
+                # Не нарезаем больше частей, чем успеваем заливать, чтобы не удваивать место на диске
+                pending = [task for task in uploads if not task.done()]
+                if len(pending) >= self.album_concurrency:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            media = list(await asyncio.gather(*uploads))
+
+            self._track(message_id, manifest_path)
+            with open(manifest_path, 'w') as f:
+                f.write(f"file: {file_name}\nsize: {file_size}\nparts: {len(parts)}\n")
+                for part_name, size in parts:
+                    f.write(f"{part_name} {size}\n")
+                f.write(f"\nreassemble: cat {' '.join(name for name, _ in parts)} > {file_name}\n")
+            media.append(await self._retry_flood(
+                lambda: self._upload_input_media(
+                    bot, peer, manifest_path, force_document=True,
+                    attributes=[DocumentAttributeFilename(file_name=f"{file_name}.manifest.txt")]),
+                f"upload of {file_name}.manifest.txt"))
+
+            # Подпись исходного сообщения идет первой, чтобы offsets formatting_entities остались верными
+            captions = [f"{caption or ''}\n\nРазрезанный файл {file_name}. Часть {i} из {len(parts)}".strip()
+                        for i in range(1, len(parts) + 1)] + [f"Манифест для сборки {file_name}"]
+            if caption_limit:
+                captions = [c[:caption_limit] for c in captions]
+            sent_messages = []
+            # В одном альбоме не больше 10 файлов
+            for start in range(0, len(media), 10):
+                sent = await self._retry_flood(
+                    lambda: bot.send_file(
+                        target_chat_id,
+                        file=media[start:start + 10],
+                        caption=captions[start:start + 10],
+                        force_document=True,
+                        reply_to=reply_to,
+                        formatting_entities=formatting_entities if start == 0 else None
+                    ),
+                    f"send of volume album {start // 10 + 1} for message {message_id}")
+                sent_messages.extend(sent if isinstance(sent, list) else [sent])
+        finally:
+            for task in uploads:
+                if not task.done():
+                    task.cancel()
+            for path in part_paths + [manifest_path]:
+                self.release(path)
+        self.logger.info(f"Sent {len(parts)} volume parts and manifest for message {message_id} to {target_chat_id}")
+        return sent_messages[0] if sent_messages else None
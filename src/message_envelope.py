@@ -0,0 +1,128 @@
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage, Photo, Document
+
+
+def download_location(media):
+    """Минимальный TL-объект для iter_download: фото/документ без превью, атрибутов и прочих полей медиа."""
+    if isinstance(media, MessageMediaPhoto) and isinstance(media.photo, Photo):
+        photo = media.photo
+        # Telethon скачивает фото по последнему размеру из sizes, остальные размеры не нужны
+        return Photo(id=photo.id, access_hash=photo.access_hash, file_reference=photo.file_reference, date=photo.date,
+                     sizes=photo.sizes[-1:], dc_id=photo.dc_id)
+    if isinstance(media, MessageMediaDocument) and isinstance(media.document, Document):
+        document = media.document
+        return Document(id=document.id, access_hash=document.access_hash, file_reference=document.file_reference,
+                        date=document.date, mime_type=document.mime_type, size=document.size, dc_id=document.dc_id,
+                        attributes=[])
+    return None
+
+
+class ReplyRef:
+    """Поля reply_to, которые нужны конвейеру (те же имена, что у MessageReplyHeader)."""
+
+    __slots__ = ('reply_to_msg_id', 'reply_to_top_id', 'forum_topic')
+
+    def __init__(self, reply_to_msg_id, reply_to_top_id=None, forum_topic=False):
+        self.reply_to_msg_id = reply_to_msg_id
+        self.reply_to_top_id = reply_to_top_id
+        self.forum_topic = forum_topic
+
+
+class MediaDescriptor:
+    """Описание медиа сообщения для хендлеров и ссылка на скачивание.
+
+    voice, round и video - флаги MessageMediaDocument, у остальных медиа они None (у них нет этих полей).
+    Поля ext, mime_type, name и size совпадают с telethon File, поэтому envelope.file отдает сам дескриптор.
+    """
+
+    __slots__ = ('kind', 'photo', 'webpage', 'voice', 'round', 'video', 'mime_type', 'ext', 'name', 'size',
+                 'attributes', 'location')
+
+    def __init__(self, kind, photo=False, webpage=False, voice=None, round=None, video=None, mime_type=None, ext='',
+                 name=None, size=None, attributes=(), location=None):
+        self.kind = kind  # 'photo', 'document', 'webpage' или 'other'
+        self.photo = photo
+        self.webpage = webpage
+        self.voice = voice
+        self.round = round
+        self.video = video
+        self.mime_type = mime_type
+        self.ext = ext
+        self.name = name
+        self.size = size
+        self.attributes = attributes
+        self.location = location
+
+    @classmethod
+    def from_message(cls, message):
+        media = message.media
+        if not media:
+            return None
+        file = message.file
+        fields = {
+            'mime_type': file.mime_type if file else None,
+            'ext': (file.ext if file else None) or '',
+            'name': file.name if file else None,
+            'size': file.size if file else None,
+            'location': download_location(media),
+        }
+        if isinstance(media, MessageMediaPhoto):
+            return cls('photo', photo=True, **fields)
+        if isinstance(media, MessageMediaDocument):
+            document = media.document
+            attributes = tuple(getattr(document, 'attributes', None) or ())
+            return cls('document', voice=bool(media.voice), round=bool(media.round), video=bool(media.video),
+                       attributes=attributes, **fields)
+        if isinstance(media, MessageMediaWebPage):
+            return cls('webpage', webpage=bool(media.webpage), **fields)
+        return cls('other', photo=hasattr(media, 'photo'), **fields)
+
+    def is_mime(self, prefix):
+        return (self.mime_type or '').startswith(prefix)
+
+    def __repr__(self):
+        return (f"MediaDescriptor(kind={self.kind!r}, mime_type={self.mime_type!r}, size={self.size}, name={self.name!r}, "
+                f"voice={self.voice}, round={self.round}, video={self.video})")
+
+
+class MessageEnvelope:
+    """Компактная копия сообщения, снятая один раз на входе в конвейер.
+
+    Очереди пар, альбомы и хендлеры держат envelope вместо telethon Message, поэтому в буферах не остаются
+    raw TL-объекты, клиент, сущности чата и превью медиа. Имена полей совпадают с Message (id, date, grouped_id,
+    reply_to, message, entities, media, file), так что envelope можно передавать туда, где ждали сообщение.
+    """
+
+    __slots__ = ('id', 'chat_id', 'date', 'grouped_id', 'reply_to', 'message', 'entities', 'media')
+
+    def __init__(self, id, chat_id, date, grouped_id=None, reply_to=None, message='', entities=None, media=None):
+        self.id = id
+        self.chat_id = chat_id
+        self.date = date
+        self.grouped_id = grouped_id
+        self.reply_to = reply_to
+        self.message = message
+        self.entities = entities
+        self.media = media
+
+    @classmethod
+    def from_message(cls, message):
+        reply_to = getattr(message, 'reply_to', None)
+        if reply_to is not None:
+            reply_to = ReplyRef(getattr(reply_to, 'reply_to_msg_id', None), getattr(reply_to, 'reply_to_top_id', None),
+                                bool(getattr(reply_to, 'forum_topic', False)))
+        return cls(message.id, message.chat_id, message.date, message.grouped_id, reply_to, message.message or '',
+                   list(message.entities) if message.entities else None, MediaDescriptor.from_message(message))
+
+    @classmethod
+    def wrap(cls, message):
+        """Envelope сообщения; уже готовый envelope возвращается как есть."""
+        if message is None or isinstance(message, cls):
+            return message
+        return cls.from_message(message)
+
+    @property
+    def file(self):
+        return self.media
+
+    def __repr__(self):
+        return f"MessageEnvelope(id={self.id}, chat_id={self.chat_id}, grouped_id={self.grouped_id}, media={self.media!r})"
@@ -2,11 +2,15 @@
 import asyncio
 import logging
 
-from .media_manager import MediaManager
+from .media_manager import MediaManager, PART_SIZE, MAX_PARTS, MAX_FILE_SIZE
+from .send_journal import SendJournal
+from .message_envelope import MessageEnvelope
+from .bandwidth_governor import current_flow, BACKFILL
 
 
 class MessageProcessor:
-    def __init__(self, client, source_chat_id, target_chat_id, repository, temp_dir, handlers, caption_limit):
+    def __init__(self, client, source_chat_id, target_chat_id, repository, temp_dir, handlers, caption_limit, media_manager=None,
+                 album_concurrency=4, search_index=None, pair_name=None, priority=BACKFILL, retry_queue=None, attach=True):
         self.logger = logging.getLogger(__name__)
         self.logger.info(f"Initializing MessageProcessor for source {source_chat_id} to target {target_chat_id}")
         self.client = client
@@ -16,14 +20,61 @@ class MessageProcessor:
         self.temp_dir = temp_dir
         self.caption_limit = caption_limit  # Новый параметр
         self.message_map = {}
-        self.media_manager = MediaManager(client, temp_dir)
+        # Процессоры целей одного источника делят MediaManager, чтобы скачивать медиа один раз
+        self.media_manager = media_manager or MediaManager(client, temp_dir, album_concurrency, repository)
+        # attach=False: процессор собран, но еще не подписан (горячая замена пары, см. attach)
+        if attach:
+            self.attach()
         self.handlers = [handler(self) for handler in handlers]  # Передаем self с caption_limit в хендлеры
-        self.PART_SIZE = 512 * 1024
-        self.MAX_PARTS = 4000
-        self.MAX_FILE_SIZE = self.PART_SIZE * self.MAX_PARTS
+        self.PART_SIZE = PART_SIZE
+        self.MAX_PARTS = MAX_PARTS
+        self.MAX_FILE_SIZE = MAX_FILE_SIZE
         self.processed_group_ids = set()
+        # Write-ahead журнал отправок: защищает от дублей в цели после падения между отправкой и записью в базу
+        self.journal = SendJournal(client, repository, source_chat_id, target_chat_id, self.MAX_FILE_SIZE)
+        self.search_index = search_index
+        # Поток BandwidthGovernor, от имени которого идут скачивания и заливки этого процессора;
+        # priority в process_message/process_group меняет класс для одного сообщения (история в live-очереди)
+        self.pair_name = pair_name or f"{source_chat_id}->{target_chat_id}"
+        self.priority = priority
+        # С очередью повторов ошибка сообщения не прерывает конвейер (см. RetryQueue)
+        self.retry_queue = retry_queue
+
+    async def process_message(self, message, priority=None):
+        message = MessageEnvelope.wrap(message)
+        token = current_flow.set((self.pair_name, self.priority if priority is None else priority))
+        try:
+            if self.retry_queue is not None:
+                return await self.retry_queue.guard(self, [message], lambda: self._process_message(message))
+            return await self._process_message(message)
+        finally:
+            current_flow.reset(token)
+            self.media_manager.done(self, [message.id])
+
+    async def process_group(self, messages, priority=None):
+        """Обрабатывает уже собранный альбом без дополнительных запросов истории."""
+        messages = [MessageEnvelope.wrap(msg) for msg in messages]
+        token = current_flow.set((self.pair_name, self.priority if priority is None else priority))
+        try:
+            if self.retry_queue is not None:
+                return await self.retry_queue.guard(self, messages, lambda: self._process_group(messages))
+            return await self._process_group(messages)
+        finally:
+            current_flow.reset(token)
+            self.media_manager.done(self, [msg.id for msg in messages])
+
+    async def join(self):
+        """Ожидает завершения отложенной обработки; у одиночного процессора ее нет."""
+        return None
+
+    def attach(self):
+        """Подписывает процессор на общий MediaManager; до этого он не держит временные файлы источника."""
+        self.media_manager.subscribe(self)
 
-    async def process_message(self, message):
+    def close(self):
+        self.media_manager.unsubscribe(self)
+
+    async def _process_message(self, message):
         source_reply_to_msg_id = 0
         source_reply_to_top_id = 0
         if hasattr(message, 'reply_to') and message.reply_to:
@@ -52,19 +103,44 @@ class MessageProcessor:
 
         return await self._process_single_message(message, source_reply_to_msg_id, source_reply_to_top_id)
 
+    async def _process_group(self, messages):
+        messages = sorted(messages, key=lambda m: m.id)
+        if len(messages) == 1:
+            return await self._process_message(messages[0])
+
+        lead_message = messages[0]
+        source_reply_to_msg_id = 0
+        source_reply_to_top_id = 0
+        if hasattr(lead_message, 'reply_to') and lead_message.reply_to:
+            source_reply_to_msg_id = lead_message.reply_to.reply_to_msg_id
+            if getattr(lead_message.reply_to, 'forum_topic', False) and lead_message.reply_to.reply_to_top_id:
+                source_reply_to_top_id = lead_message.reply_to.reply_to_top_id
+
+        if self.source_chat_id not in self.message_map:
+            self.message_map[self.source_chat_id] = {}
+        if self.target_chat_id not in self.message_map[self.source_chat_id]:
+            self.message_map[self.source_chat_id][self.target_chat_id] = {}
+
+        messages = [msg for msg in messages if msg.id not in self.processed_group_ids]
+        if not messages:
+            self.logger.info(f"Skipping group {lead_message.grouped_id} - already processed")
+            return None
+        self.logger.info(f"Processing coalesced group {lead_message.grouped_id} of {len(messages)} messages")
+        return await self._process_group_messages(messages, source_reply_to_msg_id, source_reply_to_top_id)
+
     async def _collect_group_messages(self, message):
         grouped_id = message.grouped_id
         group_messages = [message]
         self.logger.info(f"Collecting group messages for grouped_id {grouped_id} starting from message {message.id}")
 
-        async for msg in self.client.client.iter_messages(
+        async for msg in self.client.accounts.iter_messages(
                 self.source_chat_id,
                 min_id=message.id - 1,
                 limit=30,
                 reverse=True
         ):
             if msg.grouped_id == grouped_id and msg.id != message.id:
-                group_messages.append(msg)
+                group_messages.append(MessageEnvelope.from_message(msg))
                 self.logger.info(f"Added message {msg.id} to group {grouped_id}")
 
         return group_messages if len(group_messages) > 1 else None
@@ -113,22 +189,32 @@ class MessageProcessor:
                 self.logger.info(
                     f"Reuploading group message {lead_message.id} from {message_date} due to missing target ID {target_msg_id}")
 
+        reconciled_id = await self.journal.reconcile(messages)
+        if reconciled_id:
+            for msg in messages:
+                self._store_message_mapping(msg.id, reconciled_id)
+            return None
+
         target_reply_to_msg_id = self._get_target_reply_to_msg_id(source_reply_to_msg_id, source_reply_to_top_id)
 
         for handler in self.handlers:
             if handler.supports(messages):
                 self.logger.info(
                     f"Selected handler {handler.__class__.__name__} for group message {lead_message.id} from {message_date}")
+                random_id = self.journal.begin(messages)
                 result = await handler.handle(messages, target_reply_to_msg_id)  # Здесь уже всё передано через self
                 if result:
                     target_id = result[0].id if isinstance(result, list) else result.id
-                    # Обновляем базу и маппинг для всех сообщений группы
+                    # Обновляем базу (вместе с закрытием записи журнала) и маппинг для всех сообщений группы
+                    self.journal.complete(random_id, messages, target_id)
                     for msg in messages:
-                        self.repository.update_message(msg.id, self.source_chat_id, self.target_chat_id, target_id)
                         self._store_message_mapping(msg.id, target_id)
+                        self._index_message(msg, target_id)
                     self.logger.info(
                         f"Processed group message {lead_message.id} from {message_date} to {target_id} with reply_to {target_reply_to_msg_id}")
                     await asyncio.sleep(0.1)
+                else:
+                    self.journal.abort(random_id)
                 return result
         self.logger.error(f"No handler supports media type in group message {lead_message.id} from {message_date}")
         return None
@@ -158,19 +244,29 @@ class MessageProcessor:
                 self.logger.info(
                     f"Reuploading message {message.id} from {message_date} due to missing target ID {target_msg_id}")
 
+        if not message.media and not message.message:
+            self.logger.warning(f"Skipped message {message.id} from {message_date} - no content")
+            return None
+
+        reconciled_id = await self.journal.reconcile([message])
+        if reconciled_id:
+            self._store_message_mapping(message.id, reconciled_id)
+            return None
+
         target_reply_to_msg_id = self._get_target_reply_to_msg_id(source_reply_to_msg_id, source_reply_to_top_id)
 
+        random_id = self.journal.begin([message])
         if message.media:
             result = await self._handle_media(message, target_reply_to_msg_id)
-        elif message.message:
-            result = await self._handle_text(message, target_reply_to_msg_id)
         else:
-            self.logger.warning(f"Skipped message {message.id} from {message_date} - no content")
-            return None
+            result = await self._handle_text(message, target_reply_to_msg_id)
 
-        if result:
-            self.repository.update_message(message.id, self.source_chat_id, self.target_chat_id, result.id)
+        if not result:
+            self.journal.abort(random_id)
+        else:
+            self.journal.complete(random_id, [message], result.id)
             self._store_message_mapping(message.id, result.id)
+            self._index_message(message, result.id)
             self.logger.info(
                 f"Processed message {message.id} from {message_date} to {result.id} with reply_to {target_reply_to_msg_id}")
             await asyncio.sleep(0.1)
@@ -230,15 +326,16 @@ class MessageProcessor:
                     f"Selected handler {handler.__class__.__name__} for message {message.id} from {message_date}")
                 return await handler.handle(message, target_reply_to_msg_id)  # Здесь уже всё передано через self
         self.logger.error(
-            f"No handler supports media type in message {message.id} from {message_date}, message dump: {message.__dict__}")
+            f"No handler supports media type in message {message.id} from {message_date}, message dump: {message!r}")
         return None
 
     async def _handle_text(self, message, target_reply_to_msg_id):
         message_date = message.date.strftime('%Y-%m-%d %H:%M:%S')
         text = self._process_links(message.message)
         self.logger.info(f"Sending text message {message.id} from {message_date}")
-        sent_message = await self.client.bot.send_message(
+        sent_message = await self.client.bots.call(
             self.target_chat_id,
+            'send_message',
             text,
             reply_to=target_reply_to_msg_id if target_reply_to_msg_id != 0 else None,
             link_preview=False,
@@ -254,6 +351,10 @@ class MessageProcessor:
                 text = text.replace(f'message{old_id}', f'message{new_id}')
         return text
 
+    def _index_message(self, message, target_id):
+        if self.search_index is not None:
+            self.search_index.add(message, self.source_chat_id, self.target_chat_id, target_id)
+
     def _store_message_mapping(self, source_id, target_id):
         self.logger.info(f"Mapping source {source_id} to target {target_id}")
         self.message_map[self.source_chat_id][self.target_chat_id][source_id] = target_id
\ No newline at end of file
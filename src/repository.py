@@ -40,6 +40,22 @@ class Repository:
             conn.commit()
             self.logger.debug(f"Deleted topic {source_topic_id} for source {source_chat_id} to target {target_chat_id}")
 
+    def save_topics(self, source_chat_id, target_chat_id, rows, synced=1):
+        """rows: список (source_topic_id, title, target_topic_id), записывается одной транзакцией."""
+        if not rows:
+            return
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO topics (source_topic_id, source_chat_id, target_chat_id, target_topic_id, title, synced)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source_topic_id, source_chat_id, target_chat_id)
+                DO UPDATE SET target_topic_id = excluded.target_topic_id, title = excluded.title, synced = excluded.synced
+            """, [(source_topic_id, source_chat_id, target_chat_id, target_topic_id, title, synced)
+                  for source_topic_id, title, target_topic_id in rows])
+            conn.commit()
+            self.logger.debug(f"Saved {len(rows)} topics for source {source_chat_id} to target {target_chat_id}")
+
     def get_all_topics(self, source_chat_id, target_chat_id):
         with self._connect() as conn:
             cursor = conn.cursor()
@@ -68,4 +84,319 @@ class Repository:
             cursor.execute("UPDATE messages SET target_msg_id = ?, synced = ? WHERE source_msg_id = ? AND source_chat_id = ? AND target_chat_id = ?",
                           (target_msg_id, synced, source_msg_id, source_chat_id, target_chat_id))
             conn.commit()
-            self.logger.debug(f"Updated message {source_msg_id} for source {source_chat_id} to target {target_chat_id} with target ID {target_msg_id}")
\ No newline at end of file
+            self.logger.debug(f"Updated message {source_msg_id} for source {source_chat_id} to target {target_chat_id} with target ID {target_msg_id}")
+
+    def get_synced_ids(self, source_chat_id, target_chat_id):
+        """Множество уже синхронизированных source_msg_id цели одним запросом."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT source_msg_id FROM messages WHERE source_chat_id = ? AND target_chat_id = ? AND synced = 1",
+                          (source_chat_id, target_chat_id))
+            return {row[0] for row in cursor}
+
+    def iter_message_chunks(self, source_chat_id, target_chat_id, chunk_size):
+        """Строки messages цели по возрастанию source_msg_id порциями по chunk_size, keyset-пагинацией по первичному ключу.
+
+        Порция приходит одной строкой 'source_msg_id,target_msg_id,synced,topic_id,...' из group_concat: SQLite
+        склеивает ее сам, без Python-кортежа на строку, а NULL заменены на 0. Отдает (число строк, текст).
+        """
+        last_id = -1
+        while True:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT COUNT(*), MAX(source_msg_id),
+                           group_concat(source_msg_id || ',' || COALESCE(target_msg_id, 0) || ',' ||
+                                        COALESCE(synced, 0) || ',' || COALESCE(topic_id, 0))
+                    FROM (SELECT source_msg_id, target_msg_id, synced, topic_id FROM messages
+                          WHERE source_chat_id = ? AND target_chat_id = ? AND source_msg_id > ?
+                          ORDER BY source_msg_id LIMIT ?)
+                """, (source_chat_id, target_chat_id, last_id, chunk_size))
+                count, last_id, text = cursor.fetchone()
+            if not count:
+                return
+            yield count, text
+            if count < chunk_size:
+                return
+
+    def add_sync_run(self, source_chat_id, target_chat_id, mode, started_at, finished_at, messages, size):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO sync_runs (source_chat_id, target_chat_id, mode, started_at, finished_at, messages, bytes) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (source_chat_id, target_chat_id, mode, started_at, finished_at, messages, size))
+            conn.commit()
+            self.logger.debug(f"Recorded {mode} run for source {source_chat_id} to target {target_chat_id}: {messages} messages, {size} bytes")
+
+    def get_throughput(self, source_chat_id, target_chat_id, runs=10):
+        """(сообщений, байт, секунд) за последние runs запусков с переданной работой; без истории цели берет все цели."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            query = """
+                SELECT COALESCE(SUM(messages), 0), COALESCE(SUM(bytes), 0), COALESCE(SUM(finished_at - started_at), 0)
+                FROM (SELECT messages, bytes, started_at, finished_at FROM sync_runs
+                      WHERE messages > 0 {condition} ORDER BY id DESC LIMIT ?)
+            """
+            cursor.execute(query.format(condition="AND source_chat_id = ? AND target_chat_id = ?"),
+                           (source_chat_id, target_chat_id, runs))
+            result = cursor.fetchone()
+            if not result[0]:
+                cursor.execute(query.format(condition=""), (runs,))
+                result = cursor.fetchone()
+            return result
+
+    def get_message_range(self, source_chat_id, target_chat_id, min_id, max_id):
+        """Строки messages для source_msg_id в [min_id, max_id): (source_msg_id, target_msg_id, synced)."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT source_msg_id, target_msg_id, synced FROM messages WHERE source_chat_id = ? AND target_chat_id = ? AND source_msg_id >= ? AND source_msg_id < ?",
+                          (source_chat_id, target_chat_id, min_id, max_id))
+            return cursor.fetchall()
+
+    def get_max_message_id(self, source_chat_id, target_chat_id):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(source_msg_id), 0) FROM messages WHERE source_chat_id = ? AND target_chat_id = ?",
+                          (source_chat_id, target_chat_id))
+            return cursor.fetchone()[0]
+
+    def get_min_message_id(self, source_chat_id, target_chat_id):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MIN(source_msg_id), 0) FROM messages WHERE source_chat_id = ? AND target_chat_id = ?",
+                          (source_chat_id, target_chat_id))
+            return cursor.fetchone()[0]
+
+    def get_audit_cursor(self, source_chat_id, target_chat_id):
+        """(last_id, max_id, completed, started_at, first_id) курсора аудита или None."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT last_id, max_id, completed, started_at, first_id FROM audit_cursors WHERE source_chat_id = ? AND target_chat_id = ?",
+                          (source_chat_id, target_chat_id))
+            return cursor.fetchone()
+
+    def start_audit(self, source_chat_id, target_chat_id, first_id, max_id, started_at):
+        """Начинает аудит ids first_id..max_id с нуля: сбрасывает курсор и находки прошлого прохода."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT OR REPLACE INTO audit_cursors (source_chat_id, target_chat_id, last_id, max_id, completed, started_at, updated_at, first_id) VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                          (source_chat_id, target_chat_id, first_id - 1, max_id, started_at, started_at, first_id))
+            cursor.execute("DELETE FROM audit_findings WHERE source_chat_id = ? AND target_chat_id = ?",
+                          (source_chat_id, target_chat_id))
+            conn.commit()
+            self.logger.debug(f"Started audit of source {source_chat_id} against target {target_chat_id} for ids {first_id}..{max_id}")
+
+    def save_audit_window(self, source_chat_id, target_chat_id, last_id, findings, updated_at, completed=False):
+        """Атомарно записывает находки окна и сдвигает курсор; findings: [(source_msg_id, kind, target_msg_id, repaired)]."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT OR REPLACE INTO audit_findings (source_chat_id, target_chat_id, source_msg_id, kind, target_msg_id, repaired) VALUES (?, ?, ?, ?, ?, ?)",
+                              [(source_chat_id, target_chat_id, msg_id, kind, target_msg_id, int(repaired))
+                               for msg_id, kind, target_msg_id, repaired in findings])
+            cursor.execute("UPDATE audit_cursors SET last_id = ?, completed = ?, updated_at = ? WHERE source_chat_id = ? AND target_chat_id = ?",
+                          (last_id, int(completed), updated_at, source_chat_id, target_chat_id))
+            conn.commit()
+
+    def get_audit_counts(self, source_chat_id, target_chat_id):
+        """{kind: (найдено, исправлено)} по находкам аудита."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT kind, COUNT(*), COALESCE(SUM(repaired), 0) FROM audit_findings WHERE source_chat_id = ? AND target_chat_id = ? GROUP BY kind",
+                          (source_chat_id, target_chat_id))
+            return {kind: (count, repaired) for kind, count, repaired in cursor}
+
+    def get_audit_findings(self, source_chat_id, target_chat_id, kind, limit=20):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT source_msg_id, target_msg_id FROM audit_findings WHERE source_chat_id = ? AND target_chat_id = ? AND kind = ? ORDER BY source_msg_id LIMIT ?",
+                          (source_chat_id, target_chat_id, kind, limit))
+            return cursor.fetchall()
+
+    def get_retry_ids(self, source_chat_id, target_chat_id):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT source_msg_id FROM retry_queue WHERE source_chat_id = ? AND target_chat_id = ?",
+                          (source_chat_id, target_chat_id))
+            return {row[0] for row in cursor}
+
+    def get_retries(self, source_chat_id, target_chat_id, source_msg_ids):
+        """{source_msg_id: (attempts, next_attempt, created_at)} для переданных id."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            placeholders = ', '.join('?' * len(source_msg_ids))
+            cursor.execute(f"SELECT source_msg_id, attempts, next_attempt, created_at FROM retry_queue WHERE source_chat_id = ? AND target_chat_id = ? AND source_msg_id IN ({placeholders})",
+                          (source_chat_id, target_chat_id, *source_msg_ids))
+            return {row[0]: row[1:] for row in cursor}
+
+    def save_retries(self, source_chat_id, target_chat_id, rows):
+        """rows: [(source_msg_id, error_class, error, attempts, next_attempt, created_at)]."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT OR REPLACE INTO retry_queue (source_chat_id, target_chat_id, source_msg_id, error_class, error, attempts, next_attempt, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              [(source_chat_id, target_chat_id, *row) for row in rows])
+            conn.commit()
+            self.logger.debug(f"Saved {len(rows)} retries for source {source_chat_id} to target {target_chat_id}")
+
+    def get_due_retries(self, source_chat_id, target_chat_id, now, limit=100):
+        """Созревшие повторы по возрастанию id, чтобы ответы шли после сообщений, на которые отвечают."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT source_msg_id, attempts, error_class FROM retry_queue WHERE source_chat_id = ? AND target_chat_id = ? AND next_attempt <= ? ORDER BY source_msg_id LIMIT ?",
+                          (source_chat_id, target_chat_id, now, limit))
+            return cursor.fetchall()
+
+    def postpone_retries(self, source_chat_id, target_chat_id, source_msg_ids, next_attempt):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("UPDATE retry_queue SET next_attempt = ? WHERE source_chat_id = ? AND target_chat_id = ? AND source_msg_id = ?",
+                              [(next_attempt, source_chat_id, target_chat_id, msg_id) for msg_id in source_msg_ids])
+            conn.commit()
+
+    def delete_retries(self, source_chat_id, target_chat_id, source_msg_ids):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM retry_queue WHERE source_chat_id = ? AND target_chat_id = ? AND source_msg_id = ?",
+                              [(source_chat_id, target_chat_id, msg_id) for msg_id in source_msg_ids])
+            conn.commit()
+
+    def dead_letter(self, source_chat_id, target_chat_id, rows, failed_at):
+        """Переносит сообщения из retry_queue в dead_letters; rows: [(source_msg_id, error_class, error, attempts, created_at)]."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT OR REPLACE INTO dead_letters (source_chat_id, target_chat_id, source_msg_id, error_class, error, attempts, created_at, failed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              [(source_chat_id, target_chat_id, *row, failed_at) for row in rows])
+            cursor.executemany("DELETE FROM retry_queue WHERE source_chat_id = ? AND target_chat_id = ? AND source_msg_id = ?",
+                              [(source_chat_id, target_chat_id, row[0]) for row in rows])
+            conn.commit()
+            self.logger.debug(f"Moved {len(rows)} messages of source {source_chat_id} to target {target_chat_id} to dead letters")
+
+    def get_retry_counts(self, source_chat_id, target_chat_id):
+        """(в очереди повторов, в dead letters)."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT (SELECT COUNT(*) FROM retry_queue WHERE source_chat_id = ? AND target_chat_id = ?), (SELECT COUNT(*) FROM dead_letters WHERE source_chat_id = ? AND target_chat_id = ?)",
+                          (source_chat_id, target_chat_id, source_chat_id, target_chat_id))
+            return cursor.fetchone()
+
+    def add_send_intent(self, random_id, source_chat_id, target_chat_id, source_msg_ids, text_prefix, has_media, media_size, started_at):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO send_journal (random_id, source_chat_id, target_chat_id, lead_msg_id, source_msg_ids, text_prefix, has_media, media_size, started_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          (random_id, source_chat_id, target_chat_id, source_msg_ids[0], ','.join(map(str, source_msg_ids)),
+                           text_prefix, int(has_media), media_size, started_at))
+            conn.commit()
+
+    def get_send_intents(self, source_chat_id, target_chat_id):
+        """Незавершенные отправки: (random_id, source_msg_ids, text_prefix, has_media, media_size, started_at)."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT random_id, source_msg_ids, text_prefix, has_media, media_size, started_at FROM send_journal WHERE source_chat_id = ? AND target_chat_id = ?",
+                          (source_chat_id, target_chat_id))
+            return [(row[0], [int(i) for i in row[1].split(',')], *row[2:]) for row in cursor]
+
+    def complete_send(self, random_id, source_chat_id, target_chat_id, source_msg_ids, target_msg_id):
+        """В одной транзакции отмечает сообщения синхронизированными и закрывает запись журнала."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("UPDATE messages SET target_msg_id = ?, synced = 1 WHERE source_msg_id = ? AND source_chat_id = ? AND target_chat_id = ?",
+                              [(target_msg_id, msg_id, source_chat_id, target_chat_id) for msg_id in source_msg_ids])
+            cursor.execute("DELETE FROM send_journal WHERE random_id = ?", (random_id,))
+            conn.commit()
+            self.logger.debug(f"Completed send {random_id} of messages {source_msg_ids} from {source_chat_id} as {target_msg_id} in {target_chat_id}")
+
+    def delete_send_intent(self, random_id):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM send_journal WHERE random_id = ?", (random_id,))
+            conn.commit()
+
+    def is_target_mapped(self, target_chat_id, target_msg_id):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM messages WHERE target_chat_id = ? AND target_msg_id = ? LIMIT 1",
+                          (target_chat_id, target_msg_id))
+            return cursor.fetchone() is not None
+
+    def get_upload_session(self, file_path, bot_index):
+        """(file_id, size, part_size, created_at) сессии заливки файла ботом или None."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT file_id, size, part_size, created_at FROM upload_sessions WHERE file_path = ? AND bot_index = ?",
+                          (file_path, bot_index))
+            return cursor.fetchone()
+
+    def create_upload_session(self, file_path, bot_index, file_id, size, part_size, created_at):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM upload_parts WHERE file_path = ? AND bot_index = ?", (file_path, bot_index))
+            cursor.execute("INSERT OR REPLACE INTO upload_sessions (file_path, bot_index, file_id, size, part_size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                          (file_path, bot_index, file_id, size, part_size, created_at))
+            conn.commit()
+            self.logger.debug(f"Created upload session {file_id} for {file_path} on bot #{bot_index}")
+
+    def get_upload_parts(self, file_path, bot_index):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT part FROM upload_parts WHERE file_path = ? AND bot_index = ?", (file_path, bot_index))
+            return {row[0] for row in cursor}
+
+    def add_upload_parts(self, file_path, bot_index, parts):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT OR IGNORE INTO upload_parts (file_path, bot_index, part) VALUES (?, ?, ?)",
+                              [(file_path, bot_index, part) for part in parts])
+            conn.commit()
+
+    def delete_upload_sessions(self, file_path):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM upload_parts WHERE file_path = ?", (file_path,))
+            cursor.execute("DELETE FROM upload_sessions WHERE file_path = ?", (file_path,))
+            conn.commit()
+
+    def delete_expired_upload_sessions(self, created_before):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM upload_parts WHERE (file_path, bot_index) IN "
+                           "(SELECT file_path, bot_index FROM upload_sessions WHERE created_at < ?)", (created_before,))
+            cursor.execute("DELETE FROM upload_sessions WHERE created_at < ?", (created_before,))
+            conn.commit()
+            if cursor.rowcount:
+                self.logger.debug(f"Deleted {cursor.rowcount} expired upload sessions")
+
+    def get_schedule_states(self):
+        """{pair_name: (schedule, next_run, last_started, last_finished, last_success, last_status, runs, skipped)}."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pair_name, schedule, next_run, last_started, last_finished, last_success, last_status, runs, skipped FROM sync_schedules")
+            return {row[0]: row[1:] for row in cursor}
+
+    def save_schedule(self, pair_name, schedule, next_run):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO sync_schedules (pair_name, schedule, next_run) VALUES (?, ?, ?) "
+                           "ON CONFLICT (pair_name) DO UPDATE SET schedule = excluded.schedule, next_run = excluded.next_run",
+                          (pair_name, schedule, next_run))
+            conn.commit()
+
+    def start_scheduled_run(self, pair_name, started_at, next_run):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE sync_schedules SET last_started = ?, next_run = ?, last_status = 'running', runs = runs + 1 WHERE pair_name = ?",
+                          (started_at, next_run, pair_name))
+            conn.commit()
+
+    def finish_scheduled_run(self, pair_name, finished_at, status, success):
+        """Итог запуска; успешный запуск сдвигает last_success на время его начала."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE sync_schedules SET last_finished = ?, last_status = ?, "
+                           "last_success = CASE WHEN ? THEN last_started ELSE last_success END WHERE pair_name = ?",
+                          (finished_at, status, int(success), pair_name))
+            conn.commit()
+
+    def skip_scheduled_run(self, pair_name, next_run):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE sync_schedules SET next_run = ?, skipped = skipped + 1 WHERE pair_name = ?",
+                          (next_run, pair_name))
+            conn.commit()
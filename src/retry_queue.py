@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import random
+import time
+
+from .message_envelope import MessageEnvelope
+
+# error_class ответа, отложенного до повтора сообщения, на которое он отвечает
+WAITING_FOR_REPLY = 'WaitingForReply'
+
+
+class RetryQueue:
+    """Долговременная очередь повторов для сообщений, на которых упал процессор.
+
+    Ошибка хендлера больше не останавливает выгрузку: сообщение записывается в retry_queue с классом ошибки,
+    числом попыток и временем следующей попытки (экспоненциальный backoff с джиттером), конвейер идет дальше.
+    Ответ на сообщение из очереди откладывается вслед за ним, чтобы не потерять reply_to в цели.
+    После max_attempts неудачных попыток сообщение переносится в dead_letters.
+    """
+
+    def __init__(self, repository, max_attempts=5, base_delay=60, max_delay=3600):
+        self.logger = logging.getLogger(__name__)
+        self.repository = repository
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._pending = {}  # (source_chat_id, target_chat_id) -> {source_msg_id} в retry_queue
+
+    def pending(self, source_chat_id, target_chat_id):
+        key = (source_chat_id, target_chat_id)
+        if key not in self._pending:
+            self._pending[key] = self.repository.get_retry_ids(source_chat_id, target_chat_id)
+        return self._pending[key]
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def guard(self, processor, messages, operation):
+        """Выполняет operation() процессора; при ошибке ставит сообщения в очередь повторов вместо исключения."""
+        source_chat_id, target_chat_id = processor.source_chat_id, processor.target_chat_id
+        ids = [message.id for message in messages]
+        pending = self.pending(source_chat_id, target_chat_id)
+        lead = min(messages, key=lambda m: m.id)
+        reply_to = getattr(lead, 'reply_to', None)
+        parent_id = getattr(reply_to, 'reply_to_msg_id', None) if reply_to else None
+        if parent_id and parent_id in pending and parent_id not in ids:
+            self._defer(source_chat_id, target_chat_id, ids, parent_id)
+            return None
+
+        try:
+            result = await operation()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Failed to process messages {ids} from {source_chat_id} to {target_chat_id}, "
+                              f"queued for retry: {type(e).__name__}: {str(e)}", exc_info=True)
+            self._record_failure(source_chat_id, target_chat_id, ids, e)
+            # Повтор должен заново собрать альбом, а не пропустить его как уже обработанный
+            processed_group_ids = getattr(processor, 'processed_group_ids', None)
+            if processed_group_ids is not None:
+                processed_group_ids.difference_update(ids)
+            return None
+        resolved = pending.intersection(ids)
+        if resolved:
+            self.repository.delete_retries(source_chat_id, target_chat_id, sorted(resolved))
+            pending.difference_update(resolved)
+            self.logger.info(f"Messages {sorted(resolved)} from {source_chat_id} to {target_chat_id} succeeded on retry")
+        return result
+
+    def _defer(self, source_chat_id, target_chat_id, ids, parent_id):
+        now = time.time()
+        existing = self.repository.get_retries(source_chat_id, target_chat_id, ids + [parent_id])
+        parent_next = existing.get(parent_id, (0, now, now))[1]
+        rows = []
+        for msg_id in ids:
+            attempts, _, created_at = existing.get(msg_id, (0, None, now))
+            rows.append((msg_id, WAITING_FOR_REPLY, f"waiting for message {parent_id}", attempts, parent_next + 1, created_at))
+        self.repository.save_retries(source_chat_id, target_chat_id, rows)
+        self.pending(source_chat_id, target_chat_id).update(ids)
+        self.logger.info(f"Deferred messages {ids} from {source_chat_id}: they reply to message {parent_id} waiting for retry")
+
+    def _record_failure(self, source_chat_id, target_chat_id, ids, error):
+        now = time.time()
+        error_class = type(error).__name__
+        text = str(error)[:500]
+        existing = self.repository.get_retries(source_chat_id, target_chat_id, ids)
+        retries, dead = [], []
+        for msg_id in ids:
+            attempts, _, created_at = existing.get(msg_id, (0, None, now))
+            attempts += 1
+            if attempts >= self.max_attempts:
+                dead.append((msg_id, error_class, text, attempts, created_at))
+            else:
+                retries.append((msg_id, error_class, text, attempts, now + self._backoff(attempts), created_at))
+        pending = self.pending(source_chat_id, target_chat_id)
+        if retries:
+            self.repository.save_retries(source_chat_id, target_chat_id, retries)
+            pending.update(row[0] for row in retries)
+        if dead:
+            self.repository.dead_letter(source_chat_id, target_chat_id, dead, now)
+            pending.difference_update(row[0] for row in dead)
+            self.logger.error(f"Messages {[row[0] for row in dead]} from {source_chat_id} to {target_chat_id} "
+                              f"failed {self.max_attempts} times, moved to dead letters")
+
+    async def retry_due(self, client, processor, submit=None, limit=100):
+        """Отдает созревшие повторы в submit (по умолчанию processor.process_message) по возрастанию id."""
+        source_chat_id, target_chat_id = processor.source_chat_id, processor.target_chat_id
+        rows = self.repository.get_due_retries(source_chat_id, target_chat_id, time.time(), limit)
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        # Пока сообщение ждет обработки, не выдаем его повторно; исход попытки перезапишет next_attempt
+        self.repository.postpone_retries(source_chat_id, target_chat_id, ids, time.time() + self.max_delay)
+        self.logger.info(f"Retrying {len(ids)} messages from {source_chat_id} to {target_chat_id}: {ids}")
+        messages = await client.accounts.get_messages(source_chat_id, ids=ids)
+        submit = submit or processor.process_message
+        for msg_id, message in zip(ids, messages):
+            if message is None:
+                self.logger.warning(f"Message {msg_id} was deleted from source {source_chat_id}, dropping its retry")
+                self.repository.delete_retries(source_chat_id, target_chat_id, [msg_id])
+                self.pending(source_chat_id, target_chat_id).discard(msg_id)
+                continue
+            await submit(MessageEnvelope.from_message(message))
+        return len(ids)
+
+    async def run(self, client, lanes, interval=30):
+        """Фоновый воркер listen-режима: повторы идут через очереди пар (offer), не дожидаясь места в них."""
+        while True:
+            await asyncio.sleep(interval)
+            for lane in list(lanes()):
+                if getattr(lane.processor, 'retry_queue', None) is not self:
+                    continue
+                try:
+                    await self.retry_due(client, lane.processor, self._offer(lane))
+                except Exception as e:
+                    self.logger.error(f"Failed to schedule retries for pair '{lane.name}': {str(e)}", exc_info=True)
+
+    @staticmethod
+    def _offer(lane):
+        async def submit(message):
+            lane.offer(message)
+        return submit
+
+    def stats(self, source_chat_id, target_chat_id):
+        retries, dead = self.repository.get_retry_counts(source_chat_id, target_chat_id)
+        return {'retry': retries, 'dead': dead}
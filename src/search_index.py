@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import sqlite3
+import time
+
+
+class SearchIndex:
+    """Полнотекстовый индекс (SQLite FTS5) по скопированным сообщениям, лежит рядом с telegram_cloner.db.
+
+    add() только кладет документ в буфер; запись идет пачками в фоновой задаче через отдельный поток,
+    поэтому путь синхронизации не ждет диска.
+    """
+
+    def __init__(self, path="telegram_search.db", batch_size=500, flush_interval=2.0):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.indexed = 0
+        self._wakeup = None
+        self._task = None
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        self.logger.info(f"Initializing search index at {self.path}")
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    source_chat_id INTEGER,
+                    source_msg_id INTEGER,
+                    target_chat_id INTEGER,
+                    target_msg_id INTEGER,
+                    date TEXT,
+                    text TEXT,
+                    file_name TEXT,
+                    UNIQUE (source_chat_id, source_msg_id, target_chat_id)
+                )
+            """)
+            # External content: текст хранится один раз в documents, FTS держит только индекс
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                    text, file_name, content='documents', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+                    INSERT INTO documents_fts (rowid, text, file_name) VALUES (new.id, new.text, new.file_name);
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+                    INSERT INTO documents_fts (documents_fts, rowid, text, file_name) VALUES ('delete', old.id, old.text, old.file_name);
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+                    INSERT INTO documents_fts (documents_fts, rowid, text, file_name) VALUES ('delete', old.id, old.text, old.file_name);
+                    INSERT INTO documents_fts (rowid, text, file_name) VALUES (new.id, new.text, new.file_name);
+                END
+            """)
+            conn.commit()
+
+    @staticmethod
+    def _file_name(message):
+        file = getattr(message, 'file', None) if getattr(message, 'media', None) else None
+        return (file.name if file else None) or ''
+
+    def add(self, message, source_chat_id, target_chat_id, target_msg_id):
+        """Ставит сообщение в очередь на индексацию: текст/подпись, имя файла и маппинг source -> target."""
+        text = message.message or ''
+        file_name = self._file_name(message)
+        if not text and not file_name:
+            return
+        self.buffer.append((source_chat_id, message.id, target_chat_id, target_msg_id,
+                            message.date.isoformat() if message.date else None, text, file_name))
+        self._ensure_task()
+        if len(self.buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_task(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            self.logger.error(f"Failed to index {len(batch)} messages: {str(e)}")
+            self.buffer = batch + self.buffer
+
+    def _write(self, batch):
+        with self._connect() as conn:
+            conn.executemany("""
+                INSERT INTO documents (source_chat_id, source_msg_id, target_chat_id, target_msg_id, date, text, file_name)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source_chat_id, source_msg_id, target_chat_id)
+                DO UPDATE SET target_msg_id = excluded.target_msg_id, date = excluded.date,
+                              text = excluded.text, file_name = excluded.file_name
+            """, batch)
+            conn.commit()
+        self.indexed += len(batch)
+        self.logger.debug(f"Indexed {len(batch)} messages, {self.indexed} in total")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def search(self, query, limit=20, source_chat_id=None):
+        """Возвращает (строки, время запроса в мс); строка: source_chat_id, source_msg_id, target_chat_id, target_msg_id, date, file_name, snippet."""
+        sql = """
+            SELECT d.source_chat_id, d.source_msg_id, d.target_chat_id, d.target_msg_id, d.date, d.file_name,
+                   snippet(documents_fts, 0, '[', ']', '...', 12)
+            FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+            WHERE documents_fts MATCH ?
+        """
+        params = [query]
+        if source_chat_id is not None:
+            sql += " AND d.source_chat_id = ?"
+            params.append(source_chat_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        started = time.perf_counter()
+        with self._connect() as conn:
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                # Синтаксис FTS5: незакрытые кавычки, оператор без операнда и т.п.
+                raise ValueError(f"Invalid search query '{query}': {str(e)}. "
+                                 f"Put terms with special characters in double quotes") from e
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.logger.info(f"Search '{query}' returned {len(rows)} results in {elapsed_ms:.1f} ms")
+        return rows, elapsed_ms
@@ -0,0 +1,133 @@
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+# Сколько секунд до записи намерения еще считаем "своим" окном отправки (расхождение часов, очередь бота)
+CLOCK_SKEW = 60
+# Сколько сообщений цели просматривать после начала отправки
+SCAN_LIMIT = 300
+TEXT_PREFIX = 32
+
+
+class SendJournal:
+    """Журнал отправок с записью намерения до заливки (write-ahead) и закрытием после обновления базы.
+
+    Если процесс упал между send_file и update_message, запись журнала остается "в сомнении". Перед повторной
+    отправкой таких сообщений журнал сверяется с целевым чатом по недавней истории (время, текст, наличие и размер
+    медиа) и при совпадении только дописывает маппинг, не заливая файл второй раз.
+
+    В цель параллельно пишут другие очереди (listen, fan-out), поэтому совпадение принимается, только если
+    отпечаток различимый (есть текст или размер документа) и подходящее незамапленное сообщение ровно одно.
+    Иначе сообщение отправляется снова: дубль в цели лучше, чем молча потерянное сообщение.
+    """
+
+    def __init__(self, client, repository, source_chat_id, target_chat_id, max_file_size=None):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.repository = repository
+        self.source_chat_id = source_chat_id
+        self.target_chat_id = target_chat_id
+        self.max_file_size = max_file_size
+        self._in_doubt = None  # source_msg_id -> запись журнала, загружается при первом обращении
+
+    def _load(self):
+        if self._in_doubt is None:
+            self._in_doubt = {}
+            for intent in self.repository.get_send_intents(self.source_chat_id, self.target_chat_id):
+                for msg_id in intent[1]:
+                    self._in_doubt[msg_id] = intent
+            if self._in_doubt:
+                self.logger.warning(f"{len(self._in_doubt)} messages from {self.source_chat_id} to {self.target_chat_id} "
+                                    f"have sends in doubt, they will be reconciled before resending")
+        return self._in_doubt
+
+    @staticmethod
+    def _prefix(text):
+        return (text or '').strip()[:TEXT_PREFIX]
+
+    def _media_size(self, message):
+        # Размер сверяем только у документов, которые уходят одним файлом; фото Telegram пережимает
+        if message.media is None or message.media.kind != 'document' or message.media.size is None:
+            return None
+        if self.max_file_size and message.media.size > self.max_file_size:
+            return None
+        return message.media.size
+
+    def begin(self, messages):
+        """Записывает намерение отправить messages (лидер альбома первым) и возвращает random_id записи."""
+        lead = messages[0]
+        random_id = random.getrandbits(63)
+        intent = (random_id, [m.id for m in messages], self._prefix(lead.message), bool(lead.media),
+                  self._media_size(lead), time.time())
+        self.repository.add_send_intent(random_id, self.source_chat_id, self.target_chat_id, *intent[1:])
+        # Пока запись не закрыта, отправка считается сомнительной и в этом процессе (например, хендлер упал после send)
+        in_doubt = self._load()
+        for message in messages:
+            in_doubt[message.id] = intent
+        return random_id
+
+    def complete(self, random_id, messages, target_msg_id):
+        self.repository.complete_send(random_id, self.source_chat_id, self.target_chat_id, [m.id for m in messages],
+                                      target_msg_id)
+        self._forget(random_id)
+
+    def abort(self, random_id):
+        """Отправка точно не состоялась (хендлер вернул None)."""
+        self.repository.delete_send_intent(random_id)
+        self._forget(random_id)
+
+    def _forget(self, random_id):
+        for msg_id in [msg_id for msg_id, intent in self._load().items() if intent[0] == random_id]:
+            del self._in_doubt[msg_id]
+
+    async def reconcile(self, messages):
+        """Если отправка этих сообщений в сомнении, ищет ее в цели; возвращает найденный target_msg_id или None."""
+        in_doubt = self._load()
+        intent = next((in_doubt[m.id] for m in messages if m.id in in_doubt), None)
+        if intent is None:
+            return None
+        random_id, source_msg_ids, text_prefix, has_media, media_size, started_at = intent
+        for msg_id in source_msg_ids:
+            in_doubt.pop(msg_id, None)
+        if not text_prefix and media_size is None:
+            # Фото или медиа без подписи не отличить от чужой отправки в то же окно
+            self.repository.delete_send_intent(random_id)
+            self.logger.warning(f"Send of messages {source_msg_ids} from {self.source_chat_id} to {self.target_chat_id} "
+                                f"has no distinctive fingerprint, sending again (may duplicate)")
+            return None
+        candidates = await self._find_in_target(text_prefix, has_media, media_size, started_at)
+        if len(candidates) != 1:
+            self.repository.delete_send_intent(random_id)
+            if candidates:
+                self.logger.warning(f"Send of messages {source_msg_ids} from {self.source_chat_id} matches "
+                                    f"{len(candidates)} messages in target {self.target_chat_id} {candidates}, "
+                                    f"sending again (may duplicate)")
+            else:
+                self.logger.info(f"Send of messages {source_msg_ids} from {self.source_chat_id} did not reach target "
+                                 f"{self.target_chat_id}, sending again")
+            return None
+        target_msg_id = candidates[0]
+        self.repository.complete_send(random_id, self.source_chat_id, self.target_chat_id, source_msg_ids, target_msg_id)
+        self.logger.warning(f"Send of messages {source_msg_ids} from {self.source_chat_id} was already delivered to "
+                            f"{self.target_chat_id} as {target_msg_id} before the crash, not sending again")
+        return target_msg_id
+
+    async def _find_in_target(self, text_prefix, has_media, media_size, started_at):
+        """Незамапленные сообщения цели после started_at с тем же отпечатком."""
+        candidates = []
+        offset_date = datetime.fromtimestamp(started_at - CLOCK_SKEW, timezone.utc)
+        async for candidate in self.client.client.iter_messages(self.target_chat_id, offset_date=offset_date,
+                                                                reverse=True, limit=SCAN_LIMIT):
+            if bool(candidate.media) != bool(has_media):
+                continue
+            if self._prefix(candidate.message) != text_prefix:
+                continue
+            if media_size is not None:
+                document = getattr(candidate.media, 'document', None)
+                if document is None or document.size != media_size:
+                    continue
+            if self.repository.is_target_mapped(self.target_chat_id, candidate.id):
+                continue
+            candidates.append(candidate.id)
+        return candidates
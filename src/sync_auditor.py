@@ -0,0 +1,154 @@
+import logging
+import time
+
+# Виды расхождений, которые находит аудит
+MISSING = 'missing'  # сообщение есть в источнике, но в базе его нет
+LOST = 'lost'  # в базе отмечено синхронизированным, но в целевом чате сообщения нет
+ORPHANED = 'orphaned'  # в базе есть запись, а в источнике сообщение удалено
+UNSYNCED = 'unsynced'  # запись в базе осталась с synced = 0
+KINDS = [MISSING, LOST, ORPHANED, UNSYNCED]
+REPAIRABLE = {MISSING, LOST, UNSYNCED}
+
+
+class SyncAuditor:
+    """Сверяет источник, таблицу messages и целевой чат окнами по page_size id.
+
+    На окно уходит один get_messages по источнику и один по целевому чату, в памяти только текущее окно.
+    Находки и курсор пишутся в базу после каждого окна, поэтому прерванный аудит продолжается с места остановки.
+    С processor найденные пропуски сразу досылаются по порядку id, до сохранения окна.
+    Проверяются ids от первого записанного в базе сообщения пары (или от первого сообщения start_date) до последнего.
+    """
+
+    def __init__(self, client, source_chat_id, target_chat_id, repository, processor=None, page_size=100):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.source_chat_id = source_chat_id
+        self.target_chat_id = target_chat_id
+        self.repository = repository
+        self.processor = processor
+        self.page_size = page_size
+
+    async def _source_top_id(self):
+        latest = await self.client.accounts.get_messages(self.source_chat_id, limit=1)
+        return latest[0].id if latest else 0
+
+    @staticmethod
+    def _is_syncable(message):
+        # Служебные и пустые сообщения процессор не переносит, их отсутствие в цели не пропуск
+        return message is not None and getattr(message, 'action', None) is None and bool(message.media or message.message)
+
+    async def _first_id(self, start_date):
+        """Начало диапазона: первое сообщение источника с start_date или первое записанное в базе.
+
+        Пара, синхронизированная с --date, не переносила более раннюю историю, и без этого вся она
+        попала бы в missing (а с processor - в цель).
+        """
+        if start_date is not None:
+            first = await self.client.accounts.get_messages(self.source_chat_id, limit=1, offset_date=start_date,
+                                                            reverse=True)
+            return first[0].id if first else None
+        return self.repository.get_min_message_id(self.source_chat_id, self.target_chat_id) or None
+
+    async def audit(self, restart=False, start_date=None):
+        state = self.repository.get_audit_cursor(self.source_chat_id, self.target_chat_id)
+        if restart or state is None or state[2] or start_date is not None:
+            max_id = max(await self._source_top_id(),
+                         self.repository.get_max_message_id(self.source_chat_id, self.target_chat_id))
+            first_id = await self._first_id(start_date)
+            if first_id is None:
+                # Ни записей в базе, ни сообщений источника после start_date: проверять нечего
+                first_id = max_id + 1
+            self.repository.start_audit(self.source_chat_id, self.target_chat_id, first_id, max_id, time.time())
+            last_id = first_id - 1
+            self.logger.info(f"Starting audit of source {self.source_chat_id} against target {self.target_chat_id} "
+                             f"for ids {first_id}..{max_id}")
+        else:
+            last_id, max_id = state[0], state[1]
+            self.logger.info(f"Resuming audit of source {self.source_chat_id} against target {self.target_chat_id} "
+                             f"from id {last_id + 1} of {max_id}")
+
+        if last_id >= max_id:
+            self.repository.save_audit_window(self.source_chat_id, self.target_chat_id, last_id, [], time.time(),
+                                              completed=True)
+        windows = 0
+        while last_id < max_id:
+            min_id = last_id + 1
+            end_id = min(min_id + self.page_size, max_id + 1)
+            findings = await self._audit_window(min_id, end_id)
+            last_id = end_id - 1
+            self.repository.save_audit_window(self.source_chat_id, self.target_chat_id, last_id, findings, time.time(),
+                                              completed=last_id >= max_id)
+            windows += 1
+            if windows % 100 == 0:
+                self.logger.info(f"Audited ids up to {last_id} of {max_id}: "
+                                 f"{self.repository.get_audit_counts(self.source_chat_id, self.target_chat_id)}")
+        if self.processor is not None:
+            await self.processor.join()
+        return self.repository.get_audit_counts(self.source_chat_id, self.target_chat_id)
+
+    async def _audit_window(self, min_id, end_id):
+        ids = list(range(min_id, end_id))
+        source = {msg.id: msg for msg in await self.client.accounts.get_messages(self.source_chat_id, ids=ids)
+                  if self._is_syncable(msg)}
+        rows = {row[0]: (row[1], row[2]) for row in
+                self.repository.get_message_range(self.source_chat_id, self.target_chat_id, min_id, end_id)}
+
+        # Целевые id окна проверяем одним запросом (у альбома один target_msg_id на все сообщения)
+        target_ids = sorted({target_msg_id for target_msg_id, synced in rows.values() if synced and target_msg_id})
+        present = set()
+        if target_ids:
+            target_messages = await self.client.client.get_messages(self.target_chat_id, ids=target_ids)
+            present = {msg.id for msg in target_messages if msg is not None}
+
+        findings = []
+        for msg_id in ids:
+            row = rows.get(msg_id)
+            if row is None:
+                if msg_id in source:
+                    findings.append((msg_id, MISSING, None))
+                continue
+            target_msg_id, synced = row
+            if msg_id not in source:
+                findings.append((msg_id, ORPHANED, target_msg_id))
+            elif not synced:
+                findings.append((msg_id, UNSYNCED, target_msg_id))
+            elif target_msg_id not in present:
+                findings.append((msg_id, LOST, target_msg_id))
+
+        repaired = set()
+        if self.processor is not None:
+            repaired = await self._repair([source[msg_id] for msg_id, kind, _ in findings if kind in REPAIRABLE])
+        return [(msg_id, kind, target_msg_id, msg_id in repaired) for msg_id, kind, target_msg_id in findings]
+
+    async def _repair(self, messages):
+        """Досылает сообщения окна через процессор пары; процессор сам перезаливает потерянные в цели."""
+        repaired = set()
+        for message in messages:
+            try:
+                await self.processor.process_message(message)
+            except Exception as e:
+                self.logger.error(f"Failed to repair message {message.id}: {str(e)}", exc_info=True)
+                continue
+            record = self.repository.get_message(message.id, self.source_chat_id, self.target_chat_id)
+            if record and record[3] == 1:
+                repaired.add(message.id)
+        if messages:
+            self.logger.info(f"Repaired {len(repaired)} of {len(messages)} messages in ids {messages[0].id}..{messages[-1].id}")
+        return repaired
+
+    def report(self, counts, samples=10):
+        state = self.repository.get_audit_cursor(self.source_chat_id, self.target_chat_id)
+        lines = [f"Audit of source {self.source_chat_id} against target {self.target_chat_id}"
+                 f"{f' for source ids {state[4]}..{state[1]}' if state else ''}:"]
+        if state and state[4] > 1:
+            lines.append(f"  ids before {state[4]} are not audited: they precede the pair's first recorded message or --date")
+        for kind in KINDS:
+            found, repaired = counts.get(kind, (0, 0))
+            line = f"  {kind}: {found}"
+            if repaired:
+                line += f" ({repaired} repaired)"
+            rows = self.repository.get_audit_findings(self.source_chat_id, self.target_chat_id, kind, samples)
+            if rows:
+                line += f", e.g. source ids {', '.join(str(row[0]) for row in rows)}"
+            lines.append(line)
+        return '\n'.join(lines)
@@ -0,0 +1,160 @@
+import logging
+import math
+import time
+
+from .archive_processor import HANDLER_KINDS
+from .media_manager import MAX_FILE_SIZE, TARGET_PART_SIZE
+from .message_envelope import MessageEnvelope
+
+
+def media_size(message):
+    """Размер медиа по метаданным сообщения, без скачивания."""
+    if not getattr(message, 'media', None):
+        return 0
+    file = getattr(message, 'file', None)
+    return (file.size if file else None) or 0
+
+
+def split_parts(message, kind):
+    """Сколько частей получится у видео/документа больше MAX_FILE_SIZE (0 - без разрезания)."""
+    size = media_size(message)
+    if kind not in ('video', 'file', 'mixed') or size <= MAX_FILE_SIZE:
+        return 0
+    if getattr(message.media, 'round', False):
+        return 0
+    return math.ceil(size / TARGET_PART_SIZE)
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return 'unknown'
+    seconds = int(seconds)
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m {seconds % 60:02d}s"
+
+
+class PairPlan:
+    def __init__(self, name, target_chat_id):
+        self.name = name
+        self.target_chat_id = target_chat_id
+        self.kinds = {}  # kind -> [messages, bytes]
+        self.albums = 0
+        self.split_files = 0
+        self.split_parts = 0
+        self.already_synced = 0
+        self.eta = None
+
+    @property
+    def messages(self):
+        return sum(count for count, _ in self.kinds.values())
+
+    @property
+    def bytes(self):
+        return sum(size for _, size in self.kinds.values())
+
+    def add(self, kind, message, parts):
+        entry = self.kinds.setdefault(kind, [0, 0])
+        entry[0] += 1
+        entry[1] += media_size(message)
+        if parts:
+            self.split_files += 1
+            self.split_parts += parts
+
+
+class SyncPlanner:
+    """Dry-run стратегий синхронизации: обходит только метаданные истории и считает оставшуюся работу по парам.
+
+    Медиа не скачивается, состояние синхронизации загружается из messages одним запросом на цель.
+    """
+
+    def __init__(self, client, source_chat_id, destinations, repository, handlers):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.source_chat_id = source_chat_id
+        self.destinations = destinations  # [(pair_name, target_chat_id)]
+        self.repository = repository
+        # Хендлеры без процессора: только классификация (supports), как в ArchiveProcessor
+        self.handlers = [handler() for handler in handlers]
+
+    def _classify(self, message_or_group):
+        messages = message_or_group if isinstance(message_or_group, list) else [message_or_group]
+        if not any(msg.media for msg in messages):
+            return 'text' if any(msg.message for msg in messages) else None
+        for handler in self.handlers:
+            if handler.supports(message_or_group):
+                return HANDLER_KINDS.get(handler.__class__.__name__, 'file')
+        return 'unknown'
+
+    async def plan(self, start_date=None, topic_id=None, threads_only=False):
+        started = time.time()
+        plans = [PairPlan(name, target_chat_id) for name, target_chat_id in self.destinations]
+        synced = {plan.name: self.repository.get_synced_ids(self.source_chat_id, plan.target_chat_id) for plan in plans}
+        scanned = 0
+        group = []
+
+        def account(messages):
+            kind = self._classify(messages if len(messages) > 1 else messages[0])
+            if kind is None:
+                return
+            for plan in plans:
+                pending = [msg for msg in messages if msg.id not in synced[plan.name]]
+                plan.already_synced += len(messages) - len(pending)
+                if not pending:
+                    continue
+                if len(messages) > 1:
+                    plan.albums += 1
+                for msg in pending:
+                    plan.add(kind, msg, split_parts(msg, kind))
+
+        kwargs = {'offset_date': start_date, 'reverse': True}
+        if topic_id is not None:
+            kwargs['reply_to'] = topic_id
+        async for message in self.client.accounts.iter_messages(self.source_chat_id, **kwargs):
+            # Хендлеры классифицируют envelope; незавершенный альбом держит только их
+            message = MessageEnvelope.from_message(message)
+            scanned += 1
+            if threads_only or topic_id is not None:
+                reply_to = getattr(message, 'reply_to', None)
+                message_topic_id = 0
+                if reply_to and getattr(reply_to, 'forum_topic', False):
+                    message_topic_id = reply_to.reply_to_top_id or reply_to.reply_to_msg_id
+                if message_topic_id == 0 or (topic_id is not None and message_topic_id != topic_id):
+                    continue
+            # Участники альбома идут в истории подряд
+            if group and message.grouped_id != group[0].grouped_id:
+                account(group)
+                group = []
+            if message.grouped_id:
+                group.append(message)
+            else:
+                account([message])
+            if scanned % 5000 == 0:
+                self.logger.info(f"Planned {scanned} messages of source {self.source_chat_id}")
+        if group:
+            account(group)
+
+        for plan in plans:
+            plan.eta = self._estimate(plan)
+        self.logger.info(f"Scanned {scanned} messages of source {self.source_chat_id} in {time.time() - started:.1f}s")
+        return scanned, plans
+
+    def _estimate(self, plan):
+        """ETA по пропускной способности прошлых запусков: упираемся в худшее из сообщений/с и байт/с."""
+        messages, size, seconds = self.repository.get_throughput(self.source_chat_id, plan.target_chat_id)
+        if not seconds or not messages:
+            return None
+        eta = plan.messages / (messages / seconds)
+        if size:
+            eta = max(eta, plan.bytes / (size / seconds))
+        return eta
+
+    @staticmethod
+    def report(scanned, plans):
+        lines = [f"Scanned {scanned} messages"]
+        for plan in plans:
+            lines.append(f"Pair '{plan.name}' (Target: {plan.target_chat_id or 'archive'}): "
+                         f"{plan.messages} messages to sync, {plan.already_synced} already synced")
+            for kind, (count, size) in sorted(plan.kinds.items()):
+                lines.append(f"  {kind:<8} {count:>8} messages {size / 1024 / 1024:>12.1f} MB")
+            lines.append(f"  albums: {plan.albums}, files to split: {plan.split_files} into {plan.split_parts} parts")
+            lines.append(f"  total: {plan.bytes / 1024 / 1024:.1f} MB, ETA: {format_duration(plan.eta)}")
+        return "\n".join(lines)
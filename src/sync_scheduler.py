@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+SCHEDULE_MODES = ['sync', 'sync-threads', 'sync-topics']
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+INTERVAL_RE = re.compile(r'^(?:every\s+)?(\d+)\s*([smhd])$')
+
+
+class CronExpression:
+    """Cron из пяти полей (минута, час, день месяца, месяц, день недели) по локальному времени.
+
+    Поддерживаются *, списки, диапазоны и шаг (*/15, 1-5, 0,30, 5/10). День недели 0 или 7 - воскресенье.
+    Если заданы и день месяца, и день недели, достаточно совпадения любого из них, как в cron.
+    """
+
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression must have 5 fields, got '{expression}'")
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)]
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for item in field.split(','):
+            step = 1
+            if '/' in item:
+                item, step = item.split('/', 1)
+                step = int(step)
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(value) for value in item.split('-', 1))
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"Invalid cron field '{field}', values must be within {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp):
+        """Ближайший момент строго после timestamp, подходящий под выражение."""
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError("Cron expression never matches")
+
+
+class Schedule:
+    """Расписание пары: интервал ('15m', 'every 2h') или cron-выражение ('*/30 * * * *')."""
+
+    def __init__(self, text):
+        self.text = text
+        match = INTERVAL_RE.match(str(text).strip().lower())
+        if match:
+            self.interval = int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+            if self.interval <= 0:
+                raise ValueError(f"Schedule interval must be positive, got '{text}'")
+            self.cron = None
+        else:
+            self.interval = None
+            self.cron = CronExpression(str(text))
+
+    def next_run(self, after):
+        if self.interval is not None:
+            return after + self.interval
+        return self.cron.next_after(after)
+
+
+class SyncScheduler:
+    """Периодические инкрементальные синхронизации пар в долгоживущем процессе (режим daemon).
+
+    Каждая пара с schedule в конфиге запускается по своему расписанию со случайной задержкой до jitter секунд.
+    Запуск, который наступил, пока предыдущий еще идет, пропускается (защита от наложения).
+    Следующий запуск, время и итог последнего хранятся в sync_schedules: после перезапуска расписание
+    продолжается, а пропущенные за время простоя запуски схлопываются в один. Каждый запуск синхронизирует
+    историю с начала последнего успешного запуска минус overlap секунд.
+    """
+
+    def __init__(self, repository, pairs, run_sync, jitter=60, overlap=300, tick=5):
+        self.logger = logging.getLogger(__name__)
+        self.repository = repository
+        self.run_sync = run_sync  # async callable(pair, start_date)
+        self.jitter = jitter
+        self.overlap = overlap
+        self.tick_interval = tick
+        self._pairs = {}  # pair_name -> Pair с расписанием
+        self._schedules = {}  # pair_name -> Schedule
+        self._running = {}  # pair_name -> Task текущего запуска
+        self.set_pairs(pairs)
+
+    def _next(self, schedule, after):
+        return schedule.next_run(after) + random.uniform(0, self.jitter)
+
+    def set_pairs(self, pairs):
+        """Применяет расписания пар; новые и измененные расписания отсчитываются заново."""
+        now = time.time()
+        states = self.repository.get_schedule_states()
+        scheduled = {pair.name: pair for pair in pairs if pair.schedule}
+        for name, pair in scheduled.items():
+            schedule = Schedule(pair.schedule)
+            state = states.get(name)
+            if state is None or state[0] != pair.schedule:
+                next_run = self._next(schedule, now)
+                self.repository.save_schedule(name, pair.schedule, next_run)
+                self.logger.info(f"Scheduled {pair.schedule_mode} of pair '{name}' ({pair.schedule}), "
+                                 f"first run at {datetime.fromtimestamp(next_run):%Y-%m-%d %H:%M:%S}")
+            elif name not in self._pairs and state[1] < now:
+                # Запуски, пропущенные пока процесс не работал, выполняются один раз и вразброс
+                self.repository.save_schedule(name, pair.schedule, now + random.uniform(0, self.jitter))
+                self.logger.info(f"Pair '{name}' missed its scheduled sync at "
+                                 f"{datetime.fromtimestamp(state[1]):%Y-%m-%d %H:%M:%S}, running it shortly")
+            self._schedules[name] = schedule
+        for name in set(self._pairs) - set(scheduled):
+            self._schedules.pop(name, None)
+            self.logger.info(f"Pair '{name}' is no longer scheduled")
+        self._pairs = scheduled
+
+    async def run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                self.logger.error(f"Scheduler tick failed: {str(e)}", exc_info=True)
+            await asyncio.sleep(self.tick_interval)
+
+    def tick(self, now=None):
+        now = now or time.time()
+        states = self.repository.get_schedule_states()
+        for name, pair in self._pairs.items():
+            state = states.get(name)
+            if state is None or state[1] > now:
+                continue
+            following = self._next(self._schedules[name], now)
+            task = self._running.get(name)
+            if task is not None and not task.done():
+                self.repository.skip_scheduled_run(name, following)
+                self.logger.warning(f"Scheduled sync of pair '{name}' is still running since "
+                                    f"{datetime.fromtimestamp(state[2]):%H:%M:%S}, skipping this run")
+                continue
+            last_success = state[4]
+            start_date = datetime.fromtimestamp(last_success - self.overlap) if last_success else \
+                datetime.now() - timedelta(days=1)
+            self.repository.start_scheduled_run(name, now, following)
+            self.logger.info(f"Starting scheduled {pair.schedule_mode} of pair '{name}' from {start_date:%Y-%m-%d %H:%M:%S}, "
+                             f"next run at {datetime.fromtimestamp(following):%Y-%m-%d %H:%M:%S}")
+            self._running[name] = asyncio.create_task(self._run(pair, start_date), name=f"schedule-{name}")
+
+    async def _run(self, pair, start_date):
+        started = time.monotonic()
+        try:
+            await self.run_sync(pair, start_date)
+        except asyncio.CancelledError:
+            self.repository.finish_scheduled_run(pair.name, time.time(), 'cancelled', False)
+            raise
+        except Exception as e:
+            self.logger.error(f"Scheduled sync of pair '{pair.name}' failed: {str(e)}", exc_info=True)
+            self.repository.finish_scheduled_run(pair.name, time.time(), f"{type(e).__name__}: {str(e)[:200]}", False)
+            return
+        self.repository.finish_scheduled_run(pair.name, time.time(), 'ok', True)
+        self.logger.info(f"Scheduled sync of pair '{pair.name}' finished in {time.monotonic() - started:.1f}s")
+
+    async def cancel(self, names):
+        """Прерывает текущие запуски пар (перед переконфигурацией их очередей)."""
+        tasks = [self._running.pop(name) for name in names if name in self._running]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def stop(self):
+        await self.cancel(list(self._running))
+
+    def stats(self):
+        return {name: {'schedule': state[0], 'next_run': state[1], 'last_status': state[5], 'runs': state[6],
+                       'skipped': state[7]}
+                for name, state in self.repository.get_schedule_states().items() if name in self._pairs}
@@ -0,0 +1,166 @@
+import logging
+import time
+
+import numpy as np
+
+# Колонки порции из Repository.iter_message_chunks
+SOURCE_ID, TARGET_ID, SYNCED, TOPIC_ID = range(4)
+
+
+class SyncStats:
+    """Статистика синхронизации цели по локальной базе, без подключения к Telegram.
+
+    Таблица messages читается порциями по chunk_size строк в массивы NumPy, все подсчеты по порции векторные,
+    а между порциями переносится только хвост (последний синхронизированный id и незакрытый альбом),
+    поэтому память ограничена размером порции даже на десятках миллионов строк.
+
+    Пропуск - непрерывный диапазон source id между двумя синхронизированными сообщениями. В него попадают и
+    записи с synced = 0, и id, которых в базе нет (в источнике там могут быть удаленные и служебные сообщения).
+    Альбом - подряд идущие по source id сообщения с одним target_msg_id.
+
+    Требует numpy (pip install numpy); модуль импортируется только режимом stats.
+    """
+
+    def __init__(self, repository, source_chat_id, target_chat_id, chunk_size=1_000_000, top=20):
+        self.logger = logging.getLogger(__name__)
+        self.repository = repository
+        self.source_chat_id = source_chat_id
+        self.target_chat_id = target_chat_id
+        self.chunk_size = chunk_size
+        self.top = top
+
+    def _reset(self):
+        self.rows = 0
+        self.synced = 0
+        self.mapped = 0  # синхронизированные с известным target_msg_id
+        self.first_id = None
+        self.last_id = None
+        self.gap_count = 0
+        self.gap_ids = 0
+        self.gaps = np.empty((0, 2), dtype=np.int64)  # самые длинные пропуски: start, end
+        self._last_synced = None
+        self.fan_in = np.zeros(2, dtype=np.int64)  # число альбомов по числу сообщений в них
+        self._album = None  # [target_msg_id, сообщений] альбома, который может продолжиться в следующей порции
+        topics = sorted(self.repository.get_all_topics(self.source_chat_id, self.target_chat_id))
+        self.topic_ids = np.array([topic[0] for topic in topics], dtype=np.int64)
+        self.topic_titles = [topic[2] for topic in topics]
+        self.topic_rows = np.zeros(len(topics) + 2, dtype=np.int64)  # + без темы, + прочие (id ответа)
+        self.topic_synced = np.zeros(len(topics) + 2, dtype=np.int64)
+
+    def collect(self):
+        self._reset()
+        started = time.monotonic()
+        for count, text in self.repository.iter_message_chunks(self.source_chat_id, self.target_chat_id,
+                                                              self.chunk_size):
+            chunk = np.fromstring(text, dtype=np.int64, sep=',').reshape(count, 4)
+            # group_concat не обязан сохранять порядок подзапроса; на уже отсортированной порции это почти бесплатно
+            chunk = chunk[np.argsort(chunk[:, SOURCE_ID], kind='stable')]
+            self._feed(chunk)
+            self.logger.debug(f"Stats of source {self.source_chat_id} to target {self.target_chat_id}: "
+                              f"{self.rows} rows read")
+        self._flush_album()
+        self.gaps = self.gaps[np.lexsort((self.gaps[:, 0], self.gaps[:, 0] - self.gaps[:, 1]))]
+        self.elapsed = time.monotonic() - started
+        self.logger.info(f"Collected stats of source {self.source_chat_id} to target {self.target_chat_id}: "
+                         f"{self.rows} rows in {self.elapsed:.2f}s")
+        return self
+
+    def _feed(self, chunk):
+        ids = chunk[:, SOURCE_ID]
+        synced = chunk[:, SYNCED] == 1
+        self.rows += len(chunk)
+        self.synced += int(np.count_nonzero(synced))
+        if self.first_id is None:
+            self.first_id = int(ids[0])
+        self.last_id = int(ids[-1])
+        self._feed_gaps(ids[synced])
+        mapped = synced & (chunk[:, TARGET_ID] > 0)
+        self.mapped += int(np.count_nonzero(mapped))
+        self._feed_fan_in(chunk[mapped, TARGET_ID])
+        self._feed_topics(chunk[:, TOPIC_ID], synced)
+
+    def _feed_gaps(self, synced_ids):
+        if self._last_synced is not None:
+            synced_ids = np.concatenate(([self._last_synced], synced_ids))
+        if len(synced_ids) == 0:
+            return
+        self._last_synced = int(synced_ids[-1])
+        breaks = np.flatnonzero(np.diff(synced_ids) > 1)
+        if len(breaks) == 0:
+            return
+        gaps = np.column_stack((synced_ids[breaks] + 1, synced_ids[breaks + 1] - 1))
+        self.gap_count += len(gaps)
+        self.gap_ids += int((gaps[:, 1] - gaps[:, 0] + 1).sum())
+        gaps = np.concatenate((self.gaps, gaps))
+        if len(gaps) > self.top:
+            gaps = gaps[np.argpartition(gaps[:, 0] - gaps[:, 1], self.top - 1)[:self.top]]
+        self.gaps = gaps
+
+    def _feed_fan_in(self, targets):
+        if len(targets) == 0:
+            return
+        starts = np.concatenate(([0], np.flatnonzero(targets[1:] != targets[:-1]) + 1))
+        sizes = np.diff(np.append(starts, len(targets)))
+        if self._album is not None:
+            if targets[0] == self._album[0]:
+                sizes[0] += self._album[1]
+            else:
+                self._count_albums([self._album[1]])
+        # Последний альбом порции досчитывается со следующей порцией
+        self._album = [int(targets[-1]), int(sizes[-1])]
+        self._count_albums(sizes[:-1])
+
+    def _flush_album(self):
+        if self._album is not None:
+            self._count_albums([self._album[1]])
+            self._album = None
+
+    def _count_albums(self, sizes):
+        if len(sizes) == 0:
+            return
+        counts = np.bincount(sizes)
+        if len(counts) > len(self.fan_in):
+            self.fan_in = np.pad(self.fan_in, (0, len(counts) - len(self.fan_in)))
+        self.fan_in[:len(counts)] += counts
+
+    def _feed_topics(self, topics, synced):
+        known = len(self.topic_ids)
+        index = np.searchsorted(self.topic_ids, topics)
+        found = index < known
+        found[found] = self.topic_ids[index[found]] == topics[found]
+        index[~found] = known + 1
+        index[topics == 0] = known
+        self.topic_rows += np.bincount(index, minlength=known + 2)
+        self.topic_synced += np.bincount(index[synced], minlength=known + 2)
+
+    def report(self):
+        target = self.target_chat_id
+        lines = [f"Stats of source {self.source_chat_id} to target {target} ({self.rows} rows in {self.elapsed:.2f}s):"]
+        if not self.rows:
+            lines.append("  no messages recorded")
+            return '\n'.join(lines)
+        span = self.last_id - self.first_id + 1
+        lines.append(f"  source ids {self.first_id}..{self.last_id}: {self.rows} recorded ({self.rows / span:.1%} of the range), "
+                     f"{self.synced} synced ({self.synced / self.rows:.1%}), {self.rows - self.synced} unsynced, "
+                     f"{self.synced - self.mapped} synced without target id")
+        lines.append(f"  gaps between synced messages: {self.gap_count} ranges, {self.gap_ids} ids")
+        for start, end in self.gaps:
+            lines.append(f"    {start}..{end} ({end - start + 1} ids)")
+
+        albums = self.fan_in[2:]
+        album_messages = int((albums * np.arange(2, len(self.fan_in))).sum())
+        lines.append(f"  target messages: {int(self.fan_in.sum())}, albums: {int(albums.sum())} "
+                     f"holding {album_messages} source messages")
+        for size in np.flatnonzero(self.fan_in):
+            lines.append(f"    {size} -> 1: {self.fan_in[size]}")
+
+        known = len(self.topic_ids)
+        lines.append(f"  topics: {known} known")
+        order = np.argsort(-self.topic_rows[:known], kind='stable')[:self.top]
+        for i in order:
+            if self.topic_rows[i]:
+                lines.append(f"    {self.topic_ids[i]} '{self.topic_titles[i]}': {self.topic_rows[i]} messages, "
+                             f"{self.topic_synced[i]} synced")
+        lines.append(f"    no topic: {self.topic_rows[known]} messages, {self.topic_synced[known]} synced")
+        lines.append(f"    other (reply ids): {self.topic_rows[known + 1]} messages, {self.topic_synced[known + 1]} synced")
+        return '\n'.join(lines)
@@ -1,13 +1,16 @@
 from datetime import datetime
-from telethon import events
-from telethon.tl.functions.channels import GetForumTopicsRequest, CreateForumTopicRequest, EditForumTopicRequest, \
-    GetParticipantRequest
+import time
+from telethon.tl.functions.channels import GetForumTopicsRequest, GetParticipantRequest
 from telethon.errors import RPCError
 import logging
-import asyncio
+
+from .topic_provisioner import TopicProvisioner
+from .archive_processor import ARCHIVE_TARGET_ID
+from .sync_planner import media_size
+from .takeout_session import TakeoutSession
 
 class Synchronizer:
-    def __init__(self, client, source_chat_id, target_chat_id, repository, temp_dir, processor):
+    def __init__(self, client, source_chat_id, target_chat_id, repository, temp_dir, processor, takeout=False):
         self.logger = logging.getLogger(__name__)
         self.logger.info(f"Initializing Synchronizer for source {source_chat_id} to target {target_chat_id}")
         self.client = client
@@ -16,6 +19,9 @@ class Synchronizer:
         self.repository = repository
         self.temp_dir = temp_dir
         self.processor = processor
+        self.provisioner = TopicProvisioner(client, target_chat_id)
+        # Выгрузка истории через takeout-сессию с более мягкими лимитами (opt-in)
+        self.takeout = takeout
 
     async def _is_forum(self, chat_id):
         try:
@@ -36,75 +42,113 @@ class Synchronizer:
             self.logger.error(f"Bot permission check failed: {str(e)}")
             raise
 
+    async def _fetch_forum_topics(self, chat_id):
+        topics = []
+        offset_date, offset_id, offset_topic = None, 0, 0
+        while True:
+            result = await self.client.client(GetForumTopicsRequest(channel=chat_id, offset_date=offset_date, offset_id=offset_id, offset_topic=offset_topic, limit=100))
+            if not result or not result.topics:
+                break
+            # ForumTopicDeleted не содержит title
+            topics.extend(t for t in result.topics if hasattr(t, 'title'))
+            if len(result.topics) < 100:
+                break
+            last = result.topics[-1]
+            message_dates = {m.id: m.date for m in result.messages}
+            offset_topic = last.id
+            offset_id = getattr(last, 'top_message', 0)
+            offset_date = message_dates.get(offset_id)
+        return topics
+
     async def _get_source_topics(self):
         if not await self._is_forum(self.source_chat_id):
             return {}
-        topics = await self.client.client(GetForumTopicsRequest(channel=self.source_chat_id, offset_date=None, offset_id=0, offset_topic=0, limit=100))
-        return {t.id: t.title for t in topics.topics} if topics else {}
+        topics = await self._fetch_forum_topics(self.source_chat_id)
+        return {t.id: t.title for t in topics}
 
     async def _get_target_topics(self):
         if not await self._is_forum(self.target_chat_id):
             return {}, {}
-        topics = await self.client.client(GetForumTopicsRequest(channel=self.target_chat_id, offset_date=None, offset_id=0, offset_topic=0, limit=100))
-        target_dict = {t.id: t.title for t in topics.topics} if topics else {}
-        target_title_to_id = {t.title: t.id for t in topics.topics} if topics else {}
-        return target_dict, target_title_to_id
+        topics = await self._fetch_forum_topics(self.target_chat_id)
+        target_dict = {t.id: t.title for t in topics}
+        target_title_to_ids = {}
+        for t in topics:
+            target_title_to_ids.setdefault(t.title, []).append(t.id)
+        return target_dict, target_title_to_ids
 
     def _get_db_topics(self):
         records = self.repository.get_all_topics(self.source_chat_id, self.target_chat_id)
         db_dict = {row[0]: (row[1], row[2]) for row in records}
         return db_dict, records
 
-    async def _create_or_update_topic(self, source_id, source_title, target_id=None):
-        if not await self._is_forum(self.target_chat_id):
-            return source_id
-        if target_id:
-            try:
-                await self.client.bot(EditForumTopicRequest(channel=self.target_chat_id, topic_id=target_id, title=source_title))
-                return target_id
-            except RPCError as e:
-                if "TOPIC_NOT_MODIFIED" not in str(e):
-                    self.logger.warning(f"Topic {target_id} not found or invalid: {str(e)}, recreating")
-
-        await self.client.bot(CreateForumTopicRequest(channel=self.target_chat_id, title=source_title))
-        await asyncio.sleep(1)
-        target_topics = await self.client.client(GetForumTopicsRequest(channel=self.target_chat_id, offset_date=None, offset_id=0, offset_topic=0, limit=100))
-        for target_topic in target_topics.topics:
-            if target_topic.title == source_title:
-                self.repository.update_topic(source_id, self.source_chat_id, self.target_chat_id, target_topic.id)
-                return target_topic.id
-        return source_id
+    def _begin_run(self):
+        """Замер пропускной способности для ETA в режиме plan; учитываются только сообщения, синхронизированные этим запуском."""
+        target_chat_id = self.target_chat_id if self.target_chat_id is not None else ARCHIVE_TARGET_ID
+        self._run = {
+            'target_chat_id': target_chat_id,
+            'started_at': time.time(),
+            'synced': self.repository.get_synced_ids(self.source_chat_id, target_chat_id),
+            'sizes': {},  # source_msg_id -> размер медиа еще не синхронизированных сообщений
+        }
+
+    def _track(self, message):
+        if message.id not in self._run['synced']:
+            self._run['sizes'][message.id] = media_size(message)
+
+    def _end_run(self, mode):
+        # Упавшие и отложенные в очередь повторов сообщения (RetryQueue.guard) не считаем: по базе берем
+        # только те, что к концу запуска действительно получили synced = 1
+        run = self._run
+        synced = self.repository.get_synced_ids(self.source_chat_id, run['target_chat_id'])
+        done = [size for msg_id, size in run['sizes'].items() if msg_id in synced]
+        self.repository.add_sync_run(self.source_chat_id, run['target_chat_id'], mode, run['started_at'], time.time(),
+                                     len(done), sum(done))
 
     async def sync_history(self, start_date=None):
-        async for message in self.client.client.iter_messages(self.source_chat_id, offset_date=start_date, reverse=True):
-            await self.processor.process_message(message)
-        self.logger.info("Full history sync completed")
+        async with TakeoutSession(self.client.accounts, self.takeout):
+            self._begin_run()
+            async for message in self.client.accounts.iter_messages(self.source_chat_id, offset_date=start_date, reverse=True):
+                await self.processor.process_message(message)
+                self._track(message)
+            await self.processor.join()
+            self._end_run('sync')
+            self.logger.info("Full history sync completed")
 
     async def sync_threads(self, start_date=None):
-        if not await self._is_forum(self.source_chat_id):
-            self.logger.info("Source is not a forum, falling back to full sync")
-            await self.sync_history(start_date)
-            return
-        async for message in self.client.client.iter_messages(self.source_chat_id, offset_date=start_date, reverse=True):
-            topic_id = 0
-            if hasattr(message, 'reply_to') and message.reply_to and message.reply_to.forum_topic:
-                topic_id = message.reply_to.reply_to_top_id if message.reply_to.reply_to_top_id else message.reply_to.reply_to_msg_id
-            if topic_id != 0:
-                await self.processor.process_message(message)
-        self.logger.info("Threads-only sync completed")
+        async with TakeoutSession(self.client.accounts, self.takeout):
+            if not await self._is_forum(self.source_chat_id):
+                self.logger.info("Source is not a forum, falling back to full sync")
+                await self.sync_history(start_date)
+                return
+            self._begin_run()
+            async for message in self.client.accounts.iter_messages(self.source_chat_id, offset_date=start_date, reverse=True):
+                topic_id = 0
+                if hasattr(message, 'reply_to') and message.reply_to and message.reply_to.forum_topic:
+                    topic_id = message.reply_to.reply_to_top_id if message.reply_to.reply_to_top_id else message.reply_to.reply_to_msg_id
+                if topic_id != 0:
+                    await self.processor.process_message(message)
+                    self._track(message)
+            await self.processor.join()
+            self._end_run('sync-threads')
+            self.logger.info("Threads-only sync completed")
 
     async def sync_thread(self, topic_id, start_date=None):
-        if not await self._is_forum(self.source_chat_id):
-            self.logger.info("Source is not a forum, falling back to full sync")
-            await self.sync_history(start_date)
-            return
-        async for message in self.client.client.iter_messages(self.source_chat_id, offset_date=start_date, reverse=True, reply_to=topic_id):
-            source_topic_id = 0
-            if hasattr(message, 'reply_to') and message.reply_to and message.reply_to.forum_topic:
-                source_topic_id = message.reply_to.reply_to_top_id if message.reply_to.reply_to_top_id else message.reply_to.reply_to_msg_id
-            if source_topic_id == topic_id:
-                await self.processor.process_message(message)
-        self.logger.info(f"Thread {topic_id} sync completed")
+        async with TakeoutSession(self.client.accounts, self.takeout):
+            if not await self._is_forum(self.source_chat_id):
+                self.logger.info("Source is not a forum, falling back to full sync")
+                await self.sync_history(start_date)
+                return
+            self._begin_run()
+            async for message in self.client.accounts.iter_messages(self.source_chat_id, offset_date=start_date, reverse=True, reply_to=topic_id):
+                source_topic_id = 0
+                if hasattr(message, 'reply_to') and message.reply_to and message.reply_to.forum_topic:
+                    source_topic_id = message.reply_to.reply_to_top_id if message.reply_to.reply_to_top_id else message.reply_to.reply_to_msg_id
+                if source_topic_id == topic_id:
+                    await self.processor.process_message(message)
+                    self._track(message)
+            await self.processor.join()
+            self._end_run('sync-thread')
+            self.logger.info(f"Thread {topic_id} sync completed")
 
     async def sync_topics(self):
         if not await self._is_forum(self.source_chat_id) or not await self._is_forum(self.target_chat_id):
@@ -114,30 +158,28 @@ class Synchronizer:
         source_topic_dict = await self._get_source_topics()
         if not source_topic_dict:
             return
-        target_topic_dict, target_title_to_id = await self._get_target_topics()
+        target_topic_dict, target_title_to_ids = await self._get_target_topics()
         db_topic_dict, db_records = self._get_db_topics()
 
+        # Топики цели, уже привязанные к другим топикам источника, не сопоставляем по названию повторно
+        claimed_target_ids = {row[1] for row in db_records if row[1] in target_topic_dict}
+        mappings = []
+        jobs = []
         for source_id, source_title in source_topic_dict.items():
             db_record = db_topic_dict.get(source_id)
             target_id = db_record[0] if db_record else None
-            if db_record and target_id in target_topic_dict and source_title == target_topic_dict[target_id]:
+            if target_id in target_topic_dict:
+                if source_title == target_topic_dict[target_id]:
+                    continue
+                jobs.append((source_id, source_title, target_id))
                 continue
-            elif db_record:
-                existing_target_id = target_title_to_id.get(source_title)
-                if existing_target_id:
-                    self.repository.update_topic(source_id, self.source_chat_id, self.target_chat_id, existing_target_id)
-                else:
-                    await self._create_or_update_topic(source_id, source_title)
+            candidates = [i for i in target_title_to_ids.get(source_title, []) if i not in claimed_target_ids]
+            if candidates:
+                claimed_target_ids.add(candidates[0])
+                mappings.append((source_id, source_title, candidates[0]))
             else:
-                existing_target_id = target_title_to_id.get(source_title)
-                if existing_target_id:
-                    self.repository.add_topic(source_id, self.source_chat_id, self.target_chat_id, source_title)
-                    self.repository.update_topic(source_id, self.source_chat_id, self.target_chat_id, existing_target_id)
-                else:
-                    await self._create_or_update_topic(source_id, source_title)
-
-    async def listen_new_messages(self):
-        @self.client.client.on(events.NewMessage(chats=self.source_chat_id))
-        async def handler(event):
-            await self.processor.process_message(event.message)
-        await self.client.client.run_until_disconnected()
\ No newline at end of file
+                jobs.append((source_id, source_title, None))
+
+        mappings.extend(await self.provisioner.provision(jobs))
+        self.repository.save_topics(self.source_chat_id, self.target_chat_id, mappings)
+        self.logger.info(f"Topic sync completed: {len(mappings)} topics mapped, {len(jobs)} created or renamed")
\ No newline at end of file
@@ -0,0 +1,65 @@
+import logging
+
+from telethon.errors import RPCError, TakeoutInitDelayError
+
+
+class TakeoutSession:
+    """Открывает takeout-сессии на аккаунтах пула на время выгрузки истории.
+
+    Takeout получает более мягкие лимиты на чтение истории и скачивание файлов. Аккаунты, которым Telegram
+    не выдал takeout (TakeoutInitDelayError - нужно подтверждение в приложении), продолжают работать обычным клиентом.
+    При выходе сессия завершается с success=True только если выгрузка прошла без исключения.
+    """
+
+    def __init__(self, accounts, enabled=True, max_file_size=4000 * 1024 * 1024):
+        self.logger = logging.getLogger(__name__)
+        self.accounts = accounts
+        self.enabled = enabled
+        self.max_file_size = max_file_size
+        self._opened = []  # [(PooledAccount, context manager)]
+
+    async def __aenter__(self):
+        if not self.enabled:
+            return self
+        for account in self.accounts.accounts:
+            if account.reader is not account.client:
+                # Вложенная выгрузка (например, sync_threads откатился на sync_history) использует уже открытую сессию
+                continue
+            context = account.client.takeout(
+                finalize=True,
+                users=True,
+                chats=True,
+                megagroups=True,
+                channels=True,
+                files=True,
+                max_file_size=self.max_file_size
+            )
+            try:
+                takeout = await context.__aenter__()
+            except TakeoutInitDelayError as e:
+                self.logger.warning(f"Takeout is not granted for account #{account.index} yet (retry in {e.seconds}s, "
+                                    f"confirm it in the Telegram app), using the regular client")
+                continue
+            except RPCError as e:
+                self.logger.warning(f"Failed to open takeout session for account #{account.index}: {str(e)}, "
+                                    f"using the regular client")
+                continue
+            account.reader = takeout
+            self._opened.append((account, context))
+            self.logger.info(f"Opened takeout session for account #{account.index}")
+        return self
+
+    @property
+    def active(self):
+        return bool(self._opened)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        while self._opened:
+            account, context = self._opened.pop()
+            account.reader = account.client
+            try:
+                await context.__aexit__(exc_type, exc, tb)
+                self.logger.info(f"Closed takeout session for account #{account.index} (success: {exc_type is None})")
+            except RPCError as e:
+                self.logger.warning(f"Failed to finish takeout session for account #{account.index}: {str(e)}")
+        return False
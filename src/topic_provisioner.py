@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+from telethon.errors import RPCError, FloodWaitError
+from telethon.tl.functions.channels import CreateForumTopicRequest, EditForumTopicRequest
+from telethon.tl.types import MessageActionTopicCreate, UpdateMessageID
+
+# Ошибки переименования, после которых топик в цели считается удаленным и создается заново
+RECREATE_ERRORS = ('TOPIC_ID_INVALID', 'TOPIC_DELETED')
+
+
+class TopicProvisioner:
+    """Создает и переименовывает топики в целевом форуме пачкой, без пересканирования списка топиков."""
+
+    def __init__(self, client, target_chat_id, concurrency=4, max_flood_retries=3):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.target_chat_id = target_chat_id
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_flood_retries = max_flood_retries
+
+    async def provision(self, jobs):
+        """jobs: список (source_id, title, target_id or None). Возвращает список (source_id, title, target_id)."""
+        if not jobs:
+            return []
+        self.logger.info(f"Provisioning {len(jobs)} topics in target {self.target_chat_id}")
+        results = await asyncio.gather(*(self._provision_one(*job) for job in jobs))
+        provisioned = [row for row in results if row is not None]
+        self.logger.info(f"Provisioned {len(provisioned)} of {len(jobs)} topics in target {self.target_chat_id}")
+        return provisioned
+
+    async def _provision_one(self, source_id, title, target_id=None):
+        async with self.semaphore:
+            if target_id:
+                try:
+                    await self._invoke(EditForumTopicRequest(channel=self.target_chat_id, topic_id=target_id, title=title))
+                    self.logger.info(f"Renamed topic {target_id} to '{title}' for source topic {source_id}")
+                    return source_id, title, target_id
+                except FloodWaitError as e:
+                    # Топик существует, просто не удалось его переименовать: пересоздание дало бы дубль
+                    self.logger.error(f"Failed to rename topic {target_id} to '{title}' after flood waits: {str(e)}")
+                    return None
+                except RPCError as e:
+                    if "TOPIC_NOT_MODIFIED" in str(e):
+                        return source_id, title, target_id
+                    if not any(reason in str(e) for reason in RECREATE_ERRORS):
+                        self.logger.error(f"Failed to rename topic {target_id} to '{title}': {str(e)}")
+                        return None
+                    self.logger.warning(f"Topic {target_id} not found or invalid: {str(e)}, recreating")
+
+            try:
+                updates = await self._invoke(CreateForumTopicRequest(channel=self.target_chat_id, title=title))
+            except RPCError as e:
+                self.logger.error(f"Failed to create topic '{title}' for source topic {source_id}: {str(e)}")
+                return None
+
+            created_id = self._extract_topic_id(updates)
+            if not created_id:
+                self.logger.error(f"Could not find created topic id for '{title}' in creation response")
+                return None
+            self.logger.info(f"Created topic {created_id} '{title}' for source topic {source_id}")
+            return source_id, title, created_id
+
+    async def _invoke(self, request):
+        attempt = 0
+        while True:
+            try:
+                return await self.client.bot(request)
+            except FloodWaitError as e:
+                attempt += 1
+                if attempt > self.max_flood_retries:
+                    raise
+                self.logger.warning(f"Flood wait {e.seconds}s on {request.__class__.__name__}, attempt {attempt}")
+                await asyncio.sleep(e.seconds)
+
+    @staticmethod
+    def _extract_topic_id(updates):
+        # Id топика равен id служебного сообщения MessageActionTopicCreate
+        fallback_id = None
+        for update in getattr(updates, 'updates', None) or []:
+            message = getattr(update, 'message', None)
+            if message is not None and isinstance(getattr(message, 'action', None), MessageActionTopicCreate):
+                return message.id
+            if isinstance(update, UpdateMessageID):
+                fallback_id = update.id
+        return fallback_id
@@ -0,0 +1,135 @@
+import itertools
+import logging
+import os
+import tempfile
+from collections import Counter
+
+from .database import Database
+from .repository import Repository
+from .message_processor import MessageProcessor
+from .synchronizer import Synchronizer
+from .fake_telegram import FakeTelegram, FakeClientInterface, build_message
+from .tracing import TraceWriter, read_trace, summarize, wrap_clients
+
+# Фейковые операции -> записи трассы, из которых берутся их задержки
+REPLAY_OPS = {
+    'iter_messages.page': 'iter_messages.page',
+    'get_messages': 'get_messages',
+    'rpc': 'rpc',
+    'send_file': 'send_file',
+    'send_message': 'send_message',
+}
+
+
+class TraceLatency:
+    """Задержки по записанной трассе: длительности операций берутся по кругу, передача файлов - по записанной скорости."""
+
+    def __init__(self, records, speed=1.0):
+        self.speed = speed
+        down_bytes = sum(r.get('size', 0) for r in records if r['op'] == 'iter_download')
+        down_time = sum(r['dur'] for r in records if r['op'] == 'iter_download')
+        up_records = [r for r in records if r['op'] in ('upload_file', 'upload_file.part') or
+                      (r['op'] == 'send_file' and r.get('size'))]
+        up_bytes = sum(r.get('size', 0) for r in up_records)
+        up_time = sum(r['dur'] for r in up_records)
+        self.download_bps = down_bytes / down_time if down_time else 0
+        self.upload_bps = up_bytes / up_time if up_time else 0
+        samples = {}
+        for r in records:
+            if r['op'] in ('send_file', 'send_message') and r.get('size') and self.upload_bps:
+                # Из отправки файла по пути вычитаем заливку: ее фейковый бот моделирует отдельно
+                samples.setdefault(r['op'], []).append(max(0.0, r['dur'] - r['size'] / self.upload_bps))
+            elif r['op'] in REPLAY_OPS.values():
+                samples.setdefault(r['op'], []).append(r['dur'])
+        self._samples = {op: itertools.cycle(durations) for op, durations in samples.items()}
+
+    def delay(self, op, size=0):
+        if op == 'iter_download.chunk':
+            seconds = size / self.download_bps if self.download_bps else 0
+        elif op == 'upload_file.part':
+            seconds = size / self.upload_bps if self.upload_bps else 0
+        else:
+            samples = self._samples.get(REPLAY_OPS.get(op))
+            seconds = next(samples) if samples else 0
+        return seconds / self.speed
+
+
+class TraceReplayer:
+    """Прогоняет записанную выгрузку истории через настоящие Synchronizer, MessageProcessor и хендлеры без сети.
+
+    История источника восстанавливается из форм сообщений трассы, задержки Telegram - из записанных длительностей
+    (speed > 1 ускоряет воспроизведение). Файлы урезаются до max_media_size, но время их передачи считается
+    по исходному размеру. Результат - сводки записи и воспроизведения для сравнения.
+    """
+
+    def __init__(self, trace_path, handlers, speed=1.0, max_media_size=16 * 1024 * 1024, caption_limit=1024):
+        self.logger = logging.getLogger(__name__)
+        self.trace_path = trace_path
+        self.handlers = handlers
+        self.speed = speed
+        self.max_media_size = max_media_size
+        self.caption_limit = caption_limit
+
+    @staticmethod
+    def _most_common_chat(records, ops):
+        chats = Counter(r['chat'] for r in records if r['op'] in ops and r.get('chat') is not None)
+        return chats.most_common(1)[0][0] if chats else None
+
+    async def run(self):
+        header, records = read_trace(self.trace_path)
+        source_chat_id = self._most_common_chat(records, {'iter_messages.page'})
+        if source_chat_id is None:
+            raise ValueError(f"Trace {self.trace_path} has no history pages to replay")
+        target_chat_id = self._most_common_chat(records, {'send_file', 'send_message'}) or -1000000000001
+
+        world = FakeTelegram(TraceLatency(records, self.speed))
+        shapes = {}
+        for r in records:
+            if r['op'] == 'iter_messages.page' and r.get('chat') == source_chat_id:
+                for shape in r['msgs']:
+                    shapes[shape['id']] = shape
+        messages = []
+        for media_id, shape in enumerate(sorted(shapes.values(), key=lambda s: s['id']), 1):
+            message = build_message(dict(shape, media_id=media_id), source_chat_id, max_media_size=self.max_media_size)
+            world.file_sizes[media_id] = shape.get('size') or 0
+            messages.append(message)
+        world.add_history(source_chat_id, messages)
+        self.logger.info(f"Replaying {len(messages)} messages of source {source_chat_id} to target {target_chat_id} "
+                         f"at {self.speed}x speed")
+
+        writer = TraceWriter()
+        client = wrap_clients(FakeClientInterface(world), writer)
+        with tempfile.TemporaryDirectory(prefix='replay_') as temp_dir:
+            db_path = os.path.join(temp_dir, 'replay.db')
+            Database(db_path)
+            repository = Repository(db_path)
+            processor = MessageProcessor(client, source_chat_id, target_chat_id, repository, temp_dir, self.handlers,
+                                         self.caption_limit)
+            synchronizer = Synchronizer(client, source_chat_id, target_chat_id, repository, temp_dir, processor)
+            await synchronizer.sync_history(None)
+            processor.close()
+        return summarize(records), summarize(writer.records)
+
+    @staticmethod
+    def report(recorded, replayed):
+        def rate(summary, key):
+            return summary[key] / summary['duration'] if summary['duration'] else 0.0
+
+        rows = [
+            ('duration, s', f"{recorded['duration']:.1f}", f"{replayed['duration']:.1f}"),
+            ('messages', recorded['messages'], replayed['messages']),
+            ('messages/s', f"{rate(recorded, 'messages'):.2f}", f"{rate(replayed, 'messages'):.2f}"),
+            ('sends', recorded['sent'], replayed['sent']),
+            ('download MB/s', f"{rate(recorded, 'bytes_down') / 1024 / 1024:.2f}", f"{rate(replayed, 'bytes_down') / 1024 / 1024:.2f}"),
+            ('upload MB/s', f"{rate(recorded, 'bytes_up') / 1024 / 1024:.2f}", f"{rate(replayed, 'bytes_up') / 1024 / 1024:.2f}"),
+        ]
+        for op in sorted(set(recorded['ops']) | set(replayed['ops'])):
+            empty = {'count': 0, 'p50': 0.0, 'p95': 0.0}
+            a, b = recorded['ops'].get(op, empty), replayed['ops'].get(op, empty)
+            rows.append((f"{op} count", a['count'], b['count']))
+            rows.append((f"{op} p50/p95, ms", f"{a['p50'] * 1000:.0f}/{a['p95'] * 1000:.0f}",
+                         f"{b['p50'] * 1000:.0f}/{b['p95'] * 1000:.0f}"))
+        width = max(len(str(row[0])) for row in rows)
+        lines = [f"{'':<{width}}  {'recorded':>14}  {'replayed':>14}"]
+        lines += [f"{name:<{width}}  {str(a):>14}  {str(b):>14}" for name, a, b in rows]
+        return '\n'.join(lines)
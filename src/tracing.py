@@ -0,0 +1,265 @@
+import gzip
+import json
+import logging
+import os
+import time
+
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+
+
+def message_shape(message):
+    """Обезличенная форма сообщения: id, даты, связи и размеры без текста, имен файлов и ссылок."""
+    shape = {'id': message.id, 'date': int(message.date.timestamp()) if message.date else 0}
+    if message.grouped_id:
+        shape['grouped_id'] = message.grouped_id
+    reply_to = getattr(message, 'reply_to', None)
+    if reply_to:
+        shape['reply'] = [getattr(reply_to, 'reply_to_msg_id', None), getattr(reply_to, 'reply_to_top_id', None),
+                          bool(getattr(reply_to, 'forum_topic', False))]
+    if message.message:
+        shape['len'] = len(message.message)
+    if message.entities:
+        shape['entities'] = [[type(e).__name__, e.offset, e.length] for e in message.entities]
+    media = message.media
+    if media is None:
+        return shape
+    if hasattr(media, 'photo'):
+        shape['kind'] = 'photo'
+        sizes = getattr(media.photo, 'sizes', None) or []
+        shape['size'] = max([getattr(s, 'size', 0) or max(getattr(s, 'sizes', None) or [0]) for s in sizes] or [0])
+    elif hasattr(media, 'webpage'):
+        shape['kind'] = 'webpage'
+    elif getattr(media, 'document', None) is not None:
+        document = media.document
+        shape.update({'kind': 'document', 'mime': document.mime_type, 'size': document.size})
+        attrs = {}
+        for attr in document.attributes:
+            name = type(attr).__name__
+            if name == 'DocumentAttributeFilename':
+                attrs['file_name'] = f"file{os.path.splitext(attr.file_name)[1]}"
+            elif name == 'DocumentAttributeVideo':
+                attrs['video'] = [attr.duration, attr.w, attr.h]
+                attrs['round'] = bool(attr.round_message)
+            elif name == 'DocumentAttributeAudio':
+                attrs['audio'] = attr.duration
+                attrs['voice'] = bool(attr.voice)
+        if attrs:
+            shape['attrs'] = attrs
+    else:
+        shape['kind'] = type(media).__name__
+    return shape
+
+
+def _payload_size(file):
+    if isinstance(file, str) and os.path.exists(file):
+        return os.path.getsize(file)
+    if isinstance(file, (list, tuple)):
+        return sum(_payload_size(f) for f in file)
+    return 0
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class TraceWriter:
+    """Пишет трассу в gzip JSONL: заголовок и по строке на RPC, страницу истории, скачивание или заливку.
+
+    Без path записи только накапливаются в памяти (используется при воспроизведении для замера).
+    """
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.records = []
+        self._started = time.monotonic()
+        self._file = gzip.open(path, 'wt', encoding='utf-8') if path else None
+        self._write({'trace': 1, 'started': time.time()})
+        if path:
+            self.logger.info(f"Recording client trace to {path}")
+
+    def _write(self, record):
+        if self._file:
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def record(self, client, op, started, **fields):
+        record = {'t': round(started - self._started, 4), 'c': client, 'op': op,
+                  'dur': round(time.monotonic() - started, 4)}
+        record.update({key: value for key, value in fields.items() if value is not None})
+        if self._file:
+            self._write(record)
+        else:
+            self.records.append(record)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self.logger.info(f"Client trace saved to {self.path}")
+
+
+def read_trace(path):
+    """Возвращает (заголовок, записи) трассы."""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        records = [json.loads(line) for line in f if line.strip()]
+    return header, records
+
+
+def summarize(records):
+    """Пропускная способность и задержки по записям трассы: то, что сравнивается между записью и воспроизведением."""
+    if not records:
+        return {'duration': 0.0, 'messages': 0, 'sent': 0, 'bytes_down': 0, 'bytes_up': 0, 'ops': {}}
+    start = min(r['t'] for r in records)
+    end = max(r['t'] + r['dur'] for r in records)
+    ops = {}
+    for r in records:
+        ops.setdefault(r['op'], []).append(r['dur'])
+    return {
+        'duration': end - start,
+        'messages': sum(r.get('n', 0) for r in records if r['op'] == 'iter_messages.page'),
+        'sent': sum(1 for r in records if r['op'] in ('send_file', 'send_message') and not r.get('err')),
+        'bytes_down': sum(r.get('size', 0) for r in records if r['op'] == 'iter_download'),
+        'bytes_up': sum(r.get('size', 0) for r in records
+                        if r['op'] in ('upload_file', 'upload_file.part', 'send_file', 'send_message')),
+        'ops': {
+            op: {'count': len(durations), 'total': sum(durations), 'p50': _percentile(durations, 0.5),
+                 'p95': _percentile(durations, 0.95)}
+            for op, durations in ops.items()
+        },
+    }
+
+
+class RecordingClient:
+    """Прокси над клиентом Telethon, записывающий в TraceWriter каждый вызов с длительностью и размерами.
+
+    Тексты и файлы в трассу не попадают: только имя операции, чат, объемы и формы сообщений (message_shape).
+    """
+
+    TRACED_CALLS = {'get_messages', 'send_file', 'send_message', 'upload_file', 'edit_message', 'delete_messages',
+                    'forward_messages', 'get_input_entity', 'get_entity', 'get_permissions', 'get_me', 'get_dialogs'}
+
+    def __init__(self, client, label, writer, page_size=100):
+        self._client = client
+        self._label = label
+        self._writer = writer
+        self._page_size = page_size
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == 'iter_messages':
+            return self._iter_messages
+        if name == 'iter_download':
+            return self._iter_download
+        if name == 'takeout':
+            return lambda **kwargs: _RecordingTakeout(attr(**kwargs), f"{self._label}:takeout", self._writer)
+        if name in self.TRACED_CALLS:
+            return self._traced(name, attr)
+        return attr
+
+    def _traced(self, name, method):
+        async def call(*args, **kwargs):
+            started = time.monotonic()
+            chat = args[0] if args and isinstance(args[0], int) else None
+            size = _payload_size(args[0] if name == 'upload_file' and args else kwargs.get('file'))
+            try:
+                result = await method(*args, **kwargs)
+            except Exception as e:
+                self._writer.record(self._label, name, started, chat=chat, size=size or None, err=type(e).__name__)
+                raise
+            n = len(result) if isinstance(result, list) else None
+            self._writer.record(self._label, name, started, chat=chat, size=size or None, n=n)
+            return result
+        return call
+
+    async def __call__(self, request, *args, **kwargs):
+        started = time.monotonic()
+        name = type(request).__name__
+        # Части возобновляемой заливки - это передача файла, а не обычный RPC: пишем их с размером отдельно
+        op, size = ('upload_file.part', len(request.bytes)) if isinstance(request, SaveBigFilePartRequest) else ('rpc', None)
+        try:
+            result = await self._client(request, *args, **kwargs)
+        except Exception as e:
+            self._writer.record(self._label, op, started, name=name, size=size, err=type(e).__name__)
+            raise
+        self._writer.record(self._label, op, started, name=name, size=size)
+        return result
+
+    async def _iter_messages(self, chat_id, *args, **kwargs):
+        # Telethon запрашивает историю страницами; длительность страницы - время ожидания ее сообщений
+        iterator = self._client.iter_messages(chat_id, *args, **kwargs).__aiter__()
+        shapes = []
+        waited = 0.0
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    message = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                waited += time.monotonic() - started
+                shapes.append(message_shape(message))
+                if len(shapes) >= self._page_size:
+                    self._write_page(chat_id, waited, shapes)
+                    shapes, waited = [], 0.0
+                yield message
+        finally:
+            if shapes:
+                self._write_page(chat_id, waited, shapes)
+
+    def _write_page(self, chat_id, waited, shapes):
+        self._writer.record(self._label, 'iter_messages.page', time.monotonic() - waited, chat=chat_id,
+                            n=len(shapes), msgs=shapes)
+
+    async def _iter_download(self, file, *args, **kwargs):
+        iterator = self._client.iter_download(file, *args, **kwargs).__aiter__()
+        waited = 0.0
+        size = 0
+        chunks = 0
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                waited += time.monotonic() - started
+                size += len(chunk)
+                chunks += 1
+                yield chunk
+        finally:
+            # Учитываем только время ожидания сети, без записи на диск и троттлинга потребителя
+            self._writer.record(self._label, 'iter_download', time.monotonic() - waited, size=size, n=chunks,
+                                offset=kwargs.get('offset') or None)
+
+
+class _RecordingTakeout:
+    """Takeout-клиент тоже пишется в трассу, иначе выгрузка через takeout выпадет из записи."""
+
+    def __init__(self, context, label, writer):
+        self._context = context
+        self._label = label
+        self._writer = writer
+
+    async def __aenter__(self):
+        return RecordingClient(await self._context.__aenter__(), self._label, self._writer)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self._context.__aexit__(exc_type, exc, tb)
+
+
+def wrap_clients(client, writer):
+    """Подменяет пользовательские клиенты и ботов TelegramClientInterface записывающими прокси."""
+    client.user_clients = [RecordingClient(c, f"user{i}", writer) for i, c in enumerate(client.user_clients)]
+    client.client = client.user_clients[0]
+    for account, wrapped in zip(client.accounts.accounts, client.user_clients):
+        account.client = wrapped
+        account.reader = wrapped
+    client.bot_clients = [RecordingClient(c, f"bot{i}", writer) for i, c in enumerate(client.bot_clients)]
+    client.bot = client.bot_clients[0]
+    for bot, wrapped in zip(client.bots.bots, client.bot_clients):
+        bot.client = wrapped
+    return client